@@ -1,55 +1,72 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 import os
 import sys
 from dotenv import load_dotenv
 import json
 from flask_cors import CORS 
-import tempfile
 from werkzeug.utils import secure_filename
+import time
+import datetime
+import io
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from civic_sense_complain import process_complaint
+from complaint_store import complaint_store
+from complaint_dedup import incident_index
+from department_classifier import department_classifier
+from image_relevance import relevance_engine
+from news_domains import news_classifier, filter_news_urls
+from html_extract import extraction_stats
+from job_queue import JobQueue, QueueFullError, FINISHED_STATES
 from civic_sense_message_community import (
     analyze_social_media_post,
     load_deepfake_model,
     analyze_local_images,
     extract_urls,
-    is_news_url,
-    analyze_news_url
+    analyze_news_urls,
+    verdict_cache,
+    image_score_cache
 )
 import torch
-import torch.nn as nn
 import torch.nn.functional as F
-import torchvision.models as models
-import torchvision.transforms as T
-from PIL import Image
-# Import LangChain components for search_and_summarize
-from langchain_groq import ChatGroq
-from langchain.chains import load_summarize_chain
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.utilities import GoogleSerperAPIWrapper
-from langchain_core.documents import Document
+from llm_client import cache_stats
+from disease_info_store import disease_store, search_and_summarize
+from batching import BatchingWorker, QueueFullError as InferenceQueueFullError
+from http_client import http_client
+from model_runtime import load_model, source_changed, MODEL_RELOAD_CHECK_SECONDS
+from prediction_cache import skin_prediction_cache, deepfake_prediction_cache
+from lazy_resource import LazyResource, WARMUP_ON_START, component_status, warm_up
+from uploads import SpooledUploadRequest, upload_bytes, upload_stream, UPLOAD_SPOOL_MAX_BYTES
+from diabetes_model import (
+    diabetes_model,
+    records_from_json,
+    records_from_csv,
+    records_from_arrow,
+    predict as predict_diabetes,
+    prediction_records,
+    predictions_csv
+)
+from image_preprocessing import prepare_image, prepare_images, normalize_batch
 
 # Load environment variables
 load_dotenv(".env")
 serper_api_key = os.getenv("SERPER_API_KEY")
 groq_api_key = os.getenv("GROQ_API_KEY")
 
-# Initialize LangChain components
-llm = ChatGroq(model="llama3-8b-8192", api_key=groq_api_key)
-text_splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
-summarize_chain = load_summarize_chain(llm, chain_type="map_reduce")
-search = GoogleSerperAPIWrapper(serper_api_key=serper_api_key)
-
 app = Flask(__name__)
+app.request_class = SpooledUploadRequest  # Uploads are decoded from memory, see uploads.py
 CORS(app)  # Enable CORS for all routes
 
 # Configure upload settings
-UPLOAD_FOLDER = tempfile.gettempdir()  # Use system temp directory
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}  # Added webp format
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max upload
 
-# Load deepfake model once when the server starts
-deepfake_model = load_deepfake_model("deepfake_model.pt")
+# How long a /complaints/<id>/events stream stays open
+COMPLAINT_EVENTS_TIMEOUT = int(os.getenv("COMPLAINT_EVENTS_TIMEOUT", "300"))
+
+# Models load on first use (or during warm-up), not at import time, and reload when their checkpoint changes
+deepfake_model = LazyResource("deepfake_model", lambda: load_deepfake_model("deepfake_model.pt"),
+                              is_stale=source_changed, stale_check_seconds=MODEL_RELOAD_CHECK_SECONDS)
 
 # === Skin Disease Model Setup ===
 
@@ -66,43 +83,51 @@ skin_class_map = {
 skin_class_labels = list(skin_class_map.values())
 
 def load_skin_model(path='health0check-feature/skin-disease-model2.pth'):
-    try:
-        model = models.densenet121(pretrained=False)
-        model.classifier = nn.Linear(model.classifier.in_features, 7)
-        state_dict = torch.load(path, map_location='cpu')
-        model.load_state_dict(state_dict, strict=False)
-        model.eval()
-        return model
-    except Exception as e:
-        print(f"Error loading skin model: {e}")
-        return None
+    # Served from a TorchScript/ONNX export when one is available (see model_runtime.py)
+    return load_model("skin", path)
 
-def preprocess_skin_image(image_path):
-    transform = T.Compose([
-        T.Resize((224, 224)),
-        T.ToTensor(),
-        T.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]),
-    ])
-    image = Image.open(image_path).convert("RGB")
-    image_tensor = transform(image).unsqueeze(0)
-    return image_tensor
-
-def predict_skin(model, image_tensor):
+def predict_skin_batch(images):
+    """
+    Run one forward pass over a list of (3, 224, 224) uint8 images from prepare_image.
+    Returns (label, confidence, probabilities) per image, probabilities in skin_class_labels order.
+    """
     with torch.no_grad():
-        output = model(image_tensor)
+        output = skin_model.get()(normalize_batch(images, "skin"))
         probs = F.softmax(output, dim=1)
-        pred_idx = torch.argmax(probs, dim=1).item()
-        confidence = probs[0][pred_idx].item()
-        
-        print(f"output")
-    return skin_class_labels[pred_idx], confidence
+        confidences, pred_idxs = probs.max(dim=1)
+    return [(skin_class_labels[i], c, p)
+            for i, c, p in zip(pred_idxs.tolist(), confidences.tolist(), probs.tolist())]
+
+def top_k_classes(probabilities, k):
+    """The k most likely classes as [{"label", "probability"}], most likely first"""
+    ranked = sorted(range(len(probabilities)), key=probabilities.__getitem__, reverse=True)[:k]
+    return [{"label": skin_class_labels[i], "probability": probabilities[i]} for i in ranked]
+
+def load_skin_model_or_warn():
+    model = load_skin_model()
+    if model is None:
+        print("WARNING: Skin disease model could not be loaded.")
+        print("Please ensure the file exists at 'health0check-feature/skin-disease-model2.pth'")
+        print("Current working directory: " + os.getcwd())
+    return model
 
-skin_model = load_skin_model()
-print(f"Skin disease model loaded: {'Successfully' if skin_model is not None else 'Failed'}")
-if skin_model is None:
-    print("WARNING: Skin disease model could not be loaded.")
-    print("Please ensure the file exists at 'health0check-feature/skin-disease-model2.pth'")
-    print("Current working directory: " + os.getcwd())
+skin_model = LazyResource("skin_model", load_skin_model_or_warn,
+                          is_stale=source_changed, stale_check_seconds=MODEL_RELOAD_CHECK_SECONDS)
+
+# Concurrent requests are grouped into one batched forward pass
+skin_batcher = BatchingWorker(
+    "skin",
+    predict_skin_batch,
+    max_batch_size=int(os.getenv("SKIN_MAX_BATCH_SIZE", "16")),
+    max_wait_ms=float(os.getenv("SKIN_BATCH_WAIT_MS", "10")),
+    max_queue=int(os.getenv("SKIN_MAX_QUEUE", "256")),
+)
+
+# /predict_skin_disease_batch limits
+SKIN_BATCH_MAX_IMAGES = int(os.getenv("SKIN_BATCH_MAX_IMAGES", "64"))
+SKIN_BATCH_MAX_UPLOAD_BYTES = int(os.getenv("SKIN_BATCH_MAX_UPLOAD_BYTES", str(128 * 1024 * 1024)))
+SKIN_TOP_K = int(os.getenv("SKIN_TOP_K", "3"))
+ZIP_CONTENT_TYPES = {"application/zip", "application/x-zip-compressed"}
 
 def allowed_file(filename):
     """Check if the file has an allowed extension"""
@@ -111,20 +136,44 @@ def allowed_file(filename):
 
 @app.route('/health', methods=['GET'])
 def health_check():
-    """Simple health check endpoint"""
+    """Health check with the initialization state of each lazily loaded component"""
     return jsonify({
         "status": "ok",
-        "deepfake_model_loaded": deepfake_model is not None,
-        "skin_model_loaded": skin_model is not None,
+        "deepfake_model_loaded": deepfake_model.ready,
+        "skin_model_loaded": skin_model.ready,
+        "deepfake_model_backend": deepfake_model.get().variant if deepfake_model.ready else None,
+        "skin_model_backend": skin_model.get().variant if skin_model.ready else None,
+        "deepfake_model_version": deepfake_model.get().version if deepfake_model.ready else None,
+        "skin_model_version": skin_model.get().version if skin_model.ready else None,
+        "components": component_status(),
     })
 
-@app.route('/process_complaint', methods=['POST'])
-def process_complaint_api():
-    """Process a civic complaint"""
-    # Initialize variables to avoid UnboundLocalError
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Cache and runtime counters"""
+    return jsonify({
+        "llm_cache": cache_stats(),
+        "disease_info": disease_store.stats(),
+        "skin_batcher": skin_batcher.stats(),
+        "http": http_client.stats(),
+        "complaint_store": complaint_store.stats(),
+        "complaint_jobs": complaint_jobs.stats(),
+        "complaint_dedup": incident_index.stats(),
+        "department_classifier": department_classifier.stats(),
+        "image_relevance": relevance_engine.stats(),
+        "news_domains": news_classifier.stats(),
+        "html_extract": extraction_stats(),
+        "verdict_cache": verdict_cache.stats(),
+        "image_score_cache": image_score_cache.stats(),
+        "skin_prediction_cache": skin_prediction_cache.stats(),
+        "deepfake_prediction_cache": deepfake_prediction_cache.stats(),
+    })
+
+def read_complaint_request():
+    """Return (complaint, location, image FileStorage or None) from a JSON or multipart request"""
     complaint = None
     location = None
-    image_path = None
+    image_file = None
     
     print(f"Request received: {request.method}, Content-Type: {request.content_type}")
     print(f"Request form: {request.form}")
@@ -136,12 +185,7 @@ def process_complaint_api():
         if request.files and 'image' in request.files:
             file = request.files['image']
             if file and file.filename and allowed_file(file.filename):
-                filename = secure_filename(file.filename)
-                file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                file.save(file_path)
-                image_path = file_path
-                print(f"Image saved to temp location: {file_path}")
-                print(f"Image exists: {os.path.exists(file_path)}, Size: {os.path.getsize(file_path)} bytes")
+                image_file = file
         
         # Get form data when uploading files
         complaint = request.form.get('complaint')
@@ -155,43 +199,179 @@ def process_complaint_api():
             complaint = data.get('complaint')
             location = data.get('location')
             print(f"From JSON data - Complaint: {complaint is not None}, Location: {location is not None}")
+    return complaint, location, image_file
+
+def missing_complaint_fields_response(complaint, location):
+    print("Error: Missing complaint or location")
+    return jsonify({
+        "error": "Complaint and location are required", 
+        "received": {
+            "complaint": complaint is not None,
+            "location": location is not None,
+            "content_type": request.content_type
+        }
+    }), 400
+
+def invalid_complaint_fields_response(complaint, location):
+    """400 response when complaint or location is not text, else None"""
+    wrong = [name for name, value in (("complaint", complaint), ("location", location)) if not isinstance(value, str)]
+    if not wrong:
+        return None
+    return jsonify({"error": f"{' and '.join(wrong)} must be text"}), 400
+
+@app.route('/process_complaint', methods=['POST'])
+def process_complaint_api():
+    """Process a civic complaint"""
+    complaint, location, image_file = read_complaint_request()
     
     # Validate required fields
     if not complaint or not location:
-        print("Error: Missing complaint or location")
-        return jsonify({
-            "error": "Complaint and location are required", 
-            "received": {
-                "complaint": complaint is not None,
-                "location": location is not None,
-                "content_type": request.content_type
-            }
-        }), 400
+        return missing_complaint_fields_response(complaint, location)
+    invalid = invalid_complaint_fields_response(complaint, location)
+    if invalid is not None:
+        return invalid
     
-    # Check if image exists before processing
-    if image_path and os.path.exists(image_path):
-        print(f"Processing complaint with image: {image_path}")
+    image_bytes = upload_bytes(image_file) if image_file is not None else None
+    if image_bytes:
+        print(f"Processing complaint with image: {image_file.filename} ({len(image_bytes)} bytes)")
     else:
-        print(f"Image path invalid or not provided, processing without image")
-        image_path = None  # Reset to None if path doesn't exist
+        print(f"Image not provided, processing without image")
+        image_bytes = None
     
     # Process the complaint
-    complainer_view, officer_view = process_complaint(complaint, location, image_path)
-    
-    # Clean up temp file if one was created
-    if image_path and os.path.exists(image_path):
-        try:
-            os.remove(image_path)
-            print(f"Temporary image file removed: {image_path}")
-        except Exception as e:
-            # Log the error but don't fail the request
-            print(f"Warning: Failed to remove temp file: {e}")
+    complainer_view, officer_view = process_complaint(complaint, location, image_bytes=image_bytes)
     
     return jsonify({
         "complainer_view": complainer_view,
         "officer_view": officer_view
     })
 
+def run_complaint_job(job):
+    """Job queue handler: run the full complaint pipeline for one queued complaint"""
+    complainer_view, officer_view = process_complaint(
+        job["complaint"], job["location"], image_bytes=job["image"] or None, complaint_id=job["id"])
+    return {"complainer_view": complainer_view, "officer_view": officer_view}
+
+complaint_jobs = JobQueue(run_complaint_job)
+
+def job_status(job):
+    body = {
+        "id": job["id"],
+        "status": job["status"],
+        "created_at": job["created_at"],
+        "updated_at": job["updated_at"],
+    }
+    if job["position"] is not None:
+        body["queue_position"] = job["position"]
+    if job["result"]:
+        body.update(job["result"])
+    if job["error"]:
+        body["error"] = job["error"]
+    return body
+
+@app.route('/complaints', methods=['POST'])
+def submit_complaint_api():
+    """Queue a complaint for background processing and return its job id immediately"""
+    complaint, location, image_file = read_complaint_request()
+    if not complaint or not location:
+        return missing_complaint_fields_response(complaint, location)
+    invalid = invalid_complaint_fields_response(complaint, location)
+    if invalid is not None:
+        return invalid
+    
+    image = upload_bytes(image_file) if image_file is not None else None
+    image_name = secure_filename(image_file.filename) if image_file is not None else None
+    try:
+        job_id = complaint_jobs.submit(complaint, location, image, image_name)
+    except QueueFullError as e:
+        # Back-pressure: ask the client to retry later instead of growing the backlog
+        response = jsonify({"error": str(e)})
+        response.headers["Retry-After"] = "30"
+        return response, 503
+    print(f"Complaint queued as job {job_id}")
+    
+    response = jsonify({
+        "job_id": job_id,
+        "status": "queued",
+        "status_url": f"/complaints/{job_id}",
+        "events_url": f"/complaints/{job_id}/events",
+    })
+    response.headers["Location"] = f"/complaints/{job_id}"
+    return response, 202
+
+@app.route('/complaints/<complaint_id>', methods=['GET'])
+def get_complaint_api(complaint_id):
+    """Status of a queued complaint, or a stored complaint by id"""
+    job = complaint_jobs.get(complaint_id)
+    if job is not None:
+        return jsonify(job_status(job))
+    complaint = complaint_store.get(complaint_id)
+    if complaint is not None:
+        return jsonify({"id": complaint_id, "status": "done", "complaint": complaint})
+    return jsonify({"error": "Complaint not found"}), 404
+
+@app.route('/complaints/<complaint_id>/events', methods=['GET'])
+def complaint_events_api(complaint_id):
+    """Server-sent events stream of a queued complaint's status until it finishes"""
+    if complaint_jobs.get(complaint_id) is None:
+        return jsonify({"error": "Complaint not found"}), 404
+    
+    def stream():
+        last_status = None
+        deadline = time.monotonic() + COMPLAINT_EVENTS_TIMEOUT
+        while time.monotonic() < deadline:
+            job = complaint_jobs.get(complaint_id)
+            status = (job["status"], job["position"])
+            if status != last_status:
+                yield f"event: status\ndata: {json.dumps(job_status(job))}\n\n"
+                last_status = status
+            if job["status"] in FINISHED_STATES:
+                return
+            time.sleep(0.5)
+        yield "event: timeout\ndata: {}\n\n"
+    
+    return Response(stream(), mimetype='text/event-stream', headers={"Cache-Control": "no-cache"})
+
+@app.route('/complaints', methods=['GET'])
+def list_complaints():
+    """Query stored complaints, e.g. /complaints?department=Sanitation&min_severity=4&days=7"""
+    args = request.args
+    try:
+        since = args.get('since')
+        if args.get('days'):
+            since = datetime.datetime.utcnow() - datetime.timedelta(days=float(args['days']))
+        complaints = complaint_store.query(
+            department=args.get('department'),
+            min_severity=args.get('min_severity', type=int),
+            max_severity=args.get('max_severity', type=int),
+            since=since,
+            until=args.get('until'),
+            location=args.get('location'),
+            status=args.get('status'),
+            limit=args.get('limit', 100, type=int),
+            offset=args.get('offset', 0, type=int),
+        )
+    except ValueError as e:
+        return jsonify({"error": f"Invalid query parameter: {e}"}), 400
+    return jsonify({"complaints": complaints, "count": len(complaints)})
+
+@app.route('/incidents', methods=['GET'])
+def list_incidents():
+    """Grouped duplicate complaints, most reported first, e.g. /incidents?min_reports=3&days=2"""
+    args = request.args
+    try:
+        since = args.get('since')
+        if args.get('days'):
+            since = datetime.datetime.utcnow() - datetime.timedelta(days=float(args['days']))
+        incidents = complaint_store.list_incidents(
+            since=since,
+            min_reports=args.get('min_reports', 1, type=int),
+            limit=args.get('limit', 100, type=int),
+        )
+    except ValueError as e:
+        return jsonify({"error": f"Invalid query parameter: {e}"}), 400
+    return jsonify({"incidents": incidents, "count": len(incidents)})
+
 @app.route('/analyze_post', methods=['POST'])
 def analyze_post_api():
     """Analyze a social media post for fake news/deepfakes"""
@@ -205,21 +385,22 @@ def analyze_post_api():
     if not post_text:
         return jsonify({"error": "Post text is required"}), 400
     
-    if deepfake_model is None:
+    model = deepfake_model.get()
+    if model is None:
         return jsonify({"error": "Deepfake model is not loaded"}), 500
     
     # Extract and analyze URLs from the post
     urls = extract_urls(post_text)
-    news_urls = [url for url in urls if is_news_url(url)]
+    news_urls = filter_news_urls(urls)
     
+    # All URLs are analyzed concurrently under one deadline
     results = {}
-    for news_url in news_urls:
-        verdict, reason = analyze_news_url(news_url, serper_api_key, deepfake_model)
+    for news_url, (verdict, reason) in analyze_news_urls(news_urls, serper_api_key, model).items():
         results[news_url] = {"verdict": verdict, "reason": reason}
     
     # Analyze local images if provided
     if image_paths:
-        verdict, reason = analyze_local_images(image_paths, deepfake_model)
+        verdict, reason = analyze_local_images(image_paths, model)
         results["local_images"] = {"verdict": verdict, "reason": reason}
     
     return jsonify({
@@ -228,12 +409,71 @@ def analyze_post_api():
         "news_urls_found": news_urls
     })
 
+# Upload formats for /predict_diabetes, by file extension and by Content-Type
+DIABETES_FILE_FORMATS = {".csv": "csv", ".arrow": "arrow", ".feather": "arrow", ".arrows": "arrow",
+                         ".parquet": "parquet"}
+DIABETES_CONTENT_TYPES = {"text/csv": "csv", "application/vnd.apache.arrow.file": "arrow",
+                          "application/vnd.apache.arrow.stream": "arrow", "application/vnd.apache.parquet": "parquet",
+                          "application/x-parquet": "parquet"}
+
+def read_diabetes_records(stream, fmt):
+    if fmt == "csv":
+        return records_from_csv(stream)
+    return records_from_arrow(stream, parquet=fmt == "parquet")
+
+def read_diabetes_request():
+    """(n, 8) array of records from a JSON body, a multipart file upload or a raw CSV/Arrow/Parquet body"""
+    if request.files:
+        file = request.files.get("file") or next(iter(request.files.values()))
+        extension = os.path.splitext(file.filename or "")[1].lower()
+        fmt = DIABETES_FILE_FORMATS.get(extension) or DIABETES_CONTENT_TYPES.get(file.mimetype)
+        if fmt is None:
+            raise ValueError("Upload a .csv, .arrow/.feather or .parquet file")
+        return read_diabetes_records(upload_stream(file), fmt)
+    fmt = DIABETES_CONTENT_TYPES.get(request.mimetype)
+    if fmt is not None:
+        return read_diabetes_records(io.BytesIO(request.get_data()), fmt)
+    data = request.get_json(silent=True)
+    if data is None:
+        raise ValueError("Send a JSON record or list of records, or a CSV/Arrow/Parquet file")
+    return records_from_json(data)
+
+@app.route('/predict_diabetes', methods=['POST'])
+def predict_diabetes_api():
+    """
+    Screen one record or a batch. Every record is scored in one vectorized call;
+    ?format=csv returns the input rows with the predictions appended.
+    """
+    model = diabetes_model.get()
+    if model is None:
+        return jsonify({"error": "Diabetes model not loaded"}), 500
+    try:
+        X = read_diabetes_request()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    start = time.perf_counter()
+    labels, scores, probabilities = predict_diabetes(model, X)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    print(f"Scored {len(X)} diabetes records in {elapsed_ms:.1f} ms")
+
+    if request.args.get("format") == "csv":
+        return Response(predictions_csv(X, labels, scores, probabilities), mimetype="text/csv",
+                        headers={"Content-Disposition": "attachment; filename=diabetes_predictions.csv"})
+    return jsonify({
+        "count": len(X),
+        "positives": int((labels == 1).sum()),
+        "probability_available": probabilities is not None,
+        "predictions": prediction_records(labels, scores, probabilities),
+    })
+
 @app.route('/predict_skin_disease', methods=['POST'])
 def predict_skin_disease_api():
     """Predict skin disease from an uploaded image"""
     print("Skin disease prediction request received")
     
-    if skin_model is None:
+    model = skin_model.get()
+    if model is None:
         print("ERROR: Skin disease model not loaded")
         return jsonify({"error": "Skin disease model not loaded"}), 500
     
@@ -245,27 +485,25 @@ def predict_skin_disease_api():
     print(f"Received file: {file.filename if file and file.filename else 'No filename'}")
     
     if file and allowed_file(file.filename):
-        filename = secure_filename(file.filename)
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(file_path)
-        print(f"Image saved to: {file_path}")
-        print(f"Image exists: {os.path.exists(file_path)}, Size: {os.path.getsize(file_path)} bytes")
-        
         try:
             print("Preprocessing image...")
-            image_tensor = preprocess_skin_image(file_path)
-            print("Running prediction...")
-            prediction, confidence = predict_skin(skin_model, image_tensor)
-            print(f"Prediction successful: {prediction}, confidence: {confidence}")
+            # Decoded straight from the in-memory (or spooled) upload, nothing is written to disk
+            image = prepare_image(upload_bytes(file), "skin")
+            # Re-submitted photos are answered from the cache without a forward pass
+            cached = skin_prediction_cache.get(image, model.version)
+            if cached is not None:
+                prediction, confidence = cached["label"], cached["confidence"]
+                print(f"Cached prediction: {prediction}, confidence: {confidence}")
+            else:
+                print("Running prediction...")
+                prediction, confidence, probabilities = skin_batcher.predict(image)
+                skin_prediction_cache.set(image, model.version, prediction, confidence, probabilities)
+                print(f"Prediction successful: {prediction}, confidence: {confidence}")
             
             # Get additional information about the disease
             print(f"Retrieving additional information about {prediction}...")
             disease_info = search_and_summarize(prediction)
             
-            # Clean up
-            os.remove(file_path)
-            print(f"Temporary file removed: {file_path}")
-            
             return jsonify({
                 "prediction": prediction,
                 "confidence": confidence,
@@ -275,49 +513,162 @@ def predict_skin_disease_api():
             })
         except Exception as e:
             print(f"ERROR during prediction: {str(e)}")
-            if os.path.exists(file_path):
-                os.remove(file_path)
-                print(f"Cleaned up temporary file after error: {file_path}")
             return jsonify({"error": str(e)}), 500
     else:
         print(f"Invalid file type: {file.filename if file and file.filename else 'No file'}")
         return jsonify({"error": "Invalid file type"}), 400
 
-def search_and_summarize(disease_name):
+def zip_images(stream, limit):
+    """(filename, bytes) for each image in a zip archive, at most limit of them"""
+    try:
+        archive = zipfile.ZipFile(stream)
+    except zipfile.BadZipFile:
+        raise ValueError("Not a valid zip archive")
+    with archive:
+        members = [info for info in archive.infolist()
+                   if not info.is_dir() and allowed_file(info.filename)
+                   and not info.filename.startswith("__MACOSX/")
+                   and not os.path.basename(info.filename).startswith(".")]
+        if len(members) > limit:
+            raise ValueError(f"At most {limit} images per request")
+        # Declared sizes bound what read() will decompress, so this also stops zip bombs
+        if sum(info.file_size for info in members) > SKIN_BATCH_MAX_UPLOAD_BYTES:
+            raise ValueError(f"Images in the archive exceed {SKIN_BATCH_MAX_UPLOAD_BYTES} bytes uncompressed")
+        return [(info.filename, archive.read(info)) for info in members]
+
+def read_skin_batch_request():
     """
-    Search for information about a disease and summarize the results.
-    Returns information about symptoms, treatment, and prevention.
+    (filename, bytes or error) for every uploaded image: any number of multipart
+    image files, zip archives of images among them, or a raw zip body.
     """
-    queries = {
-        "Symptoms": f"What are the symptoms of {disease_name}?",
-        "Treatment": f"What are the treatments for {disease_name}?",
-        "Prevention": f"How to prevent {disease_name}?"
+    if request.mimetype in ZIP_CONTENT_TYPES:
+        return zip_images(io.BytesIO(request.get_data()), SKIN_BATCH_MAX_IMAGES)
+    uploads = []
+    for _, file in request.files.items(multi=True):
+        name = file.filename or ""
+        remaining = SKIN_BATCH_MAX_IMAGES - len(uploads)
+        if name.lower().endswith(".zip"):
+            uploads.extend(zip_images(upload_stream(file), remaining))
+        elif remaining <= 0:
+            raise ValueError(f"At most {SKIN_BATCH_MAX_IMAGES} images per request")
+        elif allowed_file(name):
+            uploads.append((name, upload_bytes(file)))
+        else:
+            uploads.append((name, ValueError("Invalid file type")))
+    return uploads
+
+def disease_detail(label):
+    """Symptoms, treatment and prevention for one label, or an error if the lookup failed"""
+    try:
+        info = search_and_summarize(label)
+    except Exception as e:
+        print(f"ERROR retrieving information about {label}: {str(e)}")
+        return {"error": f"Disease information unavailable: {e}"}
+    return {
+        "symptoms": info.get("Symptoms", "No information available"),
+        "treatment": info.get("Treatment", "No information available"),
+        "prevention": info.get("Prevention", "No information available"),
     }
-    result = {}
-    for key, query in queries.items():
-        print(f"🔍 Fetching {key} info for {disease_name}...")
-        try:
-            raw = search.run(query)
-            docs = [Document(page_content=t) for t in text_splitter.split_text(raw)]
-            result[key] = summarize_chain.run(docs)
-            print(f"✅ Successfully retrieved {key} information")
-        except Exception as e:
-            print(f"❌ Error retrieving {key} information: {str(e)}")
-            result[key] = f"Could not retrieve information: {str(e)}"
-    return result
+
+def disease_details(labels):
+    """disease_detail for each distinct label, looked up concurrently"""
+    labels = sorted(set(labels))
+    if not labels:
+        return {}
+    with ThreadPoolExecutor(max_workers=len(labels)) as pool:
+        return dict(zip(labels, pool.map(disease_detail, labels)))
+
+@app.route('/predict_skin_disease_batch', methods=['POST'])
+def predict_skin_disease_batch_api():
+    """
+    Predict skin disease for many images at once. Uncached images go through the
+    skin batcher together, so they share forward passes of up to SKIN_MAX_BATCH_SIZE.
+    Each result has the top_k class distribution; disease information is looked
+    up once per distinct predicted label. A bad image gets an error of its own.
+    """
+    # Set before the body is parsed; a session's photos can exceed the app-wide upload limit
+    request.max_content_length = SKIN_BATCH_MAX_UPLOAD_BYTES
+    model = skin_model.get()
+    if model is None:
+        return jsonify({"error": "Skin disease model not loaded"}), 500
+    try:
+        top_k = max(1, min(int(request.args.get("top_k", SKIN_TOP_K)), len(skin_class_labels)))
+        uploads = read_skin_batch_request()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if not uploads:
+        return jsonify({"error": "No images uploaded"}), 400
+
+    start = time.perf_counter()
+    sources = [data for _, data in uploads if not isinstance(data, Exception)]
+    decoded = iter(prepare_images(sources, "skin"))
+    images = []
+    for _, data in uploads:
+        image = data if isinstance(data, Exception) else next(decoded)
+        if image is not data and isinstance(image, Exception):
+            image = ValueError(f"Could not read image: {image}")
+        images.append(image)
+
+    outputs, pending, cached_count = [None] * len(images), [], 0
+    try:
+        for i, image in enumerate(images):
+            if isinstance(image, Exception):
+                continue
+            cached = skin_prediction_cache.get(image, model.version)
+            if cached is not None and cached["probabilities"] is not None:
+                outputs[i] = (cached["label"], cached["confidence"], cached["probabilities"])
+                cached_count += 1
+            else:
+                pending.append((i, skin_batcher.submit(image)))
+        for i, future in pending:
+            outputs[i] = future.result()
+            skin_prediction_cache.set(images[i], model.version, *outputs[i])
+    except InferenceQueueFullError as e:
+        response = jsonify({"error": str(e)})
+        response.headers["Retry-After"] = "5"
+        return response, 503
+    except Exception as e:
+        print(f"ERROR during batch prediction: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+    print(f"Predicted {len(pending)} skin images ({cached_count} cached) in "
+          f"{(time.perf_counter() - start) * 1000:.1f} ms")
+
+    results, counts = [], {}
+    for (filename, _), image, output in zip(uploads, images, outputs):
+        if output is None:
+            results.append({"filename": filename, "error": str(image)})
+            continue
+        prediction, confidence, probabilities = output
+        counts[prediction] = counts.get(prediction, 0) + 1
+        results.append({"filename": filename, "prediction": prediction, "confidence": confidence,
+                        "top_k": top_k_classes(probabilities, top_k)})
+    diseases = disease_details(counts)
+    for label, count in counts.items():
+        diseases[label]["images"] = count
+
+    return jsonify({
+        "count": len(results),
+        "predicted": sum(counts.values()),
+        "cached": cached_count,
+        "results": results,
+        "diseases": diseases,
+    }), 200 if counts else 400
 
 if __name__ == '__main__':
     # Print Python and system information for debugging
     print(f"Python version: {sys.version}")
     print(f"Running on platform: {sys.platform}")
-    print(f"Upload folder: {UPLOAD_FOLDER}")
+    print(f"Uploads above {UPLOAD_SPOOL_MAX_BYTES} bytes spool to temp files")
     
-    # Check if model is loaded
-    if deepfake_model is None:
-        print("WARNING: Deepfake model could not be loaded.")
-        print("Image analysis features will be unavailable.")
-    else:
-        print("Deepfake model loaded successfully.")
+    # Optionally load models and clients in the background instead of on first request
+    if WARMUP_ON_START and os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        warm_up()
+    
+    # Resume any complaints queued before a restart and keep disease info fresh
+    # (the debug reloader's child does the serving)
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        complaint_jobs.start_workers()
+        disease_store.ensure_refresher()
     
     # Run Flask server
     app.run(host='0.0.0.0', port=7122, debug=True)
\ No newline at end of file
@@ -0,0 +1,128 @@
+# Dynamic micro-batching for model inference
+import os
+import time
+import queue
+import bisect
+import threading
+from concurrent.futures import Future
+
+class QueueFullError(RuntimeError):
+    pass
+
+class Histogram:
+    """Counts of observed values per upper-bound bucket"""
+
+    def __init__(self, buckets):
+        self.buckets = list(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # Last slot counts values above every bucket
+        self.total = 0
+        self.sum = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.total += 1
+            self.sum += value
+
+    def snapshot(self):
+        with self._lock:
+            labels = [f"<={b}" for b in self.buckets] + [f">{self.buckets[-1]}"]
+            return {
+                "buckets": dict(zip(labels, self.counts)),
+                "count": self.total,
+                "mean": round(self.sum / self.total, 3) if self.total else 0.0,
+            }
+
+class BatchingWorker:
+    """
+    Collects single-item requests for up to max_wait_ms (or max_batch_size items)
+    and runs them through run_batch in one call on a background thread.
+    run_batch receives a list of inputs and must return one output per input.
+    """
+
+    def __init__(self, name, run_batch, max_batch_size=16, max_wait_ms=5, max_queue=1024):
+        self.name = name
+        self.run_batch = run_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_queue = max_queue
+        self.batch_sizes = Histogram([1, 2, 4, 8, 16, 32, 64])
+        self.queue_depths = Histogram([0, 1, 2, 4, 8, 16, 32, 64, 128, 256])
+        self.batches = 0
+        self.items = 0
+        self.failures = 0
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        # Threads do not survive a fork, so start one lazily in each process
+        if self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._queue = queue.Queue(maxsize=self.max_queue)
+            self._thread = threading.Thread(target=self._loop, name=f"{self.name}-batcher", daemon=True)
+            self._pid = os.getpid()
+            self._thread.start()
+
+    def submit(self, item):
+        """Queue one input and return a Future for its output"""
+        self._ensure_started()
+        future = Future()
+        self.queue_depths.observe(self._queue.qsize())
+        try:
+            self._queue.put_nowait((item, future))
+        except queue.Full:
+            raise QueueFullError(f"{self.name} inference queue is full ({self.max_queue} pending)")
+        return future
+
+    def predict(self, item, timeout=None):
+        return self.submit(item).result(timeout=timeout)
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            items = [item for item, _ in batch]
+            self.batch_sizes.observe(len(batch))
+            self.batches += 1
+            self.items += len(batch)
+            try:
+                outputs = self.run_batch(items)
+                if len(outputs) != len(items):
+                    raise RuntimeError(f"{self.name} batch returned {len(outputs)} outputs for {len(items)} inputs")
+            except Exception as e:
+                self.failures += 1
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), output in zip(batch, outputs):
+                future.set_result(output)
+
+    def stats(self):
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "batches": self.batches,
+            "items": self.items,
+            "failures": self.failures,
+            "batch_size_histogram": self.batch_sizes.snapshot(),
+            "queue_depth_histogram": self.queue_depths.snapshot(),
+        }
@@ -0,0 +1,67 @@
+# Benchmark the streaming page extractor against the previous BeautifulSoup parser on saved pages
+#   python bench_html_extract.py saved_pages/            (*.html files, e.g. saved with "curl -o")
+#   python bench_html_extract.py saved_pages/ --repeat 20 --base-url https://www.example.com/
+import os
+import sys
+import glob
+import time
+import argparse
+import tracemalloc
+from html_extract import extract_page
+
+def extract_with_soup(content, base_url):
+    """The parser scrape_website used before html_extract.py"""
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(content.decode("utf-8", errors="replace"), "html.parser")
+    text = " ".join(p.get_text() for p in soup.find_all("p"))
+    images = [img["src"] for img in soup.find_all("img") if "src" in img.attrs and not img["src"].startswith("data:")]
+    return text, images
+
+def measure(extract, pages, repeat):
+    """Mean ms per page, peak traced memory per page and the results of the last run"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        results = [extract(content, base_url) for base_url, content in pages]
+    ms_per_page = (time.perf_counter() - start) * 1000 / (repeat * len(pages))
+    peaks = []
+    for base_url, content in pages:
+        tracemalloc.start()
+        extract(content, base_url)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return ms_per_page, max(peaks), results
+
+def text_overlap(reference, candidate):
+    """Share of the reference's words that the candidate also extracted"""
+    reference_words = set(reference.split())
+    return len(reference_words & set(candidate.split())) / len(reference_words) if reference_words else 1.0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the streaming extractor with BeautifulSoup")
+    parser.add_argument("directory", help="directory of saved .html pages")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--base-url", default="https://example.com/", help="URL relative links resolve against")
+    args = parser.parse_args()
+
+    paths = sorted(glob.glob(os.path.join(args.directory, "*.htm*")))
+    if not paths:
+        sys.exit(f"No .html files in {args.directory}")
+    pages = []
+    for path in paths:
+        with open(path, "rb") as f:
+            pages.append((args.base_url, f.read()))
+    total_kb = sum(len(content) for _, content in pages) / 1024
+    print(f"{len(pages)} pages, {total_kb:.0f} KB total, {args.repeat} runs each\n")
+
+    soup_ms, soup_peak, soup_results = measure(extract_with_soup, pages, args.repeat)
+    stream_ms, stream_peak, stream_results = measure(extract_page, pages, args.repeat)
+    print(f"{'parser':<14}{'ms/page':>10}{'peak KB':>10}{'images':>8}")
+    for name, ms, peak, results in (("BeautifulSoup", soup_ms, soup_peak, soup_results),
+                                    ("streaming", stream_ms, stream_peak, stream_results)):
+        images = sum(len(imgs) for _, imgs in results)
+        print(f"{name:<14}{ms:>10.2f}{peak / 1024:>10.0f}{images:>8}")
+    print(f"\nspeedup: {soup_ms / stream_ms:.1f}x")
+
+    overlaps = [text_overlap(a, b) for (a, _), (b, _) in zip(soup_results, stream_results)]
+    print(f"text overlap with BeautifulSoup: mean {sum(overlaps) / len(overlaps):.1%}, min {min(overlaps):.1%}")
+    print("(the streaming extractor stops at its paragraph budget, so long pages overlap less)")
@@ -0,0 +1,94 @@
+# Throughput of the shared preprocessing pipeline against the previous per-image torchvision transforms
+#   python bench_image_preprocessing.py photos/          (JPEG/PNG files)
+#   python bench_image_preprocessing.py --synthetic 64   (random JPEGs of mixed sizes)
+import os
+import io
+import sys
+import glob
+import time
+import argparse
+import numpy as np
+import torch
+from PIL import Image
+from image_preprocessing import PREPROCESS_SPECS, prepare_image, normalize_batch, preprocess_batch
+
+def old_transform(name):
+    """The T.Compose each model used before image_preprocessing.py"""
+    import torchvision.transforms as T
+    spec = PREPROCESS_SPECS[name]
+    steps = [T.Resize(spec["size"]), T.ToTensor()]
+    if spec["mean"] is not None:
+        steps.append(T.Normalize(mean=spec["mean"], std=spec["std"]))
+    return T.Compose(steps)
+
+def synthetic_images(count, seed=0):
+    """JPEG bytes from phone-photo to thumbnail sizes"""
+    rng = np.random.default_rng(seed)
+    sizes = [(4032, 3024), (1920, 1080), (1280, 720), (640, 480), (300, 300)]
+    images = []
+    for i in range(count):
+        width, height = sizes[i % len(sizes)]
+        # Smooth gradients plus noise compress like photos, unlike pure noise
+        x = np.linspace(0, 255, width, dtype=np.float32)
+        y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+        pixels = np.stack([x + 0 * y, y + 0 * x, (x + y) / 2], axis=-1)
+        pixels += rng.normal(0, 12, pixels.shape).astype(np.float32)
+        buffer = io.BytesIO()
+        Image.fromarray(pixels.clip(0, 255).astype(np.uint8)).save(buffer, "JPEG", quality=90)
+        images.append(buffer.getvalue())
+    return images
+
+def run_old(images, name):
+    transform = old_transform(name)
+    return torch.stack([transform(Image.open(io.BytesIO(data)).convert("RGB")) for data in images])
+
+def run_sequential(images, name):
+    return normalize_batch([prepare_image(data, name) for data in images], name)
+
+def run_pooled(images, name):
+    return preprocess_batch(images, name)
+
+def images_per_second(run, images, name, repeat):
+    run(images[:2], name)  # imports and first-call setup
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = run(images, name)
+    return repeat * len(images) / (time.perf_counter() - start), result
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark image preprocessing throughput")
+    parser.add_argument("directory", nargs="?", help="directory of images")
+    parser.add_argument("--synthetic", type=int, default=0, help="generate this many JPEGs instead")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--models", nargs="*", default=["skin", "deepfake"])
+    args = parser.parse_args()
+
+    if args.synthetic:
+        images = synthetic_images(args.synthetic)
+    elif args.directory:
+        paths = sorted(p for p in glob.glob(os.path.join(args.directory, "*"))
+                       if p.lower().endswith((".jpg", ".jpeg", ".png", ".webp")))
+        images = []
+        for path in paths:
+            with open(path, "rb") as f:
+                images.append(f.read())
+    else:
+        sys.exit("Give a directory of images or --synthetic N")
+    if not images:
+        sys.exit("No images to benchmark")
+    print(f"{len(images)} images, {sum(map(len, images)) / 1e6:.1f} MB, torch threads: {torch.get_num_threads()}\n")
+
+    for name in args.models:
+        print(f"{name} {PREPROCESS_SPECS[name]['size']}")
+        baseline = None
+        for label, run in (("per-image transforms", run_old), ("shared, sequential", run_sequential),
+                           ("shared, decode pool", run_pooled)):
+            rate, result = images_per_second(run, images, name, args.repeat)
+            if baseline is None:
+                baseline, reference = rate, result
+                print(f"  {label:<22}{rate:>9.1f} img/s")
+            else:
+                diff = (result - reference).abs()
+                print(f"  {label:<22}{rate:>9.1f} img/s  {rate / baseline:>5.1f}x  "
+                      f"mean |diff| {diff.mean().item():.4f}, max {diff.max().item():.3f}")
+        print()
@@ -2,16 +2,14 @@ import os
 import json
 import datetime
 import traceback
+from concurrent.futures import Future, ThreadPoolExecutor
 from dotenv import load_dotenv
-from PIL import Image
-import base64
-from io import BytesIO
-import torch
-import torchvision.transforms as transforms
-from langchain_groq import ChatGroq
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.chains import load_summarize_chain
-from langchain_core.documents import Document
+from llm_client import get_llm, get_summarize_chain
+from lazy_resource import LazyResource
+from complaint_store import complaint_store
+from complaint_dedup import DEDUP_ENABLED, incident_index
+from department_classifier import department_classifier
+from image_relevance import IMAGE_RELEVANCE_ENABLED, relevance_engine, describe_relevance
 
 # Load environment variables
 load_dotenv(".env")
@@ -19,10 +17,24 @@ groq_api_key = os.getenv("GROQ_API_KEY")
 
 print(f"GROQ API Key available: {groq_api_key is not None and groq_api_key != ''}")
 
-# Initialize LLM and tools
-llm = ChatGroq(model="llama3-8b-8192", api_key=groq_api_key)
-text_splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
-summarize_chain = load_summarize_chain(llm, chain_type="map_reduce")
+# Initialize LLM and tools (shared cached client, see llm_client.py)
+llm = get_llm()
+
+def load_text_splitter():
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    return RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
+
+text_splitter = LazyResource("text_splitter", load_text_splitter)
+summarize_chain = get_summarize_chain("map_reduce")
+
+# Shared pool for the independent per-complaint LLM calls
+COMPLAINT_LLM_WORKERS = int(os.getenv("COMPLAINT_LLM_WORKERS", "8"))
+llm_executor = ThreadPoolExecutor(max_workers=COMPLAINT_LLM_WORKERS, thread_name_prefix="complaint-llm")
+
+# Triage mode gets departments, severity, summary and suggestions from one JSON call
+COMPLAINT_TRIAGE_MODE = os.getenv("COMPLAINT_TRIAGE_MODE", "1") == "1"
+TRIAGE_MAX_ATTEMPTS = int(os.getenv("TRIAGE_MAX_ATTEMPTS", "2"))
+triage_llm = llm.bind(response_format={"type": "json_object"})
 
 # Departments and contacts
 DEPARTMENT_CONTACTS = {
@@ -34,102 +46,42 @@ DEPARTMENT_CONTACTS = {
 }
 DEPARTMENTS = list(DEPARTMENT_CONTACTS.keys())
 
-# Analyze image for relevance to complaint
-def validate_image_with_llama(image_path, complaint_text):
+# Check the image's relevance to the complaint with the local CLIP model (see image_relevance.py)
+def validate_image(image_bytes, complaint_text):
+    """image_bytes: the encoded upload, decoded once by the relevance engine"""
     try:
-        print(f"Starting image validation for: {image_path}")
-        
-        # Double check that image path exists
-        if not image_path:
-            print("No image path provided")
+        if not image_bytes:
+            print("No image provided")
             return "No image was provided with the complaint."
-            
-        # Verify image exists
-        if not os.path.exists(image_path):
-            print(f"Error: Image path does not exist: {image_path}")
-            return f"The image could not be found on the server."
-        
-        # Display image info
-        file_size = os.path.getsize(image_path)
-        print(f"Image file exists with size: {file_size} bytes")
+        print(f"Starting image validation for a {len(image_bytes)} byte image")
         
-        # If GROQ API key is not available, return a default message
-        if not groq_api_key or groq_api_key == "":
-            print("GROQ API key not available, returning mock response")
+        if not IMAGE_RELEVANCE_ENABLED:
             return "The image was received and will be evaluated by the relevant department."
         
-        # Basic file validation
         try:
-            img = Image.open(image_path)
-            img_format = img.format
-            img_size = img.size
-            print(f"Image opened successfully: format={img_format}, dimensions={img_size}")
-            
-            # Convert to RGB (handles PNG with alpha channel)
-            img = img.convert("RGB")
-            
-            # Resize large images to reduce token usage
-            if img.width > 800 or img.height > 800:
-                print("Image is large, resizing to reduce size")
-                ratio = min(800/img.width, 800/img.height)
-                new_size = (int(img.width * ratio), int(img.height * ratio))
-                img = img.resize(new_size, Image.LANCZOS)
-                print(f"Image resized to {new_size}")
-                
+            result = relevance_engine.score(image_bytes, complaint_text)
         except Exception as e:
-            print(f"Error opening image: {str(e)}")
+            print(f"Error scoring image: {str(e)}")
             print(traceback.format_exc())
             return "The image was received but couldn't be properly processed."
         
-        # Creating base64 for the image
-        try:
-            buffered = BytesIO()
-            img.save(buffered, format="JPEG", quality=70)  # Lower quality to reduce size
-            img_base64 = base64.b64encode(buffered.getvalue()).decode("utf-8")
-            print(f"Base64 encoded image size: {len(img_base64)} characters")
-            
-            # If base64 string is too large, further reduce image quality/size
-            if len(img_base64) > 100000:
-                print("Base64 too large, further reducing image quality")
-                buffered = BytesIO()
-                # Resize more aggressively
-                img = img.resize((400, int(400 * img.height / img.width)), Image.LANCZOS)
-                img.save(buffered, format="JPEG", quality=50)
-                img_base64 = base64.b64encode(buffered.getvalue()).decode("utf-8")
-                print(f"Reduced base64 size: {len(img_base64)} characters")
-        except Exception as e:
-            print(f"Error encoding image: {str(e)}")
-            print(traceback.format_exc())
-            return "The image was received but couldn't be properly encoded for analysis."
-
-        # Use a simpler prompt with a shorter base64 segment
-        try:
-            # Only send the first 1000 chars of base64 to reduce token usage
-            shortened_base64 = img_base64[:1000]
-            
-            prompt = f"A citizen has filed the following complaint: \"{complaint_text}\". I've attached an image as evidence. Does this image appear to be relevant to the complaint? Give a brief assessment (2-3 sentences max). Base64 Image excerpt: {shortened_base64}..."
-
-            print("Sending prompt to LLM for image analysis...")
-            try:
-                response_obj = llm.invoke(prompt)
-                response_text = response_obj.content.strip()
-                print(f"LLM response received: {response_text[:100]}...")
-                return response_text
-            except Exception as inner_e:
-                print(f"Error in LLM invocation: {inner_e}")
-                return "Image received but couldn't be analyzed with AI. Your complaint has been registered."
-                
-        except Exception as e:
-            print(f"Error during LLM processing: {str(e)}")
-            print(traceback.format_exc())
-            return f"Image received but couldn't be analyzed with AI: {str(e)}. Proceeding with complaint."
+        if result is None:
+            # Model not available, leave the image to the officer
+            return "The image was received and will be evaluated by the relevant department."
+        print(f"Image relevance: {result}")
+        return describe_relevance(result)
     except Exception as e:
-        print(f"Unexpected error in validate_image_with_llama: {str(e)}")
+        print(f"Unexpected error in validate_image: {str(e)}")
         print(traceback.format_exc())
         return f"Image processing error: {str(e)}. Continuing with your complaint."
 
-# Classify departments using LLaMA
-def classify_departments(text):
+# Classify departments with the local model when it is confident, otherwise using LLaMA
+def classify_departments_with_source(text):
+    """Return (departments, source) where source is "local", "llm" or "default" (after an error)"""
+    departments = department_classifier.classify(text)
+    if departments:
+        print(f"Classified departments locally: {departments}")
+        return departments, "local"
     print("Classifying departments for complaint")
     prompt = f"""Given this complaint:
 {text}
@@ -140,61 +92,270 @@ Return only department names as a comma-separated list."""
         response = llm.invoke(prompt)
         result = [d.strip() for d in response.content.split(",") if d.strip() in DEPARTMENTS]
         print(f"Classified departments: {result}")
-        return result
+        return result, "llm"
     except Exception as e:
         print(f"Error classifying departments: {str(e)}")
         print(traceback.format_exc())
         # Return a default department during errors
-        return ["Road Development"]
+        return ["Road Development"], "default"
+
+def classify_departments(text):
+    return classify_departments_with_source(text)[0]
+
+# JSON schema the triage prompt is constrained to
+TRIAGE_FIELDS = ("departments", "severity", "summary", "suggestions")
+TRIAGE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "departments": {
+            "type": "array",
+            "items": {"type": "string", "enum": DEPARTMENTS},
+            "minItems": 1,
+            "description": "Departments the complaint should be forwarded to",
+        },
+        "severity": {
+            "type": "integer",
+            "minimum": 1,
+            "maximum": 5,
+            "description": "Severity from 1 (least) to 5 (most severe)",
+        },
+        "summary": {
+            "type": "string",
+            "description": "One or two sentence summary of the complaint",
+        },
+        "suggestions": {
+            "type": "object",
+            "additionalProperties": {"type": "array", "items": {"type": "string"}, "maxItems": 4},
+            "description": "For each chosen department, 3-4 short things the complainer could do while waiting",
+        },
+    },
+    "required": list(TRIAGE_FIELDS),
+}
+
+def build_triage_prompt(text, fields, departments=None):
+    schema = dict(TRIAGE_SCHEMA)
+    schema["properties"] = {f: TRIAGE_SCHEMA["properties"][f] for f in fields}
+    schema["required"] = list(fields)
+    prompt = f"""You are a government representative triaging a civic complaint.
+Complaint:
+{text}
+Respond with a single JSON object matching this JSON schema and nothing else:
+{json.dumps(schema)}"""
+    if departments and "departments" not in fields:
+        prompt += f"\nThe complaint has already been forwarded to: {', '.join(departments)}. Give suggestions for exactly these departments."
+    return prompt
+
+def parse_triage_response(content, departments=None):
+    """Validate a triage response and return only the fields that passed"""
+    data = json.loads(content)
+    if not isinstance(data, dict):
+        return {}
+    fields = {}
+
+    depts = data.get("departments")
+    if isinstance(depts, list):
+        depts = [d.strip() for d in depts if isinstance(d, str) and d.strip() in DEPARTMENTS]
+        if depts:
+            fields["departments"] = list(dict.fromkeys(depts))
+
+    severity = data.get("severity")
+    if isinstance(severity, (int, float, str)) and not isinstance(severity, bool):
+        try:
+            fields["severity"] = min(max(int(float(severity)), 1), 5)  # Clamp between 1 and 5
+        except ValueError:
+            pass
+
+    summary = data.get("summary")
+    if isinstance(summary, str) and summary.strip():
+        fields["summary"] = summary.strip()
+
+    # Suggestions can only be checked against a known set of departments
+    departments = fields.get("departments", departments)
+    suggestions = data.get("suggestions")
+    if departments and isinstance(suggestions, dict):
+        valid = {}
+        for dept in departments:
+            items = suggestions.get(dept)
+            if isinstance(items, list):
+                items = [s.strip("-• ").strip() for s in items if isinstance(s, str) and s.strip("-• ").strip()]
+                if items:
+                    valid[dept] = items[:4]  # Limit to 4 suggestions
+        if valid:
+            fields["suggestions"] = valid
+    return fields
+
+def missing_triage_fields(fields):
+    missing = [f for f in TRIAGE_FIELDS if f not in fields]
+    if "suggestions" in fields and "departments" in fields:
+        if any(d not in fields["suggestions"] for d in fields["departments"]):
+            missing.append("suggestions")
+    return missing
+
+def triage_response_complete(content, requested, departments=None):
+    """True when a triage response validates for every requested field"""
+    try:
+        fields = parse_triage_response(content, departments)
+    except ValueError:
+        return False
+    if departments and "departments" not in fields:
+        fields["departments"] = departments
+    return not any(f in requested for f in missing_triage_fields(fields))
+
+# Triage the complaint with a single structured LLM call
+def triage_complaint(text, departments=None):
+    print("Triaging complaint with a single structured call")
+    # Departments already chosen (e.g. by the local classifier) are not asked for again
+    fields = {"departments": departments} if departments else {}
+    missing = missing_triage_fields(fields)
+    for attempt in range(TRIAGE_MAX_ATTEMPTS):
+        try:
+            prompt = build_triage_prompt(text, missing, fields.get("departments"))
+            # Only fully valid responses are cached, so a retry asks the model again
+            response = triage_llm.invoke(prompt, cache_if=lambda content: triage_response_complete(
+                content, missing, fields.get("departments")))
+            parsed = parse_triage_response(response.content, fields.get("departments"))
+            # Never overwrite fields an earlier attempt already validated
+            for key, value in parsed.items():
+                if key == "suggestions":
+                    fields.setdefault("suggestions", {})
+                    for dept, items in value.items():
+                        fields["suggestions"].setdefault(dept, items)
+                else:
+                    fields.setdefault(key, value)
+        except Exception as e:
+            print(f"Error in triage attempt {attempt + 1}: {str(e)}")
+        missing = missing_triage_fields(fields)
+        if not missing:
+            break
+        print(f"Triage attempt {attempt + 1} missing fields: {missing}")
+    print(f"Triage produced fields: {list(fields.keys())}")
+    return fields
+
+def resolved_future(value):
+    future = Future()
+    future.set_result(value)
+    return future
 
 # Process complaint
-def process_complaint(text, location, image_path=None):
+def process_complaint(text, location, image_path=None, complaint_id=None, image_bytes=None):
+    """image_bytes is the uploaded image in memory; image_path is read instead when given"""
     print(f"\n--- Processing new complaint ---")
     print(f"Text: {text[:50]}...")
     print(f"Location: {location}")
-    print(f"Image path: {image_path}")
     
     timestamp = datetime.datetime.utcnow().isoformat()
-    
-    try:
-        departments = classify_departments(text)
-        print("Departments classified successfully")
-        
-        severity = get_severity_score(text)
-        print(f"Severity determined: {severity}/5")
-        
-        summary = summarize_text(text)
-        print(f"Text summarized: {summary[:50]}...")
-        
-        contact_info = get_contact_info(departments)
-        print("Contact info retrieved")
-        
-        suggestions = []
-        for dept in departments:
-            dept_suggestions = fetch_interim_suggestions(text, dept)
-            suggestions.extend(dept_suggestions)
-            print(f"Got {len(dept_suggestions)} suggestions for {dept}")
-        
-        officer_brief = generate_officer_brief(summary, severity, departments)
-        print("Officer brief generated")
-    except Exception as e:
-        print(f"Error in main complaint processing: {str(e)}")
-        print(traceback.format_exc())
-        # Set fallback values
-        departments = ["Road Development"]
-        severity = 3
-        summary = text[:100] + "..."
+
+    if image_bytes is None and image_path and os.path.exists(image_path):
+        with open(image_path, "rb") as f:
+            image_bytes = f.read()
+
+    # Image validation does not depend on any other step, start it first
+    image_future = None
+    if image_bytes:
+        print(f"Processing {len(image_bytes)} byte image")
+        image_future = llm_executor.submit(validate_image, image_bytes, text)
+    else:
+        print("No image to process")
+
+    # A near-duplicate of a recent complaint at the same location reuses that incident's analysis;
+    # a unique complaint reserves a pending incident so duplicates arriving meanwhile wait for it
+    incident, report_count, reserved = None, None, False
+    if DEDUP_ENABLED:
+        try:
+            incident, report_count, reserved = incident_index.claim(text, location)
+        except Exception as e:
+            print(f"Error checking for duplicate complaints: {str(e)}")
+
+    analysis_failed = False
+    if incident is not None and not reserved:
+        departments = incident["departments"]
+        severity = incident["severity"]
+        summary = incident["summary"]
+        suggestions = incident["suggestions"]
+        department_source = "incident"
         contact_info = get_contact_info(departments)
-        suggestions = ["Report issue to local authorities", "Document any changes in the situation"]
-        officer_brief = f"A complaint has been received regarding {text[:50]}... The issue is forwarded to Road Development."
+        print(f"Reusing analysis of incident {incident['id']} ({report_count} reports)")
+    else:
+        try:
+            # The local classifier answers confident cases without asking the LLM for departments
+            local_departments = department_classifier.classify(text)
+
+            # Fields the triage call could not produce fall back to the per-field calls
+            triage = triage_complaint(text, local_departments) if COMPLAINT_TRIAGE_MODE else {}
+            triage_suggestions = triage.get("suggestions", {})
+
+            # Severity and summary run alongside classification
+            if local_departments:
+                departments_future = resolved_future((local_departments, "local"))
+            elif "departments" in triage:
+                departments_future = resolved_future((triage["departments"], "llm"))
+            else:
+                departments_future = llm_executor.submit(classify_departments_with_source, text)
+            if "severity" in triage:
+                severity_future = resolved_future(triage["severity"])
+            else:
+                severity_future = llm_executor.submit(get_severity_score, text)
+            if "summary" in triage:
+                summary_future = resolved_future(triage["summary"])
+            else:
+                summary_future = llm_executor.submit(summarize_text, text)
+
+            departments, department_source = departments_future.result()
+            print(f"Departments classified successfully ({department_source})")
+
+            contact_info = get_contact_info(departments)
+            print("Contact info retrieved")
+
+            # Fan out one suggestions call per department
+            suggestion_futures = [
+                (dept, resolved_future(triage_suggestions[dept]) if dept in triage_suggestions
+                 else llm_executor.submit(fetch_interim_suggestions, text, dept))
+                for dept in departments
+            ]
+
+            severity = severity_future.result()
+            print(f"Severity determined: {severity}/5")
+
+            summary = summary_future.result()
+            print(f"Text summarized: {summary[:50]}...")
+
+            suggestions = []
+            for dept, future in suggestion_futures:
+                dept_suggestions = future.result()
+                suggestions.extend(dept_suggestions)
+                print(f"Got {len(dept_suggestions)} suggestions for {dept}")
+
+            officer_brief = generate_officer_brief(summary, severity, departments)
+            print("Officer brief generated")
+        except Exception as e:
+            print(f"Error in main complaint processing: {str(e)}")
+            print(traceback.format_exc())
+            # Set fallback values
+            analysis_failed = True
+            department_source = "default"
+            departments = ["Road Development"]
+            severity = 3
+            summary = text[:100] + "..."
+            contact_info = get_contact_info(departments)
+            suggestions = ["Report issue to local authorities", "Document any changes in the situation"]
+            officer_brief = f"A complaint has been received regarding {text[:50]}... The issue is forwarded to Road Development."
+
+    # A reserved incident gets this analysis, unless the analysis fell back to defaults
+    if reserved:
+        try:
+            if analysis_failed:
+                incident_index.release(incident)
+                incident = None
+            else:
+                incident, report_count = incident_index.complete(incident, departments, severity, summary, suggestions)
+        except Exception as e:
+            print(f"Error recording incident: {str(e)}")
+            incident = None
 
     image_analysis = None
-    if image_path and os.path.exists(image_path):
-        print(f"Processing image at {image_path}")
-        image_analysis = validate_image_with_llama(image_path, text)
+    if image_future is not None:
+        image_analysis = image_future.result()
         print(f"Image analysis result: {image_analysis[:50]}...")
-    else:
-        print("No image to process or image path doesn't exist")
 
     # Create complainer and officer responses
     complainer_txt = f"--- COMPLAINER COPY ---\n"
@@ -216,41 +377,31 @@ def process_complaint(text, location, image_path=None):
     officer_txt += f"Original Complaint: {text}\nDepartments: {', '.join(departments)}\n"
     if image_analysis:
         officer_txt += f"Image Review: {image_analysis}\n"
+    if incident is not None:
+        officer_txt += f"Linked Incident: {incident['id']} ({report_count} reports)\n"
 
     try:
-        with open("complainer_output.txt", "a") as f1:
-            f1.write(complainer_txt + "\n")
-
-        with open("officer_output.txt", "a") as f2:
-            f2.write(officer_txt + "\n")
-
-        complainer_json = {
-            "departments_forwarded": departments,
-            "contact_details": contact_info,
-            "suggestions": suggestions,
-            "timestamp": timestamp,
-            "image_analysis": image_analysis
-        }
-
-        officer_json = {
+        record = {
             "timestamp": timestamp,
+            "location": location,
             "severity": severity,
             "summary": summary,
             "original_text": text,
-            "location": location,
             "departments": departments,
-            "image_analysis": image_analysis
+            "contact_details": contact_info,
+            "suggestions": suggestions,
+            "image_analysis": image_analysis,
+            "complainer_view": complainer_txt,
+            "officer_view": officer_txt,
+            "incident_id": incident["id"] if incident is not None else None,
+            "department_source": department_source,
         }
-
-        with open("complainer_output.json", "a") as f3:
-            json.dump(complainer_json, f3, indent=4)
-            f3.write(",\n")
-
-        with open("officer_output.json", "a") as f4:
-            json.dump(officer_json, f4, indent=4)
-            f4.write(",\n")
+        if complaint_id:
+            record["id"] = complaint_id
+        complaint_id = complaint_store.add(record)
+        print(f"Complaint queued for storage with id {complaint_id}")
     except Exception as e:
-        print(f"Error writing output files: {str(e)}")
+        print(f"Error storing complaint: {str(e)}")
         print(traceback.format_exc())
 
     print("Complaint processing complete!")
@@ -278,7 +429,8 @@ Severity (number only):"""
 def summarize_text(text):
     print("Summarizing complaint text")
     try:
-        docs = [Document(page_content=t) for t in text_splitter.split_text(text)]
+        from langchain_core.documents import Document
+        docs = [Document(page_content=t) for t in text_splitter.get().split_text(text)]
         summary = summarize_chain.run(docs)
         print(f"Summary generated: {summary[:50]}...")
         return summary
@@ -1,13 +1,42 @@
 # Import Required Libraries
+import os
 import re
-import requests
-from bs4 import BeautifulSoup
+import time
+import asyncio
 import numpy as np
-from PIL import Image as PILImage
-import io
-import spacy
+import hashlib
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
 import torch
-from torchvision import transforms
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from nlp_engine import extract_key_claims
+from http_client import http_client, async_http_client
+from ttl_cache import TTLCache
+from model_runtime import load_model
+from news_domains import filter_news_urls
+from html_extract import PageStream, extract_page, SCRAPE_MAX_BYTES
+from image_preprocessing import prepare_image, normalize_batch
+from prediction_cache import deepfake_prediction_cache
+
+# Response size cap for images; pages are cut off at SCRAPE_MAX_BYTES instead (see html_extract.py)
+MAX_IMAGE_BYTES = int(os.getenv("MAX_IMAGE_BYTES", str(10 * 1024 * 1024)))
+
+# Concurrent per-URL analysis for a post, bounded by one overall deadline
+ANALYZE_URL_WORKERS = int(os.getenv("ANALYZE_URL_WORKERS", "8"))
+ANALYZE_POST_DEADLINE = float(os.getenv("ANALYZE_POST_DEADLINE", "20"))  # seconds
+TIMED_OUT_VERDICT = "Timed out"
+analysis_executor = ThreadPoolExecutor(max_workers=ANALYZE_URL_WORKERS, thread_name_prefix="news-analysis")
+
+# Verdicts keyed by normalized URL + page fingerprint, deepfake scores keyed by image URL
+VERDICT_CACHE_TTL = int(os.getenv("VERDICT_CACHE_TTL", "1800"))  # seconds
+VERDICT_CACHE_SIZE = int(os.getenv("VERDICT_CACHE_SIZE", "5000"))
+IMAGE_SCORE_CACHE_TTL = int(os.getenv("IMAGE_SCORE_CACHE_TTL", str(24 * 3600)))  # seconds
+IMAGE_SCORE_CACHE_SIZE = int(os.getenv("IMAGE_SCORE_CACHE_SIZE", "50000"))
+verdict_cache = TTLCache(VERDICT_CACHE_SIZE, VERDICT_CACHE_TTL)
+page_validators = TTLCache(VERDICT_CACHE_SIZE, VERDICT_CACHE_TTL)
+image_score_cache = TTLCache(IMAGE_SCORE_CACHE_SIZE, IMAGE_SCORE_CACHE_TTL)
+
+# Query parameters that never change the page content
+TRACKING_PARAMS = {"fbclid", "gclid", "igshid", "mc_cid", "mc_eid", "ref", "ref_src", "cmpid"}
 
 # URL Extraction & Filtering
 def extract_urls(text):
@@ -15,40 +44,82 @@ def extract_urls(text):
     url_pattern = r'https?://\S+'
     return re.findall(url_pattern, text)
 
-def is_news_url(url):
-    # Expanded list of keywords and domain fragments from various regions
-    news_keywords = [
-        "news", "bbc", "cnn", "nytimes", "theguardian", "reuters", "foxnews", "nbc", "abcnews", "usatoday",
-        "washingtonpost", "latimes", "npr", "aljazeera", "economist", "bloomberg", "cnbc", "dailymail",
-        "hindustantimes", "indiatimes", "timesofindia", "indianexpress", "thehindu", "dnaindia", "firstpost",
-        "news18", "zeenews", "oneindia", "timesnow", "ibtimes", "expressindia", "thequint", "newsx", "aajtak",
-        "tribune", "thetimes", "post", "herald", "channelnewsasia", "scmp", "telegraph", "thedaily", "guardian",
-        "abc", "cbs", "msnbc", "usat", "global", "daily", "breaking", "bulletin", "chronicle"
-    ]
-    url_lower = url.lower()
-    return any(keyword in url_lower for keyword in news_keywords)
+def normalize_url(url):
+    """Canonical form of a URL for cache keys: lowercase host, no fragment, tracking or default port"""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if parts.port and not ((scheme == "http" and parts.port == 80) or (scheme == "https" and parts.port == 443)):
+        host += f":{parts.port}"
+    query = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+                   if not k.lower().startswith("utm_") and k.lower() not in TRACKING_PARAMS)
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit((scheme, host, path, urlencode(query), ""))
+
+# Revalidate against the last seen ETag/Last-Modified when we have one
+def conditional_headers(url):
+    headers = {}
+    validator = page_validators.get(normalize_url(url))
+    if validator:
+        if validator.get("etag"):
+            headers["If-None-Match"] = validator["etag"]
+        if validator.get("last_modified"):
+            headers["If-Modified-Since"] = validator["last_modified"]
+    return headers or None
+
+# Parse 200 pages while they download, so a spent budget also stops the download
+def stream_page(response):
+    if response.status_code != 200:
+        return None
+    response.page = PageStream(response.url, response.encoding)
+    return response.page.feed
+
+def fetch_page(url, conditional=True, stop_at=None):
+    try:
+        headers = conditional_headers(url) if conditional else None
+        return http_client.get(url, max_bytes=SCRAPE_MAX_BYTES, truncate=True, headers=headers, stop_at=stop_at,
+                               on_response=stream_page)
+    except Exception:
+        return None
+
+# Identify a page version by its validators, falling back to a hash of the body
+def page_fingerprint(response):
+    etag = response.headers.get("ETag")
+    if etag and not etag.startswith("W/"):
+        return "etag:" + etag
+    last_modified = response.headers.get("Last-Modified")
+    if last_modified:
+        return "modified:" + last_modified
+    return "sha256:" + hashlib.sha256(response.content).hexdigest()
 
 # Scrape Website Text & Image URLs
 def scrape_website(url):
     try:
-        response = requests.get(url)
+        response = http_client.get(url, max_bytes=SCRAPE_MAX_BYTES, truncate=True, on_response=stream_page)
+    except Exception as e:
+        return None, None
+    return parse_page(response)
+
+# Extract paragraph text and image URLs from a fetched page
+def parse_page(response):
+    try:
         if response.status_code != 200:
             return None, None
-        soup = BeautifulSoup(response.text, 'html.parser')
-        paragraphs = soup.find_all('p')
-        text_content = ' '.join(p.get_text() for p in paragraphs)
-        images = [img['src'] for img in soup.find_all('img')
-                  if 'src' in img.attrs and not img['src'].startswith('data:')]
-        return text_content, images
+        # Streaming parse under byte/paragraph/time budgets; image URLs come back absolute,
+        # without tracking pixels and icons
+        page = getattr(response, "page", None)
+        if page is not None:
+            return page.result()  # already parsed while the body was read
+        return extract_page(response.content, response.url, response.encoding)
     except Exception as e:
         return None, None
 
 # Fact Check Text Using Google API
-def check_text_fact(text, api_key):
+def check_text_fact(text, api_key, stop_at=None):
     endpoint = "https://factchecktools.googleapis.com/v1alpha1/claims:search"
     params = {"query": text, "key": api_key}
     try:
-        response = requests.get(endpoint, params=params)
+        response = http_client.get(endpoint, params=params, stop_at=stop_at)
         if response.status_code != 200:
             return "Fact Check API inaccessible", None
         data = response.json()
@@ -63,20 +134,44 @@ def check_text_fact(text, api_key):
         return "Error: " + str(e), None
 
 # PyTorch Deepfake Model Setup
-transform_pipeline = transforms.Compose([
-    transforms.Resize((128, 128)),
-    transforms.ToTensor(),
-])
-
 def load_deepfake_model(model_path="deepfake_model.pt"):
-    try:
-        # Load model with weights_only=False (if you trust the checkpoint)
-        model = torch.load(model_path, map_location=torch.device("cpu"), weights_only=False)
-        model.eval()
-        return model
-    except Exception as e:
-        print("Failed to load deepfake model:", e)
-        return None
+    # Served from a TorchScript/ONNX export when one is available (see model_runtime.py)
+    model = load_model("deepfake", model_path)
+    if model is None:
+        print("Failed to load deepfake model")
+    return model
+
+# Bounded pool for downloading, decoding and transforming images
+DEEPFAKE_FETCH_WORKERS = int(os.getenv("DEEPFAKE_FETCH_WORKERS", "8"))
+DEEPFAKE_MAX_BATCH_SIZE = int(os.getenv("DEEPFAKE_MAX_BATCH_SIZE", "32"))
+image_executor = ThreadPoolExecutor(max_workers=DEEPFAKE_FETCH_WORKERS, thread_name_prefix="deepfake-fetch")
+
+class ImageNotAccessible(Exception):
+    pass
+
+# Fetch or open one image and turn it into a model input tensor
+def load_image_tensor(image_source, stop_at=None):
+    """
+    image_source: either a URL (if it starts with 'http') or a local file path.
+    """
+    if image_source.startswith("http"):
+        response = http_client.get(image_source, max_bytes=MAX_IMAGE_BYTES, stop_at=stop_at)
+        if response.status_code != 200:
+            raise ImageNotAccessible()
+        return prepare_image(response.content, "deepfake")
+    return prepare_image(image_source, "deepfake")
+
+# Score a list of image tensors in one forward pass
+def deepfake_scores(image_tensors, model):
+    with torch.no_grad():
+        output = model(normalize_batch(image_tensors, "deepfake"))
+    return output.reshape(len(image_tensors), -1)[:, 0].tolist()
+
+def deepfake_verdict(score):
+    return "Deepfake" if score > 0.5 else "Real"  # Adjust threshold based on your model's output
+
+def score_deepfake_batch(image_tensors, model):
+    return [deepfake_verdict(p) for p in deepfake_scores(image_tensors, model)]
 
 # Check Deepfake on a Single Image
 def check_image_deepfake(image_source, model):
@@ -84,45 +179,125 @@ def check_image_deepfake(image_source, model):
     image_source: either a URL (if it starts with 'http') or a local file path.
     """
     try:
-        if image_source.startswith("http"):
-            response = requests.get(image_source, stream=True)
-            if response.status_code != 200:
-                return "Image not accessible"
-            img = PILImage.open(io.BytesIO(response.content)).convert('RGB')
-        else:
-            img = PILImage.open(image_source).convert('RGB')
-        img = transform_pipeline(img)
-        img = img.unsqueeze(0)  # Add batch dimension
-        with torch.no_grad():
-            output = model(img)
-        prediction = output[0].item()  # Adjust threshold based on your model's output
-        return "Deepfake" if prediction > 0.5 else "Real"
+        return score_deepfake_batch([load_image_tensor(image_source)], model)[0]
+    except ImageNotAccessible:
+        return "Image not accessible"
     except Exception as e:
         return "Invalid Image (" + str(e) + ")"
 
 # Analyze Images for Deepfake
-def check_images_for_deepfake(image_list, model):
+def check_images_for_deepfake(image_list, model, stop_at=None):
     results = {}
-    for img_source in image_list:
-        results[img_source] = check_image_deepfake(img_source, model)
-    return results
+    tensors = {}
+    version = getattr(model, "version", None)  # cached verdicts only count for the weights that made them
+    # Images shared across articles (e.g. CDN assets) are only scored once
+    for img_source in dict.fromkeys(image_list):
+        if img_source.startswith("http"):
+            cached = image_score_cache.get(f"{normalize_url(img_source)}|{version}")
+            if cached is not None:
+                results[img_source] = cached
+
+    # Fetch and decode every distinct uncached image concurrently
+    futures = {src: image_executor.submit(load_image_tensor, src, stop_at)
+               for src in dict.fromkeys(image_list) if src not in results}
+    for img_source, future in futures.items():
+        try:
+            tensors[img_source] = future.result(timeout=time_left(stop_at))
+        except FutureTimeoutError:
+            results[img_source] = TIMED_OUT_VERDICT
+        except ImageNotAccessible:
+            results[img_source] = "Image not accessible"
+        except Exception as e:
+            results[img_source] = "Invalid Image (" + str(e) + ")"
+
+    # The same picture under another URL or path is recognized by its pixels
+    for img_source in list(tensors):
+        cached = deepfake_prediction_cache.get(tensors[img_source], version)
+        if cached is not None:
+            results[img_source] = cached["label"]
+            del tensors[img_source]
+
+    # Score the decoded images in as few forward passes as possible
+    sources = list(tensors)
+    for start in range(0, len(sources), DEEPFAKE_MAX_BATCH_SIZE):
+        chunk = sources[start:start + DEEPFAKE_MAX_BATCH_SIZE]
+        try:
+            scores = deepfake_scores([tensors[src] for src in chunk], model)
+            for img_source, score in zip(chunk, scores):
+                verdict = deepfake_verdict(score)
+                results[img_source] = verdict
+                deepfake_prediction_cache.set(tensors[img_source], version, verdict, score)
+                if img_source.startswith("http"):
+                    image_score_cache.set(f"{normalize_url(img_source)}|{version}", verdict)
+        except Exception as e:
+            for img_source in chunk:
+                results[img_source] = "Invalid Image (" + str(e) + ")"
+    return {img_source: results[img_source] for img_source in image_list}
+
+def time_left(stop_at):
+    """Seconds until stop_at (a time.monotonic() value), None for no deadline"""
+    return None if stop_at is None else max(0.0, stop_at - time.monotonic())
+
+def deadline_passed(stop_at):
+    return stop_at is not None and time.monotonic() >= stop_at
+
+# Pick the fact-check query for an article: its first key claim, else its opening sentences
+def build_fact_check_query(text):
+    try:
+        key_claims = extract_key_claims(text)
+    except Exception:
+        key_claims = []
+    return key_claims[0] if key_claims else ' '.join(text.split('.')[:3])
 
 # Analyze News URL and Return Decision
-def analyze_news_url(url, api_key, model):
-    text, images = scrape_website(url)
+def analyze_news_url(url, api_key, model, response=None, stop_at=None):
+    """
+    response: an already fetched page for url, fetched here if not given.
+    stop_at: time.monotonic() deadline; every fetch is bounded by it and the
+    remaining steps are skipped once it passes.
+    """
+    norm_url = normalize_url(url)
+    timed_out = (TIMED_OUT_VERDICT, "Analysis did not finish before the deadline")
+    if response is None:
+        response = fetch_page(url, stop_at=stop_at)
+    if response is None:
+        return "Rejected", "No text found on page"
+
+    # Unchanged pages reuse the verdict from their last analysis
+    if response.status_code == 304:
+        validator = page_validators.get(norm_url)
+        cached = verdict_cache.get(norm_url + "|" + validator["fingerprint"]) if validator else None
+        if cached is not None:
+            return cached
+        response = fetch_page(url, conditional=False, stop_at=stop_at)
+        if response is None:
+            return "Rejected", "No text found on page"
+    cache_key = None
+    if response.status_code == 200:
+        fingerprint = page_fingerprint(response)
+        cache_key = norm_url + "|" + fingerprint
+        cached = verdict_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        page_validators.set(norm_url, {
+            "fingerprint": fingerprint,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+        })
+
+    text, images = parse_page(response)
     if not text:
         return "Rejected", "No text found on page"
+    if deadline_passed(stop_at):
+        return timed_out
     
-    try:
-        nlp = spacy.load('en_core_web_sm')
-        doc = nlp(text)
-        key_claims = [ent.text for ent in doc.ents if ent.label_ in ['ORG', 'PERSON', 'EVENT']]
-        query_text = key_claims[0] if key_claims else ' '.join(text.split('.')[:3])
-    except Exception:
-        query_text = ' '.join(text.split('.')[:3])
-    
-    text_result, _ = check_text_fact(query_text, api_key)
-    deepfake_results = check_images_for_deepfake(images, model)
+    query_text = build_fact_check_query(text)
+    text_result, _ = check_text_fact(query_text, api_key, stop_at)
+    if deadline_passed(stop_at):
+        return timed_out
+    deepfake_results = check_images_for_deepfake(images, model, stop_at)
+    if deadline_passed(stop_at):
+        return timed_out
     fake_score = sum(1 for v in deepfake_results.values() if "Deepfake" in v) / max(len(deepfake_results), 1)
     
     # Compute a simple confidence measure based on text and image analysis
@@ -132,9 +307,55 @@ def analyze_news_url(url, api_key, model):
         confidence = fake_score * 0.5
     
     if confidence > 0.5:
-        return "Rejected", "Fake indicators detected (Confidence: {:.2f}%)".format(confidence * 100)
+        decision = ("Rejected", "Fake indicators detected (Confidence: {:.2f}%)".format(confidence * 100))
     else:
-        return "Allowed", "Likely genuine (Confidence: {:.2f}%)".format((1 - confidence) * 100)
+        decision = ("Allowed", "Likely genuine (Confidence: {:.2f}%)".format((1 - confidence) * 100))
+    # Don't remember verdicts made while the fact-check API was failing
+    fact_check_failed = text_result.startswith("Error") or text_result == "Fact Check API inaccessible"
+    if cache_key is not None and not fact_check_failed:
+        verdict_cache.set(cache_key, decision)
+    return decision
+
+# Fetch a news page with the async client, then analyze it on the worker pool
+async def analyze_news_url_async(url, api_key, model, client, stop_at):
+    try:
+        response = await client.get(url, max_bytes=SCRAPE_MAX_BYTES, truncate=True,
+                                    headers=conditional_headers(url), stop_at=stop_at, on_response=stream_page)
+    except Exception:
+        return "Rejected", "No text found on page"
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(analysis_executor, analyze_news_url, url, api_key, model, response, stop_at)
+
+async def _analyze_news_urls(news_urls, api_key, model, deadline):
+    client = async_http_client()
+    # Cancelling a task does not stop its executor threads, so the work itself is bounded by stop_at
+    stop_at = time.monotonic() + deadline
+    tasks = {url: asyncio.ensure_future(analyze_news_url_async(url, api_key, model, client, stop_at))
+             for url in news_urls}
+    _, pending = await asyncio.wait(tasks.values(), timeout=deadline)
+    for task in pending:
+        task.cancel()
+
+    decisions = {}
+    for url, task in tasks.items():
+        if task in pending:
+            decisions[url] = (TIMED_OUT_VERDICT, "Analysis did not finish within {:g} seconds".format(deadline))
+        elif task.exception() is not None:
+            decisions[url] = ("Rejected", "Analysis failed: " + str(task.exception()))
+        else:
+            decisions[url] = task.result()
+    return decisions
+
+# Analyze every news URL of a post concurrently
+def analyze_news_urls(news_urls, api_key, model, deadline=ANALYZE_POST_DEADLINE):
+    """
+    Returns {url: (verdict, reason)}. URLs still running when the deadline
+    passes get a "Timed out" verdict instead of failing the whole post.
+    """
+    news_urls = list(dict.fromkeys(news_urls))
+    if not news_urls:
+        return {}
+    return asyncio.run(_analyze_news_urls(news_urls, api_key, model, deadline))
 
 # Analyze Local Images and Return Decision
 def analyze_local_images(image_paths, model):
@@ -148,10 +369,8 @@ def analyze_local_images(image_paths, model):
 def analyze_social_media_post(input_text, api_key, model):
     decisions = {}
     urls = extract_urls(input_text)
-    news_urls = [url for url in urls if is_news_url(url)]
-    for news_url in news_urls:
-        verdict, reason = analyze_news_url(news_url, api_key, model)
-        decisions[news_url] = (verdict, reason)
+    news_urls = filter_news_urls(urls)
+    decisions.update(analyze_news_urls(news_urls, api_key, model))
     
     # Check for local images if provided
     local_images_input = input("Enter local image file paths (comma-separated) for analysis (or leave blank): ").strip()
@@ -0,0 +1,232 @@
+# Near-duplicate complaint detection with MinHash/LSH and location buckets
+import os
+import re
+import time
+import uuid
+import random
+import hashlib
+import datetime
+import threading
+from complaint_store import complaint_store, INCIDENT_PENDING, INCIDENT_READY
+
+DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "1") == "1"
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.5"))  # Estimated Jaccard similarity
+DEDUP_WINDOW_HOURS = float(os.getenv("DEDUP_WINDOW_HOURS", "48"))
+DEDUP_SYNC_SECONDS = float(os.getenv("DEDUP_SYNC_SECONDS", "30"))
+# How long a duplicate waits for the first complaint's analysis; older pending incidents count as abandoned
+DEDUP_PENDING_WAIT_SECONDS = float(os.getenv("DEDUP_PENDING_WAIT_SECONDS", "60"))
+PENDING_POLL_SECONDS = 0.25
+
+# 32 bands of 4 rows: pairs above ~0.45 similarity almost always share a band
+NUM_PERM = 128
+LSH_BANDS = 32
+LSH_ROWS = NUM_PERM // LSH_BANDS
+SHINGLE_SIZE = 3
+
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+_rng = random.Random(20250413)  # Fixed seed: signatures are persisted and must stay comparable
+PERMUTATIONS = [(_rng.randrange(1, MERSENNE_PRIME), _rng.randrange(0, MERSENNE_PRIME)) for _ in range(NUM_PERM)]
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+def normalize_location(location):
+    """Bucket key for a location: lowercase words without punctuation"""
+    return " ".join(TOKEN_PATTERN.findall((location or "").lower()))
+
+def shingles(text):
+    tokens = TOKEN_PATTERN.findall(text.lower())
+    if len(tokens) < SHINGLE_SIZE:
+        return {" ".join(tokens)} if tokens else set()
+    return {" ".join(tokens[i:i + SHINGLE_SIZE]) for i in range(len(tokens) - SHINGLE_SIZE + 1)}
+
+def minhash(text):
+    hashes = [int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "little")
+              for s in shingles(text)]
+    if not hashes:
+        return [MAX_HASH] * NUM_PERM
+    return [min(((a * h + b) % MERSENNE_PRIME) & MAX_HASH for h in hashes) for a, b in PERMUTATIONS]
+
+def estimated_similarity(sig_a, sig_b):
+    return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / NUM_PERM
+
+def band_keys(signature):
+    return [(band, tuple(signature[band * LSH_ROWS:(band + 1) * LSH_ROWS])) for band in range(LSH_BANDS)]
+
+def _now():
+    return datetime.datetime.utcnow()
+
+class IncidentIndex:
+    """
+    In-memory LSH index over recent incidents, one set of band buckets per location.
+    Incidents are persisted in the complaint store; the index periodically pulls in
+    incidents created by other server processes.
+    """
+
+    def __init__(self, store=complaint_store, threshold=DEDUP_THRESHOLD, window_hours=DEDUP_WINDOW_HOURS,
+                 pending_wait=DEDUP_PENDING_WAIT_SECONDS):
+        self.store = store
+        self.threshold = threshold
+        self.window = datetime.timedelta(hours=window_hours)
+        self.pending_wait = pending_wait
+        self.incidents = {}  # id -> incident dict
+        self.buckets = {}  # (location_key, band, rows) -> set of incident ids
+        self.matches = 0
+        self.misses = 0
+        self.waits = 0
+        self._synced_until = None
+        self._last_sync = 0.0
+        self._lock = threading.Lock()
+
+    def _index(self, incident):
+        self.incidents[incident["id"]] = incident
+        for band, rows in band_keys(incident["signature"]):
+            self.buckets.setdefault((incident["location_key"], band, rows), set()).add(incident["id"])
+
+    def _unindex(self, incident_id):
+        incident = self.incidents.pop(incident_id, None)
+        if incident is None:
+            return
+        for band, rows in band_keys(incident["signature"]):
+            key = (incident["location_key"], band, rows)
+            ids = self.buckets.get(key)
+            if ids is not None:
+                ids.discard(incident_id)
+                if not ids:
+                    del self.buckets[key]
+
+    def _sync(self):
+        """Load incidents seen recently (including by other processes) and drop expired ones"""
+        if time.monotonic() - self._last_sync < DEDUP_SYNC_SECONDS:
+            return
+        self._last_sync = time.monotonic()
+        cutoff = (_now() - self.window).isoformat()
+        since = max(cutoff, self._synced_until) if self._synced_until else cutoff
+        try:
+            for incident in self.store.incidents_seen_since(since):
+                self._unindex(incident["id"])
+                if incident["status"] == INCIDENT_READY:
+                    self._index(incident)
+                self._synced_until = max(self._synced_until or "", incident["last_seen"])
+        except Exception as e:
+            print(f"Failed to sync incidents from the complaint store: {e}")
+        for incident_id in [i for i, inc in self.incidents.items() if inc["last_seen"] < cutoff]:
+            self._unindex(incident_id)
+
+    def _closest(self, signature, incidents):
+        """(incident, similarity) of the most similar incident at or above the threshold, or (None, None)"""
+        best, best_score = None, self.threshold
+        for incident in incidents:
+            score = estimated_similarity(signature, incident["signature"])
+            if score >= best_score:
+                best, best_score = incident, score
+        return (best, best_score) if best is not None else (None, None)
+
+    def find(self, text, location):
+        """Return (incident, signature) for the closest recent incident at this location, or (None, signature)"""
+        signature = minhash(text)
+        location_key = normalize_location(location)
+        with self._lock:
+            self._sync()
+            candidates = set()
+            for band, rows in band_keys(signature):
+                candidates |= self.buckets.get((location_key, band, rows), set())
+            best, best_score = self._closest(signature, [self.incidents[i] for i in candidates])
+        if best is None:
+            self.misses += 1
+        else:
+            self.matches += 1
+            print(f"Complaint matches incident {best['id']} (similarity {best_score:.2f})")
+        return best, signature
+
+    def claim(self, text, location):
+        """
+        Find or reserve the incident for a complaint. Returns (incident, report_count, reserved):
+        a ready incident whose analysis can be reused, a new pending incident the caller
+        must complete() or release(), or (None, None, False) when a matching complaint's
+        analysis did not finish in time. report_count includes this complaint.
+        """
+        incident, signature = self.find(text, location)
+        if incident is not None:
+            return incident, self.add_report(incident), False
+        now = _now()
+        pending = {
+            "id": uuid.uuid4().hex,
+            "location_key": normalize_location(location),
+            "signature": signature,
+            "departments": [],
+            "severity": None,
+            "summary": None,
+            "suggestions": [],
+            "report_count": 1,
+            "first_seen": now.isoformat(),
+            "last_seen": now.isoformat(),
+            "status": INCIDENT_PENDING,
+        }
+        # Reserved in the same transaction as the lookup, so a burst of duplicates
+        # (from any process) finds this incident instead of analyzing again
+        incident, count, created = self.store.save_incident_unless_matched(
+            pending, (now - self.window).isoformat(), lambda incidents: self._closest(signature, incidents)[0],
+            pending_since=(now - datetime.timedelta(seconds=self.pending_wait)).isoformat())
+        if created:
+            return incident, count, True
+        with self._lock:
+            self.matches += 1
+        if incident["status"] == INCIDENT_PENDING:
+            print(f"Complaint matches incident {incident['id']}, waiting for its analysis")
+            with self._lock:
+                self.waits += 1
+            incident = self.wait_ready(incident["id"])
+            if incident is None:
+                print("Matching incident's analysis failed or timed out, analyzing this complaint")
+                return None, None, False
+        with self._lock:
+            self._unindex(incident["id"])
+            self._index(incident)
+        return incident, count, False
+
+    def wait_ready(self, incident_id):
+        """Poll the store until a pending incident is ready; None if it is dropped or takes too long"""
+        deadline = time.monotonic() + self.pending_wait
+        while time.monotonic() < deadline:
+            time.sleep(PENDING_POLL_SECONDS)
+            incident = self.store.get_incident(incident_id)
+            if incident is None:
+                return None
+            if incident["status"] == INCIDENT_READY:
+                return incident
+        return None
+
+    def complete(self, incident, departments, severity, summary, suggestions):
+        """Store the analysis of an incident reserved by claim() and return (incident, report_count)"""
+        incident = self.store.complete_incident(incident["id"], departments, severity, summary, suggestions)
+        with self._lock:
+            self._unindex(incident["id"])
+            self._index(incident)
+        return incident, incident["report_count"]
+
+    def release(self, incident):
+        """Give up an incident reserved by claim() whose analysis failed"""
+        self.store.delete_pending_incident(incident["id"])
+
+    def add_report(self, incident):
+        """Record another complaint against an incident and return its report count"""
+        now = _now().isoformat()
+        count = self.store.add_incident_report(incident["id"], now)
+        with self._lock:
+            if incident["id"] in self.incidents:
+                self.incidents[incident["id"]]["report_count"] = count
+                self.incidents[incident["id"]]["last_seen"] = now
+        return count
+
+    def stats(self):
+        return {
+            "enabled": DEDUP_ENABLED,
+            "threshold": self.threshold,
+            "indexed_incidents": len(self.incidents),
+            "matches": self.matches,
+            "misses": self.misses,
+            "waits": self.waits,
+        }
+
+incident_index = IncidentIndex()
@@ -0,0 +1,461 @@
+# Indexed complaint store backed by SQLite in WAL mode
+import os
+import sys
+import json
+import uuid
+import queue
+import sqlite3
+import argparse
+import datetime
+import threading
+
+COMPLAINT_DB_PATH = os.getenv("COMPLAINT_DB_PATH", "complaints.sqlite3")
+COMPLAINT_STORE_BATCH_SIZE = int(os.getenv("COMPLAINT_STORE_BATCH_SIZE", "64"))
+COMPLAINT_STORE_FLUSH_MS = float(os.getenv("COMPLAINT_STORE_FLUSH_MS", "50"))
+MAX_QUERY_LIMIT = 1000
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS complaints (
+        id TEXT PRIMARY KEY,
+        timestamp TEXT NOT NULL,
+        location TEXT NOT NULL,
+        severity INTEGER,
+        summary TEXT,
+        original_text TEXT NOT NULL,
+        departments TEXT NOT NULL,
+        contact_details TEXT,
+        suggestions TEXT,
+        image_analysis TEXT,
+        complainer_view TEXT,
+        officer_view TEXT,
+        status TEXT NOT NULL DEFAULT 'Pending',
+        incident_id TEXT,
+        department_source TEXT
+    )""",
+    # Near-duplicate complaints about the same problem are grouped into one incident
+    """CREATE TABLE IF NOT EXISTS complaint_incidents (
+        id TEXT PRIMARY KEY,
+        location_key TEXT NOT NULL,
+        signature TEXT NOT NULL,
+        departments TEXT NOT NULL,
+        severity INTEGER,
+        summary TEXT,
+        suggestions TEXT,
+        report_count INTEGER NOT NULL DEFAULT 1,
+        first_seen TEXT NOT NULL,
+        last_seen TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'ready'
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_complaint_incidents_last_seen ON complaint_incidents (last_seen)",
+    "CREATE INDEX IF NOT EXISTS idx_complaint_incidents_location ON complaint_incidents (location_key, last_seen)",
+    # One row per (complaint, department) so department filters can use an index
+    """CREATE TABLE IF NOT EXISTS complaint_departments (
+        department TEXT NOT NULL,
+        complaint_id TEXT NOT NULL REFERENCES complaints (id),
+        PRIMARY KEY (department, complaint_id)
+    ) WITHOUT ROWID""",
+    "CREATE INDEX IF NOT EXISTS idx_complaints_timestamp ON complaints (timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_complaints_severity ON complaints (severity, timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_complaints_location ON complaints (location, timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_complaint_departments_complaint ON complaint_departments (complaint_id)",
+]
+
+# Columns added after the first release, applied to older databases on connect
+MIGRATIONS = [
+    ("complaints", "incident_id", "ALTER TABLE complaints ADD COLUMN incident_id TEXT"),
+    ("complaints", "department_source", "ALTER TABLE complaints ADD COLUMN department_source TEXT"),
+    ("complaint_incidents", "status", "ALTER TABLE complaint_incidents ADD COLUMN status TEXT NOT NULL DEFAULT 'ready'"),
+]
+POST_MIGRATION_SCHEMA = [
+    "CREATE INDEX IF NOT EXISTS idx_complaints_incident ON complaints (incident_id)",
+]
+
+# Columns stored as JSON text
+JSON_COLUMNS = ("departments", "contact_details", "suggestions", "signature")
+COLUMNS = ("id", "timestamp", "location", "severity", "summary", "original_text", "departments",
+           "contact_details", "suggestions", "image_analysis", "complainer_view", "officer_view", "status",
+           "incident_id", "department_source")
+INCIDENT_COLUMNS = ("id", "location_key", "signature", "departments", "severity", "summary", "suggestions",
+                    "report_count", "first_seen", "last_seen", "status")
+
+# An incident is pending while the complaint that started it is being analyzed
+INCIDENT_PENDING, INCIDENT_READY = "pending", "ready"
+
+def new_complaint_id():
+    return uuid.uuid4().hex
+
+class ComplaintStore:
+    """
+    Complaints are queued by add() and written by a single background thread that
+    commits everything waiting in one transaction (group commit). Reads use their
+    own per-thread connections, which WAL mode lets run alongside the writer.
+    """
+
+    def __init__(self, path=COMPLAINT_DB_PATH, batch_size=COMPLAINT_STORE_BATCH_SIZE,
+                 flush_ms=COMPLAINT_STORE_FLUSH_MS):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_ms / 1000.0
+        self.written = 0
+        self.commits = 0
+        self.write_errors = 0
+        self._queue = None
+        self._writer = None
+        self._pid = None
+        self._enqueued = 0
+        self._committed = 0
+        self._lock = threading.Lock()
+        self._committed_cond = threading.Condition()
+        self._local = threading.local()
+        self._schema_ready = False
+
+    def connect(self):
+        """Connection for the calling thread, reopened after a fork"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            if not self._schema_ready:
+                with conn:
+                    for statement in SCHEMA:
+                        conn.execute(statement)
+                    for table, column, statement in MIGRATIONS:
+                        existing = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+                        if column not in existing:
+                            conn.execute(statement)
+                    for statement in POST_MIGRATION_SCHEMA:
+                        conn.execute(statement)
+                self._schema_ready = True
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    # === Writes ===
+
+    def _ensure_writer(self):
+        if self._pid == os.getpid() and self._writer.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._writer.is_alive():
+                return
+            self._queue = queue.Queue()
+            self._enqueued = self._committed = 0
+            self._writer = threading.Thread(target=self._write_loop, name="complaint-store-writer", daemon=True)
+            self._pid = os.getpid()
+            self._writer.start()
+
+    def add(self, record):
+        """Queue a complaint for writing and return its id"""
+        self._ensure_writer()
+        record = dict(record)
+        record.setdefault("id", new_complaint_id())
+        record.setdefault("timestamp", datetime.datetime.utcnow().isoformat())
+        record.setdefault("status", "Pending")
+        with self._lock:
+            self._enqueued += 1
+            self._queue.put(record)
+        return record["id"]
+
+    def flush(self, timeout=None):
+        """Block until every complaint queued so far has been committed"""
+        if self._queue is None or self._pid != os.getpid():
+            return True
+        target = self._enqueued
+        with self._committed_cond:
+            return self._committed_cond.wait_for(lambda: self._committed >= target, timeout=timeout)
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        # Give concurrent requests a moment to join this transaction
+        try:
+            while len(batch) < self.batch_size:
+                batch.append(self._queue.get(timeout=self.flush_interval))
+        except queue.Empty:
+            pass
+        return batch
+
+    def _write_loop(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                self._write_batch(batch)
+                self.written += len(batch)
+                self.commits += 1
+            except Exception as e:
+                print(f"Error writing {len(batch)} complaints to {self.path}: {e}, retrying one at a time")
+                self._write_each(batch)
+            with self._committed_cond:
+                self._committed += len(batch)
+                self._committed_cond.notify_all()
+
+    def _write_each(self, batch):
+        """Write a failed batch record by record, so one bad record does not take the others with it"""
+        for record in batch:
+            try:
+                self._write_batch([record])
+                self.written += 1
+                self.commits += 1
+            except Exception as e:
+                self.write_errors += 1
+                print(f"Dropped complaint {record.get('id')}: {e}")
+
+    def _write_batch(self, batch):
+        conn = self.connect()
+        rows = []
+        department_rows = []
+        for record in batch:
+            row = {c: record.get(c) for c in COLUMNS}
+            for c in JSON_COLUMNS:
+                if c not in row:
+                    continue
+                row[c] = json.dumps(row[c] if row[c] is not None else ([] if c != "contact_details" else {}))
+            rows.append(tuple(row[c] for c in COLUMNS))
+            department_rows.extend((d, record["id"]) for d in dict.fromkeys(record.get("departments") or []))
+        with conn:
+            conn.executemany(
+                f"INSERT OR REPLACE INTO complaints ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+                rows)
+            conn.executemany("DELETE FROM complaint_departments WHERE complaint_id = ?",
+                             [(record["id"],) for record in batch])
+            conn.executemany("INSERT OR IGNORE INTO complaint_departments (department, complaint_id) VALUES (?, ?)",
+                             department_rows)
+
+    def update_status(self, complaint_id, status):
+        conn = self.connect()
+        with conn:
+            cur = conn.execute("UPDATE complaints SET status = ? WHERE id = ?", (status, complaint_id))
+        return cur.rowcount > 0
+
+    # === Reads ===
+
+    @staticmethod
+    def _row_to_dict(row):
+        record = dict(row)
+        for c in JSON_COLUMNS:
+            if record.get(c) is not None:
+                record[c] = json.loads(record[c])
+        return record
+
+    def get(self, complaint_id):
+        row = self.connect().execute("SELECT * FROM complaints WHERE id = ?", (complaint_id,)).fetchone()
+        return self._row_to_dict(row) if row else None
+
+    def query(self, department=None, min_severity=None, max_severity=None, since=None, until=None,
+              location=None, status=None, limit=100, offset=0):
+        """
+        List complaints newest first. since/until are ISO timestamps (or datetimes),
+        e.g. query(department="Sanitation", min_severity=4, since=week_ago).
+        """
+        clauses = []
+        params = []
+        if department:
+            clauses.append("c.id IN (SELECT complaint_id FROM complaint_departments WHERE department = ?)")
+            params.append(department)
+        if min_severity is not None:
+            clauses.append("c.severity >= ?")
+            params.append(int(min_severity))
+        if max_severity is not None:
+            clauses.append("c.severity <= ?")
+            params.append(int(max_severity))
+        if since:
+            clauses.append("c.timestamp >= ?")
+            params.append(since.isoformat() if isinstance(since, datetime.datetime) else since)
+        if until:
+            clauses.append("c.timestamp < ?")
+            params.append(until.isoformat() if isinstance(until, datetime.datetime) else until)
+        if location:
+            clauses.append("c.location = ?")
+            params.append(location)
+        if status:
+            clauses.append("c.status = ?")
+            params.append(status)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        params.extend([min(int(limit), MAX_QUERY_LIMIT), int(offset)])
+        rows = self.connect().execute(
+            f"SELECT c.* FROM complaints c {where} ORDER BY c.timestamp DESC LIMIT ? OFFSET ?", params).fetchall()
+        return [self._row_to_dict(row) for row in rows]
+
+    def count(self):
+        return self.connect().execute("SELECT COUNT(*) FROM complaints").fetchone()[0]
+
+    def department_examples(self, source="llm", since=None, limit=None):
+        """(text, departments) pairs whose departments came from the given source, oldest first"""
+        params = [source]
+        where = "WHERE department_source = ?"
+        if since:
+            where += " AND timestamp >= ?"
+            params.append(since.isoformat() if isinstance(since, datetime.datetime) else since)
+        sql = f"SELECT original_text, departments FROM complaints {where} ORDER BY timestamp"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+        return [(row[0], json.loads(row[1])) for row in self.connect().execute(sql, params)]
+
+    # === Incidents ===
+
+    def save_incident_unless_matched(self, incident, since, closest, pending_since=None):
+        """
+        Insert incident unless closest(recent incidents at its location) picks an
+        existing one, which gets a report instead. The lookup and the write share one
+        write transaction, so concurrent creators (threads or processes) cannot both
+        insert. Pending incidents first seen before pending_since are treated as
+        abandoned. Returns (stored incident, report count, created).
+        """
+        conn = self.connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                "SELECT * FROM complaint_incidents WHERE location_key = ? AND last_seen >= ? "
+                "AND (status = ? OR first_seen >= ?)",
+                (incident["location_key"], since, INCIDENT_READY, pending_since or "")).fetchall()
+            match = closest([self._row_to_dict(row) for row in rows])
+            if match is not None:
+                conn.execute("UPDATE complaint_incidents SET report_count = report_count + 1, last_seen = ? "
+                             "WHERE id = ?", (incident["last_seen"], match["id"]))
+                match["report_count"] += 1
+                match["last_seen"] = incident["last_seen"]
+                result = (match, match["report_count"], False)
+            else:
+                row = {c: incident.get(c) for c in INCIDENT_COLUMNS}
+                for c in ("signature", "departments", "suggestions"):
+                    row[c] = json.dumps(row[c] or [])
+                conn.execute(
+                    f"INSERT INTO complaint_incidents ({', '.join(INCIDENT_COLUMNS)}) "
+                    f"VALUES ({', '.join('?' * len(INCIDENT_COLUMNS))})",
+                    tuple(row[c] for c in INCIDENT_COLUMNS))
+                result = (incident, incident["report_count"], True)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return result
+
+    def complete_incident(self, incident_id, departments, severity, summary, suggestions):
+        """Store the analysis of a pending incident, mark it ready and return it"""
+        conn = self.connect()
+        with conn:
+            conn.execute("UPDATE complaint_incidents SET departments = ?, severity = ?, summary = ?, suggestions = ?, "
+                         "status = ? WHERE id = ?",
+                         (json.dumps(departments), severity, summary, json.dumps(suggestions or []),
+                          INCIDENT_READY, incident_id))
+        return self.get_incident(incident_id)
+
+    def delete_pending_incident(self, incident_id):
+        """Drop an incident whose analysis failed; complaints waiting on it analyze themselves"""
+        conn = self.connect()
+        with conn:
+            conn.execute("DELETE FROM complaint_incidents WHERE id = ? AND status = ?", (incident_id, INCIDENT_PENDING))
+
+    def add_incident_report(self, incident_id, seen_at):
+        """Count one more report against an incident and return the new total"""
+        conn = self.connect()
+        with conn:
+            conn.execute("UPDATE complaint_incidents SET report_count = report_count + 1, last_seen = ? WHERE id = ?",
+                         (seen_at, incident_id))
+            row = conn.execute("SELECT report_count FROM complaint_incidents WHERE id = ?", (incident_id,)).fetchone()
+        return row[0] if row else None
+
+    def get_incident(self, incident_id):
+        row = self.connect().execute("SELECT * FROM complaint_incidents WHERE id = ?", (incident_id,)).fetchone()
+        return self._row_to_dict(row) if row else None
+
+    def incidents_seen_since(self, since):
+        rows = self.connect().execute(
+            "SELECT * FROM complaint_incidents WHERE last_seen >= ? ORDER BY last_seen", (since,)).fetchall()
+        return [self._row_to_dict(row) for row in rows]
+
+    def list_incidents(self, since=None, min_reports=1, limit=100):
+        """Incidents for officers, most reported first (signatures left out)"""
+        params = [INCIDENT_READY, int(min_reports)]
+        where = "WHERE status = ? AND report_count >= ?"
+        if since:
+            where += " AND last_seen >= ?"
+            params.append(since.isoformat() if isinstance(since, datetime.datetime) else since)
+        params.append(min(int(limit), MAX_QUERY_LIMIT))
+        rows = self.connect().execute(
+            f"SELECT * FROM complaint_incidents {where} ORDER BY report_count DESC, last_seen DESC LIMIT ?",
+            params).fetchall()
+        incidents = []
+        for row in rows:
+            incident = self._row_to_dict(row)
+            incident.pop("signature", None)
+            incidents.append(incident)
+        return incidents
+
+    def stats(self):
+        return {
+            "path": self.path,
+            "written": self.written,
+            "commits": self.commits,
+            "write_errors": self.write_errors,
+            "pending_writes": self._queue.qsize() if self._queue is not None else 0,
+        }
+
+complaint_store = ComplaintStore()
+
+def read_legacy_json(path):
+    """Parse the old officer_output.json format: JSON objects separated by trailing commas"""
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as f:
+        content = f.read()
+    records = []
+    pos = 0
+    while True:
+        while pos < len(content) and content[pos] in " \t\r\n,":
+            pos += 1
+        if pos >= len(content):
+            break
+        record, pos = decoder.raw_decode(content, pos)
+        records.append(record)
+    return records
+
+def import_legacy_json(path, store=complaint_store):
+    """Load complaints from an old officer_output.json into the store"""
+    count = 0
+    for record in read_legacy_json(path):
+        if not record.get("original_text"):
+            continue
+        # Stable ids so importing the same file twice does not duplicate rows
+        legacy_id = uuid.uuid5(uuid.NAMESPACE_URL, f"{record.get('timestamp')}|{record['original_text']}").hex
+        store.add({
+            "id": legacy_id,
+            "timestamp": record.get("timestamp"),
+            "location": record.get("location") or "",
+            "severity": record.get("severity"),
+            "summary": record.get("summary"),
+            "original_text": record["original_text"],
+            "departments": record.get("departments") or [],
+            "image_analysis": record.get("image_analysis"),
+        })
+        count += 1
+    store.flush()
+    return count
+
+# CLI entry point
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query or import into the complaint store")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    import_parser = subparsers.add_parser("import-legacy", help="import an old officer_output.json file")
+    import_parser.add_argument("path")
+    query_parser = subparsers.add_parser("query", help="list complaints as JSON")
+    query_parser.add_argument("--department")
+    query_parser.add_argument("--min-severity", type=int)
+    query_parser.add_argument("--days", type=float, help="only complaints from the last N days")
+    query_parser.add_argument("--location")
+    query_parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.command == "import-legacy":
+        imported = import_legacy_json(args.path)
+        print(f"Imported {imported} complaints into {complaint_store.path}")
+    else:
+        since = None
+        if args.days:
+            since = datetime.datetime.utcnow() - datetime.timedelta(days=args.days)
+        results = complaint_store.query(department=args.department, min_severity=args.min_severity,
+                                        since=since, location=args.location, limit=args.limit)
+        json.dump(results, sys.stdout, indent=2)
+        print()
@@ -0,0 +1,267 @@
+# Local TF-IDF + logistic regression department classifier, trained on LLM-labeled complaints
+import os
+import sys
+import json
+import time
+import pickle
+import random
+import hashlib
+import argparse
+import datetime
+import threading
+import numpy as np
+from complaint_store import complaint_store
+
+DEPT_CLASSIFIER_ENABLED = os.getenv("DEPT_CLASSIFIER_ENABLED", "1") == "1"
+DEPT_CLASSIFIER_PATH = os.getenv("DEPT_CLASSIFIER_PATH", "department_classifier.pkl")
+DEPT_CLASSIFIER_THRESHOLD = float(os.getenv("DEPT_CLASSIFIER_THRESHOLD", "0.85"))
+MIN_TRAINING_EXAMPLES = 50
+MODEL_FORMAT_VERSION = 1
+
+def text_fingerprint(text):
+    """Short hash identifying a training complaint without storing its text"""
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+def sigmoid(z):
+    return 1.0 / (1.0 + np.exp(-z))
+
+class DepartmentModel:
+    """
+    One binary logistic regression per department over shared TF-IDF features.
+    The per-department weights are stacked into one matrix so a prediction is a
+    single sparse matrix product.
+    """
+
+    def __init__(self, vectorizer, departments, weights, bias):
+        self.vectorizer = vectorizer
+        self.departments = departments
+        self.weights = weights  # (n_features, n_departments)
+        self.bias = bias  # (n_departments,)
+        self.trained_at = None
+        self.examples = 0
+        self.trained_on = frozenset()  # fingerprints of the training texts
+
+    @classmethod
+    def fit(cls, texts, labels, C=4.0):
+        # scikit-learn is only needed to train and to transform; imported lazily so
+        # the server still starts (and uses the LLM) without it
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        from sklearn.linear_model import LogisticRegression
+
+        departments = sorted({d for depts in labels for d in depts})
+        vectorizer = TfidfVectorizer(ngram_range=(1, 2), sublinear_tf=True, min_df=2, strip_accents="unicode")
+        X = vectorizer.fit_transform(texts)
+        weights = np.zeros((X.shape[1], len(departments)))
+        bias = np.zeros(len(departments))
+        for j, dept in enumerate(departments):
+            y = np.array([dept in depts for depts in labels])
+            if y.all() or not y.any():
+                # Only one class seen: a constant log-odds from a smoothed prior
+                rate = (y.sum() + 0.5) / (len(y) + 1)
+                bias[j] = np.log(rate / (1 - rate))
+                continue
+            clf = LogisticRegression(C=C, max_iter=1000, class_weight="balanced")
+            clf.fit(X, y)
+            weights[:, j] = clf.coef_[0]
+            bias[j] = clf.intercept_[0]
+        model = cls(vectorizer, departments, weights, bias)
+        model.trained_at = datetime.datetime.utcnow().isoformat()
+        model.examples = len(texts)
+        model.trained_on = frozenset(text_fingerprint(t) for t in texts)
+        return model
+
+    def predict_proba_batch(self, texts):
+        X = self.vectorizer.transform(texts)
+        return sigmoid(np.asarray(X @ self.weights) + self.bias)
+
+    def predict_proba(self, text):
+        """{department: probability} for one complaint"""
+        return dict(zip(self.departments, self.predict_proba_batch([text])[0].tolist()))
+
+    @staticmethod
+    def decide(probs, threshold):
+        """Departments from one probability row, or None when any department is uncertain"""
+        if any(1 - threshold < p < threshold for p in probs.values()):
+            return None
+        departments = [d for d, p in probs.items() if p >= threshold]
+        return departments or None
+
+    def save(self, path):
+        # Plain components rather than this class, which may be __main__.DepartmentModel when run as a script
+        data = {
+            "version": MODEL_FORMAT_VERSION,
+            "vectorizer": self.vectorizer,
+            "departments": self.departments,
+            "weights": self.weights,
+            "bias": self.bias,
+            "trained_at": self.trained_at,
+            "examples": self.examples,
+            "trained_on": self.trained_on,
+        }
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(data, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            data = pickle.load(f)
+        if data.get("version") != MODEL_FORMAT_VERSION:
+            raise ValueError(f"Unsupported department model format {data.get('version')}")
+        model = cls(data["vectorizer"], data["departments"], data["weights"], data["bias"])
+        model.trained_at = data["trained_at"]
+        model.examples = data["examples"]
+        model.trained_on = data.get("trained_on", frozenset())  # absent in models saved before it was recorded
+        return model
+
+class DepartmentClassifier:
+    """Loads the trained model on first use and again whenever the file is replaced"""
+
+    def __init__(self, path=DEPT_CLASSIFIER_PATH, threshold=DEPT_CLASSIFIER_THRESHOLD):
+        self.path = path
+        self.threshold = threshold
+        self.model = None
+        self.confident = 0
+        self.uncertain = 0
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    def get_model(self):
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            return None
+        if mtime != self._mtime:
+            with self._lock:
+                if mtime != self._mtime:
+                    try:
+                        self.model = DepartmentModel.load(self.path)
+                        print(f"Loaded department classifier trained on {self.model.examples} complaints")
+                    except Exception as e:
+                        print(f"Error loading department classifier: {e}")
+                        self.model = None
+                    self._mtime = mtime
+        return self.model
+
+    def classify(self, text):
+        """Departments when the local model is confident, otherwise None (ask the LLM)"""
+        if not DEPT_CLASSIFIER_ENABLED:
+            return None
+        model = self.get_model()
+        if model is None:
+            return None
+        try:
+            departments = model.decide(model.predict_proba(text), self.threshold)
+        except Exception as e:
+            print(f"Error in local department classifier: {e}")
+            return None
+        if departments is None:
+            self.uncertain += 1
+        else:
+            self.confident += 1
+        return departments
+
+    def stats(self):
+        return {
+            "enabled": DEPT_CLASSIFIER_ENABLED,
+            "loaded": self.model is not None,
+            "threshold": self.threshold,
+            "trained_at": self.model.trained_at if self.model else None,
+            "confident": self.confident,
+            "uncertain": self.uncertain,
+        }
+
+department_classifier = DepartmentClassifier()
+
+# === Training and evaluation ===
+
+def evaluate(model, texts, labels, threshold=DEPT_CLASSIFIER_THRESHOLD):
+    """Agreement of the model with the LLM labels, overall and on the confident subset"""
+    start = time.perf_counter()
+    probs = model.predict_proba_batch(texts)
+    per_text_ms = (time.perf_counter() - start) * 1000 / max(len(texts), 1)
+    exact = confident = confident_exact = 0
+    per_department = {d: {"tp": 0, "fp": 0, "fn": 0} for d in model.departments}
+    for row, expected in zip(probs, labels):
+        expected = set(expected)
+        row = dict(zip(model.departments, row.tolist()))
+        predicted = {d for d, p in row.items() if p >= 0.5}
+        exact += predicted == expected
+        for d in model.departments:
+            counts = per_department[d]
+            if d in predicted and d in expected:
+                counts["tp"] += 1
+            elif d in predicted:
+                counts["fp"] += 1
+            elif d in expected:
+                counts["fn"] += 1
+        decided = model.decide(row, threshold)
+        if decided is not None:
+            confident += 1
+            confident_exact += set(decided) == expected
+    f1 = {}
+    for d, c in per_department.items():
+        denominator = 2 * c["tp"] + c["fp"] + c["fn"]
+        f1[d] = round(2 * c["tp"] / denominator, 4) if denominator else None
+    n = len(texts)
+    return {
+        "examples": n,
+        "exact_agreement": round(exact / n, 4) if n else None,
+        "threshold": threshold,
+        "coverage": round(confident / n, 4) if n else None,  # share answered without the LLM
+        "confident_agreement": round(confident_exact / confident, 4) if confident else None,
+        "f1_per_department": f1,
+        "ms_per_complaint": round(per_text_ms, 4),
+    }
+
+def train(store=complaint_store, path=DEPT_CLASSIFIER_PATH, test_size=0.2, threshold=DEPT_CLASSIFIER_THRESHOLD,
+          seed=13):
+    """Evaluate on a held-out split, then refit on every LLM-labeled complaint and save"""
+    examples = [(t, d) for t, d in store.department_examples(source="llm") if t and d]
+    if len(examples) < MIN_TRAINING_EXAMPLES:
+        raise ValueError(f"Need at least {MIN_TRAINING_EXAMPLES} LLM-labeled complaints, found {len(examples)}")
+    random.Random(seed).shuffle(examples)
+    held_out = max(1, int(len(examples) * test_size))
+    test, training = examples[:held_out], examples[held_out:]
+    model = DepartmentModel.fit([t for t, _ in training], [d for _, d in training])
+    report = evaluate(model, [t for t, _ in test], [d for _, d in test], threshold)
+    model = DepartmentModel.fit([t for t, _ in examples], [d for _, d in examples])
+    model.save(path)
+    report["trained_on"] = len(examples)
+    report["path"] = path
+    return report
+
+# CLI entry point
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train or evaluate the local department classifier")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    train_parser = subparsers.add_parser("train", help="train on LLM-labeled complaints and save the model")
+    train_parser.add_argument("--test-size", type=float, default=0.2)
+    eval_parser = subparsers.add_parser(
+        "evaluate", help="compare the saved model with LLM labels of complaints it was not trained on")
+    eval_parser.add_argument("--days", type=float, help="only complaints from the last N days")
+    for sub in (train_parser, eval_parser):
+        sub.add_argument("--threshold", type=float, default=DEPT_CLASSIFIER_THRESHOLD)
+    args = parser.parse_args()
+
+    if args.command == "train":
+        result = train(test_size=args.test_size, threshold=args.threshold)
+    else:
+        model = department_classifier.get_model()
+        if model is None:
+            sys.exit(f"No department classifier at {DEPT_CLASSIFIER_PATH}, run the train command first")
+        since = None
+        if args.days:
+            since = datetime.datetime.utcnow() - datetime.timedelta(days=args.days)
+        if not model.trained_on:
+            sys.exit("The saved model does not record its training complaints, run the train command again")
+        examples = [(t, d) for t, d in complaint_store.department_examples(source="llm", since=since) if t and d]
+        # The saved model is fit on every labeled complaint, so only later ones are unseen
+        unseen = [(t, d) for t, d in examples if text_fingerprint(t) not in model.trained_on]
+        if not unseen:
+            sys.exit("No LLM-labeled complaints the model was not trained on, evaluate again after new ones arrive")
+        result = evaluate(model, [t for t, _ in unseen], [d for _, d in unseen], args.threshold)
+        result["skipped_training_examples"] = len(examples) - len(unseen)
+    json.dump(result, sys.stdout, indent=2)
+    print()
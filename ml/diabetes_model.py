@@ -0,0 +1,182 @@
+# Diabetes screening with the Pima SVC model: records from JSON, CSV or Arrow, scored in one vectorized call
+import os
+import io
+import csv
+import pickle
+import warnings
+import numpy as np
+from lazy_resource import LazyResource
+
+DIABETES_MODEL_PATH = os.getenv(
+    "DIABETES_MODEL_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "health0check-feature", "diabetes_model.sav"))
+DIABETES_MAX_RECORDS = int(os.getenv("DIABETES_MAX_RECORDS", "100000"))
+
+# Column order the model was trained with
+FEATURES = ["Pregnancies", "Glucose", "BloodPressure", "SkinThickness", "Insulin", "BMI",
+            "DiabetesPedigreeFunction", "Age"]
+POSITIVE_LABEL, NEGATIVE_LABEL = "Diabetes Detected", "No Diabetes Detected"
+
+def feature_key(name):
+    """'Blood Pressure', 'blood_pressure' and 'BloodPressure' all name the same column"""
+    return "".join(ch for ch in str(name).lower() if ch.isalnum())
+
+FEATURE_KEYS = {feature_key(f): i for i, f in enumerate(FEATURES)}
+
+def file_signature(path):
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+def load_diabetes_model(path=DIABETES_MODEL_PATH):
+    # Only load pickles you trust
+    with open(path, "rb") as f:
+        model = pickle.load(f)
+    model.source_signature = file_signature(path)
+    print(f"Loaded diabetes model from {path}")
+    return model
+
+def diabetes_model_changed(model):
+    try:
+        return file_signature(DIABETES_MODEL_PATH) != model.source_signature
+    except OSError:
+        return False
+
+diabetes_model = LazyResource("diabetes_model", load_diabetes_model, is_stale=diabetes_model_changed)
+
+# === Input parsing: every format ends as one (n, 8) float array ===
+
+def column_order(names):
+    """Index of each model feature among the given column names"""
+    positions = {}
+    for i, name in enumerate(names):
+        key = feature_key(name)
+        if key in FEATURE_KEYS:
+            positions[key] = i
+    missing = [f for f in FEATURES if feature_key(f) not in positions]
+    if missing:
+        raise ValueError(f"Missing fields: {', '.join(missing)}")
+    return [positions[feature_key(f)] for f in FEATURES]
+
+def check_records(X):
+    if X.ndim != 2 or X.shape[1] != len(FEATURES):
+        raise ValueError(f"Each record needs {len(FEATURES)} values: {', '.join(FEATURES)}")
+    if len(X) == 0:
+        raise ValueError("No records")
+    if len(X) > DIABETES_MAX_RECORDS:
+        raise ValueError(f"At most {DIABETES_MAX_RECORDS} records per request")
+    bad = np.flatnonzero(~np.isfinite(X).all(axis=1))
+    if len(bad):
+        raise ValueError(f"Record {int(bad[0])} has a missing or non-numeric value")
+    return X
+
+def records_from_json(data):
+    """
+    A single record ({"Glucose": 148, ...}), a list of records, or
+    {"records": [...]}; a record may also be a list of values in FEATURES order.
+    """
+    if isinstance(data, dict) and "records" in data:
+        data = data["records"]
+    rows = data if isinstance(data, list) else [data]
+    if rows and all(isinstance(row, dict) for row in rows):
+        # Assume every record uses the first record's field names (the common case),
+        # and fall back to per-record lookups when they differ
+        names = list(rows[0])
+        order = column_order(names)
+        keys = [names[i] for i in order]
+        try:
+            values = [[row[k] for k in keys] for row in rows]
+        except KeyError:
+            values = []
+            for row in rows:
+                row_names = list(row)
+                values.append([row[row_names[i]] for i in column_order(row_names)])
+    elif rows and all(isinstance(row, list) for row in rows):
+        values = rows
+    else:
+        raise ValueError("Records must be objects keyed by field name or lists of values")
+    try:
+        X = np.array(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        raise ValueError("All values must be numbers")
+    return check_records(X)
+
+def records_from_csv(stream):
+    """CSV with a header row naming the fields; extra columns are ignored"""
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    reader = csv.reader(text)
+    header = next(reader, None)
+    if header is None:
+        raise ValueError("Empty CSV")
+    order = column_order(header)
+    rows = [[row[i] if i < len(row) else "" for i in order] for row in reader if row]
+    try:
+        X = np.array(rows, dtype=np.float64) if rows else np.empty((0, len(FEATURES)))
+    except ValueError:
+        X = np.array([[float(v) if v.strip() else np.nan for v in row] for row in rows])
+    return check_records(X)
+
+def records_from_arrow(stream, parquet=False):
+    """Arrow IPC (file or stream format) or Parquet, with pyarrow if it is installed"""
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise ValueError("Arrow and Parquet uploads need the optional pyarrow package; send CSV or JSON instead")
+    data = stream.read()
+    if parquet:
+        import pyarrow.parquet as pq
+        table = pq.read_table(pa.BufferReader(data))
+    else:
+        try:
+            table = pa.ipc.open_file(pa.BufferReader(data)).read_all()
+        except pa.ArrowInvalid:
+            table = pa.ipc.open_stream(pa.BufferReader(data)).read_all()
+    order = column_order(table.column_names)
+    columns = [table.column(i).to_numpy(zero_copy_only=False).astype(np.float64) for i in order]
+    return check_records(np.column_stack(columns) if len(table) else np.empty((0, len(FEATURES))))
+
+# === Prediction ===
+
+def predict(model, X):
+    """
+    Labels and scores for every row of X in one call each. SVC decision scores
+    are always returned; probabilities only when the model was trained with
+    probability estimates (SVC(probability=True)), since they are otherwise undefined.
+    """
+    with warnings.catch_warnings():
+        # Trained on a DataFrame; plain arrays in FEATURES order are equivalent
+        warnings.filterwarnings("ignore", message="X does not have valid feature names")
+        labels = model.predict(X)
+        scores = model.decision_function(X) if hasattr(model, "decision_function") else None
+        probabilities = None
+        if getattr(model, "probability", True) and hasattr(model, "predict_proba"):
+            probabilities = model.predict_proba(X)[:, list(model.classes_).index(1)]
+    return labels, scores, probabilities
+
+def prediction_records(labels, scores, probabilities):
+    positive = labels == 1
+    results = []
+    for i in range(len(labels)):
+        result = {"label": POSITIVE_LABEL if positive[i] else NEGATIVE_LABEL, "diabetic": bool(positive[i])}
+        if scores is not None:
+            result["score"] = round(float(scores[i]), 4)
+        if probabilities is not None:
+            result["probability"] = round(float(probabilities[i]), 4)
+        results.append(result)
+    return results
+
+def predictions_csv(X, labels, scores, probabilities):
+    """The input rows with the predictions appended, as CSV text"""
+    out = io.StringIO()
+    writer = csv.writer(out)
+    extra = ["label", "diabetic"] + (["score"] if scores is not None else []) + \
+            (["probability"] if probabilities is not None else [])
+    writer.writerow(FEATURES + extra)
+    for i, row in enumerate(X.tolist()):
+        positive = labels[i] == 1
+        values = [POSITIVE_LABEL if positive else NEGATIVE_LABEL, int(positive)]
+        if scores is not None:
+            values.append(round(float(scores[i]), 4))
+        if probabilities is not None:
+            values.append(round(float(probabilities[i]), 4))
+        writer.writerow(row + values)
+    return out.getvalue()
@@ -0,0 +1,250 @@
+# Precomputed disease information served from memory
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from dotenv import load_dotenv
+from llm_client import get_summarize_chain
+from lazy_resource import LazyResource
+
+# Load environment variables
+load_dotenv(".env")
+serper_api_key = os.getenv("SERPER_API_KEY")
+
+DISEASE_INFO_PATH = os.getenv(
+    "DISEASE_INFO_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "disease_info.json"))
+DISEASE_INFO_MAX_AGE = int(os.getenv("DISEASE_INFO_MAX_AGE", str(30 * 24 * 3600)))  # seconds
+DISEASE_INFO_REFRESH_INTERVAL = int(os.getenv("DISEASE_INFO_REFRESH_INTERVAL", "3600"))  # seconds
+
+# Bump when the layout of the store file changes
+STORE_FORMAT_VERSION = 1
+
+# Every label the skin model can output, plus the health check's diabetes result
+KNOWN_DISEASES = [
+    "Melanocytic nevi",
+    "Melanoma",
+    "Benign keratosis-like lesions",
+    "Basal cell carcinoma",
+    "Actinic keratoses",
+    "Vascular lesions",
+    "Dermatofibroma",
+    "diabetes",
+]
+INFO_SECTIONS = ("Symptoms", "Treatment", "Prevention")
+
+def load_search():
+    from langchain_community.utilities import GoogleSerperAPIWrapper
+    return GoogleSerperAPIWrapper(serper_api_key=serper_api_key)
+
+search_resource = LazyResource("serper", load_search)
+
+def get_search():
+    search = search_resource.get()
+    if search is None:
+        raise RuntimeError(f"Serper search unavailable: {search_resource.error}")
+    return search
+
+def build_queries(disease_name):
+    return {
+        "Symptoms": f"What are the symptoms of {disease_name}?",
+        "Treatment": f"What are the treatments for {disease_name}?",
+        "Prevention": f"How to prevent {disease_name}?"
+    }
+
+def fetch_disease_info(disease_name):
+    """
+    Search for information about a disease and summarize the results.
+    Returns (sections, complete) where complete is False if any lookup failed.
+    """
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    from langchain_core.documents import Document
+
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
+    summarize_chain = get_summarize_chain("map_reduce")
+    result = {}
+    complete = True
+    for key, query in build_queries(disease_name).items():
+        print(f"🔍 Fetching {key} info for {disease_name}...")
+        try:
+            raw = get_search().run(query)
+            docs = [Document(page_content=t) for t in text_splitter.split_text(raw)]
+            result[key] = summarize_chain.run(docs)
+            print(f"✅ Successfully retrieved {key} information")
+        except Exception as e:
+            print(f"❌ Error retrieving {key} information: {str(e)}")
+            result[key] = f"Could not retrieve information: {str(e)}"
+            complete = False
+    return result, complete
+
+class DiseaseInfoStore:
+    """Versioned Symptoms/Treatment/Prevention entries, loaded once and kept in memory"""
+
+    def __init__(self, path=DISEASE_INFO_PATH, max_age=DISEASE_INFO_MAX_AGE):
+        self.path = path
+        self.max_age = max_age
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._save_lock = threading.Lock()  # one writer of the temp file at a time
+        self._refresher = None
+        self._refresher_pid = None
+        self._mtime = None
+        self.load()
+
+    @staticmethod
+    def _key(disease_name):
+        return disease_name.strip().lower()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            print(f"Disease info store not found at {self.path}, run 'python disease_info_store.py --refresh'")
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("format_version") != STORE_FORMAT_VERSION:
+                print(f"Ignoring disease info store with format version {data.get('format_version')}")
+                return
+            self.entries = {self._key(e["name"]): e for e in data.get("entries", [])}
+            self._mtime = os.path.getmtime(self.path)
+            print(f"Loaded disease info for {len(self.entries)} diseases")
+        except Exception as e:
+            print(f"Failed to load disease info store: {e}")
+
+    def save(self):
+        # Snapshot under the save lock too, so the last save to finish writes the newest entries
+        with self._save_lock:
+            with self._lock:
+                data = {
+                    "format_version": STORE_FORMAT_VERSION,
+                    "saved_at": time.time(),
+                    "entries": sorted(self.entries.values(), key=lambda e: e["name"]),
+                }
+            # Write to a temporary file first so readers never see a partial store
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, indent=2, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+            self._mtime = os.path.getmtime(self.path)
+
+    def reload_if_changed(self):
+        """Pick up entries another process or the refresh command wrote"""
+        if os.path.exists(self.path) and os.path.getmtime(self.path) != self._mtime:
+            self.load()
+
+    def get(self, disease_name):
+        """Return the stored sections for a disease, or None if it was never built"""
+        entry = self.entries.get(self._key(disease_name))
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry["sections"]
+
+    def put(self, disease_name, sections):
+        key = self._key(disease_name)
+        with self._lock:
+            previous = self.entries.get(key)
+            self.entries[key] = {
+                "name": disease_name,
+                "version": previous["version"] + 1 if previous else 1,
+                "updated_at": time.time(),
+                "sections": {s: sections[s] for s in INFO_SECTIONS},
+            }
+        self.save()
+
+    def is_stale(self, disease_name):
+        entry = self.entries.get(self._key(disease_name))
+        return entry is None or time.time() - entry["updated_at"] > self.max_age
+
+    def refresh(self, names=None, force=False):
+        """Rebuild missing or stale entries; returns the names that were rebuilt"""
+        names = names or KNOWN_DISEASES
+        rebuilt = []
+        with self._refresh_lock:
+            for name in names:
+                if not force and not self.is_stale(name):
+                    continue
+                sections, complete = fetch_disease_info(name)
+                if complete:
+                    self.put(name, sections)
+                    rebuilt.append(name)
+                else:
+                    # Keep serving the old entry rather than storing error messages
+                    print(f"Keeping previous entry for {name}, refresh was incomplete")
+        return rebuilt
+
+    def ensure_refresher(self, interval=DISEASE_INFO_REFRESH_INTERVAL):
+        """Start the background refresher once per process; called at service start"""
+        if interval <= 0 or (self._refresher_pid == os.getpid() and self._refresher.is_alive()):
+            return
+        with self._lock:
+            if self._refresher_pid == os.getpid() and self._refresher.is_alive():
+                return
+            self._refresher = threading.Thread(
+                target=self._refresh_loop, args=(interval,), name="disease-info-refresh", daemon=True)
+            self._refresher_pid = os.getpid()
+            self._refresher.start()
+
+    def _refresh_loop(self, interval):
+        while True:
+            try:
+                self.reload_if_changed()
+                # Only existing entries are kept fresh; missing ones are fetched by the request that needs them
+                with self._lock:
+                    names = [e["name"] for e in self.entries.values()]
+                rebuilt = self.refresh(names) if names else []
+                if rebuilt:
+                    print(f"Background refresh rebuilt disease info for: {', '.join(rebuilt)}")
+            except Exception as e:
+                print(f"Background disease info refresh failed: {e}")
+            time.sleep(interval)
+
+    def stats(self):
+        now = time.time()
+        return {
+            "path": self.path,
+            "entries": len(self.entries),
+            "stale": sum(1 for e in self.entries.values() if now - e["updated_at"] > self.max_age),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+disease_store = DiseaseInfoStore()
+
+def search_and_summarize(disease_name):
+    """
+    Return Symptoms/Treatment/Prevention for a disease from the store,
+    falling back to a live search (and storing the result) on a miss.
+    """
+    sections = disease_store.get(disease_name)
+    if sections is not None:
+        return dict(sections)
+    sections, complete = fetch_disease_info(disease_name)
+    if complete:
+        disease_store.put(disease_name, sections)
+    return sections
+
+# CLI entry point
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or inspect the precomputed disease information store")
+    parser.add_argument("--refresh", action="store_true", help="rebuild missing or stale entries")
+    parser.add_argument("--force", action="store_true", help="rebuild every entry regardless of age")
+    parser.add_argument("names", nargs="*", help="diseases to refresh (default: all known labels)")
+    args = parser.parse_args()
+
+    if args.refresh or args.force:
+        rebuilt = disease_store.refresh(args.names or None, force=args.force)
+        print(f"\n✅ Rebuilt {len(rebuilt)} entries: {', '.join(rebuilt) if rebuilt else 'none'}")
+        missing = [n for n in (args.names or KNOWN_DISEASES) if disease_store.is_stale(n)]
+        if missing:
+            print(f"❌ Still missing or stale: {', '.join(missing)}")
+            sys.exit(1)
+    else:
+        for entry in sorted(disease_store.entries.values(), key=lambda e: e["name"]):
+            age_days = (time.time() - entry["updated_at"]) / 86400
+            print(f"{entry['name']}: version {entry['version']}, {age_days:.1f} days old")
@@ -0,0 +1,25 @@
+# gunicorn settings for the ML API: gunicorn -c gunicorn.conf.py api:app  (or python serve.py)
+import os
+from serve import worker_plan, preload_models, configure_worker
+
+workers, torch_threads = worker_plan()
+
+bind = os.getenv("BIND", "0.0.0.0:7122")
+# Import api.py once in the master so the models are loaded before forking
+preload_app = True
+# Threads per worker serve concurrent requests; they wait on the LLM and the network
+# far more than on the CPU, and model inference is already serialized by the batchers
+worker_class = "gthread"
+threads = int(os.getenv("WEB_THREADS", "8"))
+timeout = int(os.getenv("WEB_TIMEOUT", "120"))
+graceful_timeout = 30
+# Recycle workers now and then to bound memory growth from caches and fragmentation
+max_requests = int(os.getenv("WEB_MAX_REQUESTS", "0"))
+max_requests_jitter = max_requests // 10
+
+def when_ready(server):
+    server.log.info(f"Loading models before forking {workers} workers x {torch_threads} torch threads")
+    preload_models()
+
+def post_fork(server, worker):
+    configure_worker(torch_threads)
@@ -1,31 +1,24 @@
 # === Import Libraries ===
 import os
-import pickle
+import sys
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
 import numpy as np
-from PIL import Image
 import torchvision.models as models
-import torchvision.transforms as T
-from langchain_groq import ChatGroq
-from langchain.chains import load_summarize_chain
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.utilities import GoogleSerperAPIWrapper
-from langchain_core.documents import Document
 from dotenv import load_dotenv  # Import dotenv to load environment variables
 
+# Shared ML modules live one directory up in ml/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from disease_info_store import search_and_summarize
+from image_preprocessing import preprocess
+from diabetes_model import diabetes_model, predict as predict_records, POSITIVE_LABEL, NEGATIVE_LABEL
+
 # === Load Environment Variables ===
 load_dotenv()  # Load variables from .env file
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 SERPER_API_KEY = os.getenv("SERPER_API_KEY")
 
-# === LangChain Setup ===
-llm = ChatGroq(model="llama3-8b-8192", api_key=GROQ_API_KEY)
-text_splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
-summarize_chain = load_summarize_chain(llm, chain_type="map_reduce")
-search = GoogleSerperAPIWrapper(serper_api_key=SERPER_API_KEY)
-
 # === Class Mapping ===
 class_map = {
     'nv': 'Melanocytic nevi',
@@ -53,14 +46,8 @@ def load_skin_model(path=r'skin-disease-model2.pth'):
 
 # === Image Preprocessing ===
 def preprocess_skin_image(image_path):
-    transform = T.Compose([
-        T.Resize((224, 224)),
-        T.ToTensor(),
-        T.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]),  # ImageNet stats
-    ])
-    image = Image.open(image_path).convert("RGB")
-    image_tensor = transform(image).unsqueeze(0)
-    return image_tensor
+    # Same decode/resize/normalize as the API, see ml/image_preprocessing.py
+    return preprocess(image_path, "skin")
 
 # === Predict Skin Disease ===
 def predict_skin(model, image_tensor):
@@ -72,27 +59,13 @@ def predict_skin(model, image_tensor):
     return class_labels[pred_idx], confidence
 
 # === Diabetes Model (.sav) ===
-def load_diabetes_model(path='A:\hackathon\elevate\health-check\diabetes_model.sav'):
-    return pickle.load(open(path, 'rb'))
+def load_diabetes_model():
+    # Loaded once from next to this script (or DIABETES_MODEL_PATH), shared with the API's /predict_diabetes
+    return diabetes_model.get()
 
 def predict_diabetes(model, input_data):
-    prediction = model.predict([input_data])
-    return "Diabetes Detected" if prediction[0] == 1 else "No Diabetes Detected"
-
-# === Serper + LLaMA Summary ===
-def search_and_summarize(disease_name):
-    queries = {
-        "Symptoms": f"What are the symptoms of {disease_name}?",
-        "Treatment": f"What are the treatments for {disease_name}?",
-        "Prevention": f"How to prevent {disease_name}?"
-    }
-    result = {}
-    for key, query in queries.items():
-        print(f"🔍 Fetching {key} info...")
-        raw = search.run(query)
-        docs = [Document(page_content=t) for t in text_splitter.split_text(raw)]
-        result[key] = summarize_chain.run(docs)
-    return result
+    labels, _, _ = predict_records(model, np.asarray([input_data], dtype=np.float64))
+    return POSITIVE_LABEL if labels[0] == 1 else NEGATIVE_LABEL
 
 # === Main App ===
 def main():
@@ -110,6 +83,9 @@ def main():
         ]
         user_input = [float(input(f"{field}: ")) for field in fields]
         model = load_diabetes_model()
+        if model is None:
+            print("❌ Model loading failed.")
+            return
         result = predict_diabetes(model, user_input)
         print(f"\n🩺 Prediction: {result}")
         print("\n💡 Gathering more info...")
@@ -0,0 +1,185 @@
+# Streaming extraction of paragraph text and article images from news pages
+import os
+import re
+import time
+import codecs
+import threading
+from html.parser import HTMLParser
+from urllib.parse import urljoin
+
+SCRAPE_MAX_BYTES = int(os.getenv("SCRAPE_MAX_BYTES", str(1024 * 1024)))
+SCRAPE_MAX_PARAGRAPHS = int(os.getenv("SCRAPE_MAX_PARAGRAPHS", "80"))
+SCRAPE_MAX_IMAGES = int(os.getenv("SCRAPE_MAX_IMAGES", "20"))
+SCRAPE_TIME_BUDGET_MS = float(os.getenv("SCRAPE_TIME_BUDGET_MS", "250"))
+MIN_IMAGE_SIDE = int(os.getenv("MIN_IMAGE_SIDE", "64"))  # pixels, when the page declares a size
+
+FEED_CHUNK_BYTES = 16 * 1024
+# Content of these elements is never page text
+SKIP_TAGS = {"script", "style", "template", "svg"}
+# Tracking pixels, analytics beacons and site chrome that would only waste a deepfake model pass
+NON_CONTENT_IMAGE = re.compile(
+    r"\.(?:svg|ico)(?:$|\?)|favicon|sprite|[/_.-](?:icon|logo|pixel|beacon|spacer|blank|avatar)s?[/_.-]"
+    r"|doubleclick\.net|google-analytics\.com|googletagmanager\.com|scorecardresearch\.com"
+    r"|quantserve\.com|facebook\.com/tr|/pixel\?|/tr\?|[?&]utm_", re.IGNORECASE)
+# Lazy-loading pages put the real URL in a data attribute and a placeholder in src
+IMAGE_SOURCE_ATTRS = ("src", "data-src", "data-lazy-src", "data-original")
+
+stats = {"pages": 0, "stopped_by_paragraphs": 0, "stopped_by_time": 0, "truncated": 0, "images_filtered": 0}
+_stats_lock = threading.Lock()
+
+def count(name):
+    with _stats_lock:
+        stats[name] += 1
+
+def declared_size(value):
+    value = (value or "").strip().lower().removesuffix("px")
+    return int(value) if value.isdigit() else None
+
+def is_content_image(url, attrs):
+    """False for tracking pixels, icons and hidden images"""
+    if NON_CONTENT_IMAGE.search(url):
+        return False
+    for side in ("width", "height"):
+        size = declared_size(attrs.get(side))
+        if size is not None and size < MIN_IMAGE_SIDE:
+            return False
+    style = (attrs.get("style") or "").replace(" ", "").lower()
+    return "display:none" not in style and "visibility:hidden" not in style
+
+class PageExtractor(HTMLParser):
+    """
+    Collects <p> text and <img> URLs from HTML fed in chunks, without building
+    a tree. Set done once max_paragraphs paragraphs have been read.
+    """
+
+    def __init__(self, base_url, max_paragraphs=SCRAPE_MAX_PARAGRAPHS, max_images=SCRAPE_MAX_IMAGES):
+        super().__init__(convert_charrefs=True)
+        self.base_url = base_url
+        self.max_paragraphs = max_paragraphs
+        self.max_images = max_images
+        self.paragraphs = []
+        self.images = []
+        self.done = False
+        self._seen_images = set()
+        self._skip_depth = 0
+        self._paragraph = None  # text pieces of the open <p>
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIP_TAGS:
+            self._skip_depth += 1
+        elif tag == "p":
+            self._close_paragraph()  # a new <p> implicitly closes the previous one
+            self._paragraph = []
+        elif tag == "br" and self._paragraph is not None:
+            self._paragraph.append("\n")
+        elif tag == "img":
+            self._add_image(dict(attrs))
+        elif tag == "base":
+            href = dict(attrs).get("href")
+            if href:
+                self.base_url = urljoin(self.base_url, href)
+
+    def handle_startendtag(self, tag, attrs):
+        # <img/> and <br/> have no content, so never touch the skip depth for them
+        if tag not in SKIP_TAGS:
+            self.handle_starttag(tag, attrs)
+
+    def handle_endtag(self, tag):
+        if tag in SKIP_TAGS:
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif tag == "p":
+            self._close_paragraph()
+
+    def handle_data(self, data):
+        if self._paragraph is not None and not self._skip_depth:
+            self._paragraph.append(data)
+
+    def _close_paragraph(self):
+        if self._paragraph is None:
+            return
+        self.paragraphs.append("".join(self._paragraph))
+        self._paragraph = None
+        if len(self.paragraphs) >= self.max_paragraphs:
+            self.done = True
+
+    def _add_image(self, attrs):
+        if len(self.images) >= self.max_images:
+            return
+        for attr in IMAGE_SOURCE_ATTRS:
+            src = (attrs.get(attr) or "").strip()
+            if src and not src.startswith("data:"):
+                break
+        else:
+            return
+        url = urljoin(self.base_url, src)
+        if not url.startswith(("http://", "https://")) or url in self._seen_images:
+            return
+        self._seen_images.add(url)
+        if is_content_image(url, attrs):
+            self.images.append(url)
+        else:
+            count("images_filtered")
+
+    def finish(self):
+        self._close_paragraph()
+        # The chunk that reached max_paragraphs may have held a few more
+        return " ".join(self.paragraphs[:self.max_paragraphs]), self.images
+
+class PageStream:
+    """
+    Incremental page extraction: feed() takes the body as it arrives and returns
+    True once a budget runs out (max_bytes of input, max_paragraphs paragraphs or
+    time_budget_ms spent parsing), so the caller can stop reading the page.
+    """
+
+    def __init__(self, base_url, encoding=None, max_bytes=SCRAPE_MAX_BYTES,
+                 max_paragraphs=SCRAPE_MAX_PARAGRAPHS, time_budget_ms=SCRAPE_TIME_BUDGET_MS):
+        count("pages")
+        self.parser = PageExtractor(base_url, max_paragraphs)
+        try:
+            self.decoder = codecs.getincrementaldecoder(encoding or "utf-8")(errors="replace")
+        except LookupError:
+            self.decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self.max_bytes = max_bytes
+        self.time_budget = time_budget_ms / 1000
+        self.bytes_read = 0
+        self.parse_seconds = 0.0
+        self.done = False
+
+    def feed(self, data):
+        if self.done:
+            return True
+        if self.bytes_read + len(data) > self.max_bytes:
+            data = data[:self.max_bytes - self.bytes_read]
+            count("truncated")
+            self.done = True
+        self.bytes_read += len(data)
+        start = time.perf_counter()
+        for offset in range(0, len(data), FEED_CHUNK_BYTES):
+            self.parser.feed(self.decoder.decode(data[offset:offset + FEED_CHUNK_BYTES]))
+            if self.parser.done:
+                count("stopped_by_paragraphs")
+                self.done = True
+                break
+            # Only parsing counts against the time budget, not waiting for the network
+            if self.parse_seconds + time.perf_counter() - start > self.time_budget:
+                count("stopped_by_time")
+                self.done = True
+                break
+        self.parse_seconds += time.perf_counter() - start
+        return self.done
+
+    def result(self):
+        """(paragraph text, image URLs) from everything fed so far"""
+        return self.parser.finish()
+
+def extract_page(content, base_url, encoding=None, max_bytes=SCRAPE_MAX_BYTES,
+                 max_paragraphs=SCRAPE_MAX_PARAGRAPHS, time_budget_ms=SCRAPE_TIME_BUDGET_MS):
+    """(paragraph text, image URLs) from page bytes already in memory, under the same budgets as PageStream"""
+    page = PageStream(base_url, encoding, max_bytes, max_paragraphs, time_budget_ms)
+    page.feed(content)
+    return page.result()
+
+def extraction_stats():
+    with _stats_lock:
+        return dict(stats)
@@ -0,0 +1,280 @@
+# Shared HTTP layer: pooled keep-alive sessions, timeouts, retries and size caps
+import os
+import json
+import time
+import asyncio
+import threading
+import functools
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import HTTPError as URLLib3Error
+
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "15"))
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "2"))
+HTTP_BACKOFF_FACTOR = float(os.getenv("HTTP_BACKOFF_FACTOR", "0.5"))
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "32"))
+HTTP_PER_HOST_LIMIT = int(os.getenv("HTTP_PER_HOST_LIMIT", "4"))
+HTTP_MAX_RESPONSE_BYTES = int(os.getenv("HTTP_MAX_RESPONSE_BYTES", str(10 * 1024 * 1024)))
+USER_AGENT = os.getenv("HTTP_USER_AGENT", "CivicSense/1.0 (+https://github.com/jaivardhan-bhola/esochackx-KnightCoders)")
+
+READ_CHUNK_SIZE = 64 * 1024
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+RETRY_METHODS = frozenset(["GET", "HEAD"])
+
+class ResponseTooLarge(requests.RequestException):
+    pass
+
+class DeadlineExceeded(requests.Timeout):
+    pass
+
+class HTTPResponse:
+    """Fully read (and size-capped) response body with the bits callers use"""
+
+    def __init__(self, url, status_code, headers, content, encoding=None):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.encoding = encoding
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding or "utf-8", errors="replace")
+
+    def json(self):
+        return json.loads(self.content)
+
+def body_chunks(response, stop_at=None, incremental=False):
+    """
+    A streamed response's body as it arrives. With a deadline or incremental set,
+    each read returns whatever bytes are available (urllib3 2's read1) instead of
+    waiting to fill READ_CHUNK_SIZE, so a trickling body cannot hold the thread
+    long past stop_at and a consumer sees data as soon as it is received.
+    """
+    raw = response.raw
+    if (stop_at is None and not incremental) or not hasattr(raw, "read1"):
+        yield from response.iter_content(READ_CHUNK_SIZE)
+        return
+    while True:
+        # Read timeouts are per socket read, so the deadline is checked between reads
+        if stop_at is not None and time.monotonic() > stop_at:
+            raise DeadlineExceeded(f"{response.url}: deadline passed while reading the body")
+        try:
+            chunk = raw.read1(READ_CHUNK_SIZE, decode_content=True)
+        except URLLib3Error as e:
+            raise requests.ConnectionError(e)
+        if not chunk:
+            return
+        yield chunk
+
+def host_of(url):
+    return urlsplit(url).netloc.lower()
+
+class HTTPClient:
+    """Thread-safe client with one keep-alive pool per process and a concurrency cap per host"""
+
+    def __init__(self, connect_timeout=HTTP_CONNECT_TIMEOUT, read_timeout=HTTP_READ_TIMEOUT,
+                 max_retries=HTTP_MAX_RETRIES, backoff_factor=HTTP_BACKOFF_FACTOR,
+                 pool_size=HTTP_POOL_SIZE, per_host_limit=HTTP_PER_HOST_LIMIT,
+                 max_response_bytes=HTTP_MAX_RESPONSE_BYTES):
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.pool_size = pool_size
+        self.per_host_limit = per_host_limit
+        self.max_response_bytes = max_response_bytes
+        self.requests = 0
+        self.retries = 0
+        self.errors = 0
+        self.too_large = 0
+        self.truncated = 0
+        self.stopped_early = 0
+        self._session = None
+        self._pid = None
+        self._host_slots = {}
+        self._lock = threading.Lock()
+
+    @property
+    def session(self):
+        # Pooled sockets must not be shared across a fork
+        if self._session is None or self._pid != os.getpid():
+            with self._lock:
+                if self._session is None or self._pid != os.getpid():
+                    # Retries are done in send() where they can be bounded by a deadline
+                    adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+                    session = requests.Session()
+                    session.headers["User-Agent"] = USER_AGENT
+                    session.mount("http://", adapter)
+                    session.mount("https://", adapter)
+                    self._session = session
+                    self._pid = os.getpid()
+        return self._session
+
+    def _count(self, name):
+        # Requests run on many threads; unguarded += loses updates
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def host_slot(self, url):
+        """Semaphore limiting in-flight requests to one host"""
+        host = host_of(url)
+        with self._lock:
+            if host not in self._host_slots:
+                self._host_slots[host] = threading.BoundedSemaphore(self.per_host_limit)
+            return self._host_slots[host]
+
+    def send(self, method, url, params=None, headers=None, timeout=None, stop_at=None):
+        """
+        Open a streamed response, retrying connection errors and RETRY_STATUSES for
+        idempotent methods with exponential backoff. Retry-After is ignored, and a
+        retry whose backoff would end past stop_at is not attempted.
+        """
+        attempt = 0
+        while True:
+            attempt_timeout = timeout
+            if stop_at is not None:
+                remaining = stop_at - time.monotonic()
+                if remaining <= 0:
+                    raise DeadlineExceeded(f"{url}: deadline passed before the request was sent")
+                connect, read = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+                attempt_timeout = (min(connect, remaining), min(read, remaining))
+            try:
+                response, error = self.session.request(method, url, params=params, headers=headers,
+                                                       timeout=attempt_timeout, stream=True), None
+            except (requests.ConnectionError, requests.Timeout) as e:
+                response, error = None, e
+            if error is None and response.status_code not in RETRY_STATUSES:
+                return response
+            delay = self.backoff_factor * (2 ** attempt)
+            if (method.upper() not in RETRY_METHODS or attempt >= self.max_retries
+                    or (stop_at is not None and time.monotonic() + delay >= stop_at)):
+                if error is not None:
+                    raise error
+                return response
+            if response is not None:
+                response.close()
+            self._count("retries")
+            time.sleep(delay)
+            attempt += 1
+
+    def request(self, method, url, params=None, headers=None, timeout=None, max_bytes=None, truncate=False,
+                stop_at=None, on_response=None):
+        """
+        truncate: keep the first max_bytes of a larger body instead of raising ResponseTooLarge.
+        stop_at: time.monotonic() value after which waiting for a host slot, connecting,
+        retrying or reading raises DeadlineExceeded, so abandoned work frees its thread.
+        on_response: called with the HTTPResponse (content still None) once the headers
+        arrive; it may return a consumer that gets each body chunk as it is read and
+        returns True to stop reading. content then holds only the bytes read.
+        """
+        max_bytes = max_bytes or self.max_response_bytes
+        timeout = timeout or self.timeout
+        self._count("requests")
+        try:
+            slot = self.host_slot(url)
+            if stop_at is not None:
+                remaining = stop_at - time.monotonic()
+                if remaining <= 0 or not slot.acquire(timeout=remaining):
+                    raise DeadlineExceeded(f"{url}: deadline passed before the request started")
+            else:
+                slot.acquire()
+            try:
+                with self.send(method, url, params, headers, timeout, stop_at) as response:
+                    declared = response.headers.get("Content-Length")
+                    if not truncate and declared and declared.isdigit() and int(declared) > max_bytes:
+                        raise ResponseTooLarge(f"{url} declares {declared} bytes, limit is {max_bytes}")
+                    content_type = response.headers.get("Content-Type", "")
+                    encoding = response.encoding if "charset" in content_type.lower() else None
+                    result = HTTPResponse(response.url, response.status_code, response.headers, None, encoding)
+                    consumer = on_response(result) if on_response is not None else None
+                    chunks = []
+                    size = 0
+                    for chunk in body_chunks(response, stop_at, incremental=consumer is not None):
+                        size += len(chunk)
+                        if size > max_bytes:
+                            if not truncate:
+                                raise ResponseTooLarge(f"{url} exceeded {max_bytes} bytes")
+                            # Stop reading; the rest of the body is dropped with the connection
+                            chunk = chunk[:len(chunk) - (size - max_bytes)]
+                            chunks.append(chunk)
+                            self._count("truncated")
+                            if consumer is not None:
+                                consumer(chunk)
+                            break
+                        chunks.append(chunk)
+                        if consumer is not None and consumer(chunk):
+                            # Closing the unread response drops the connection instead of draining it
+                            self._count("stopped_early")
+                            break
+                    result.content = b"".join(chunks)
+                    return result
+            finally:
+                slot.release()
+        except ResponseTooLarge:
+            self._count("too_large")
+            raise
+        except requests.RequestException:
+            self._count("errors")
+            raise
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def head(self, url, **kwargs):
+        return self.request("HEAD", url, **kwargs)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "retries": self.retries,
+                "errors": self.errors,
+                "too_large": self.too_large,
+                "truncated": self.truncated,
+                "stopped_early": self.stopped_early,
+                "hosts": len(self._host_slots),
+            }
+
+class AsyncHTTPClient:
+    """
+    asyncio front end for HTTPClient: requests run on a bounded thread pool over the
+    shared keep-alive pool, with asyncio per-host limits so waiting never blocks a thread.
+    Create one per event loop (e.g. per asyncio.run call).
+    """
+
+    def __init__(self, client, executor, per_host_limit=HTTP_PER_HOST_LIMIT):
+        self.client = client
+        self.executor = executor
+        self.per_host_limit = per_host_limit
+        self._host_slots = {}
+
+    def host_slot(self, url):
+        host = host_of(url)
+        if host not in self._host_slots:
+            self._host_slots[host] = asyncio.Semaphore(self.per_host_limit)
+        return self._host_slots[host]
+
+    async def get(self, url, **kwargs):
+        loop = asyncio.get_running_loop()
+        async with self.host_slot(url):
+            return await loop.run_in_executor(self.executor, functools.partial(self.client.get, url, **kwargs))
+
+    async def get_many(self, urls, **kwargs):
+        """Fetch every URL concurrently; failed fetches come back as exception objects"""
+        return await asyncio.gather(*(self.get(url, **kwargs) for url in urls), return_exceptions=True)
+
+# Process-wide instances
+http_client = HTTPClient()
+http_executor = ThreadPoolExecutor(max_workers=HTTP_POOL_SIZE, thread_name_prefix="http")
+
+def async_http_client():
+    return AsyncHTTPClient(http_client, http_executor)
+
+def fetch_all(urls, **kwargs):
+    """Blocking helper that fans out over urls with the async client"""
+    async def run():
+        return await async_http_client().get_many(urls, **kwargs)
+    return dict(zip(urls, asyncio.run(run())))
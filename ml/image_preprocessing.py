@@ -0,0 +1,117 @@
+# Shared image preprocessing for the skin and deepfake models: decode small, resize as uint8, normalize in batches
+import os
+import io
+import numpy as np
+import torch
+from PIL import Image
+from concurrent.futures import ThreadPoolExecutor
+
+IMAGE_DECODE_WORKERS = int(os.getenv("IMAGE_DECODE_WORKERS", "4"))
+
+IMAGENET_MEAN = [0.485, 0.456, 0.406]
+IMAGENET_STD = [0.229, 0.224, 0.225]
+CLIP_MEAN = [0.48145466, 0.4578275, 0.40821073]
+CLIP_STD = [0.26862954, 0.26130258, 0.27577711]
+
+# Model input size and normalization; mean/std None means pixels scaled to [0, 1] only,
+# crop means a centre crop to the input's aspect ratio instead of stretching
+PREPROCESS_SPECS = {
+    "skin": {"size": (224, 224), "mean": IMAGENET_MEAN, "std": IMAGENET_STD},
+    "deepfake": {"size": (128, 128), "mean": None, "std": None},
+    "clip": {"size": (224, 224), "mean": CLIP_MEAN, "std": CLIP_STD, "crop": True},
+}
+
+# Threads only start on first use, so importing this before a fork is safe
+decode_pool = ThreadPoolExecutor(max_workers=IMAGE_DECODE_WORKERS, thread_name_prefix="image-decode")
+
+_normalizers = {}
+
+def decode_jpeg_tensor(data):
+    """libjpeg-turbo decode straight into a (3, H, W) uint8 tensor, None without torchvision"""
+    try:
+        from torchvision.io import decode_jpeg, ImageReadMode
+    except ImportError:
+        return None
+    return decode_jpeg(torch.frombuffer(bytearray(data), dtype=torch.uint8), mode=ImageReadMode.RGB)
+
+def decode_image(source, size):
+    """
+    (3, H, W) uint8 tensor of an image path, file-like object or bytes, decoded
+    no larger than needed for size. Large JPEGs use PIL draft mode, which decodes
+    at 1/2, 1/4 or 1/8 scale inside libjpeg; JPEGs already close to size are
+    decoded by torchvision; everything else goes through PIL.
+    """
+    data = source if isinstance(source, (bytes, bytearray)) else None
+    image = Image.open(io.BytesIO(data) if data is not None else source)
+    if image.format == "JPEG":
+        width, height = image.size
+        if width >= 2 * size[1] and height >= 2 * size[0]:
+            image.draft("RGB", (size[1], size[0]))
+        elif data is not None:
+            tensor = decode_jpeg_tensor(data)
+            if tensor is not None:
+                return tensor
+    pixels = np.array(image.convert("RGB"))  # a writable copy, which torch.from_numpy wants
+    return torch.from_numpy(pixels).permute(2, 0, 1)
+
+def resize_uint8(tensor, size):
+    """Antialiased bilinear resize that stays in uint8 (the vectorized fast path in torch)"""
+    if tuple(tensor.shape[-2:]) == tuple(size):
+        return tensor
+    return torch.nn.functional.interpolate(
+        tensor.unsqueeze(0), size=size, mode="bilinear", antialias=True, align_corners=False)[0]
+
+def center_crop(tensor, size):
+    """Largest centred region of tensor with the aspect ratio of size"""
+    height, width = tensor.shape[-2:]
+    crop_height, crop_width = min(height, width * size[0] // size[1]), min(width, height * size[1] // size[0])
+    top, left = (height - crop_height) // 2, (width - crop_width) // 2
+    return tensor[:, top:top + crop_height, left:left + crop_width]
+
+def prepare_image(source, name):
+    """Decoded and resized (3, H, W) uint8 input for the named model"""
+    spec = PREPROCESS_SPECS[name]
+    tensor = decode_image(source, spec["size"])
+    if spec.get("crop"):
+        tensor = center_crop(tensor, spec["size"])
+    return resize_uint8(tensor, spec["size"])
+
+def normalize_batch(images, name):
+    """
+    Float model input from uint8 images: a list of (3, H, W) tensors or one
+    (N, 3, H, W) tensor. Scaling and normalization run once over the whole batch.
+    """
+    batch = torch.stack(images) if isinstance(images, (list, tuple)) else images
+    if name not in _normalizers:
+        spec = PREPROCESS_SPECS[name]
+        if spec["mean"] is None:
+            _normalizers[name] = (torch.zeros(1, 3, 1, 1), torch.full((1, 3, 1, 1), 255.0))
+        else:
+            # (x / 255 - mean) / std == (x - 255 * mean) / (255 * std)
+            _normalizers[name] = (torch.tensor(spec["mean"]).view(1, 3, 1, 1) * 255,
+                                  torch.tensor(spec["std"]).view(1, 3, 1, 1) * 255)
+    shift, scale = _normalizers[name]
+    return batch.float().sub_(shift).div_(scale)
+
+def preprocess(source, name):
+    """(1, 3, H, W) float input for a single image"""
+    return normalize_batch([prepare_image(source, name)], name)
+
+def prepare_images(sources, name, pool=decode_pool):
+    """prepare_image over many sources on the decode pool; failed images come back as their exception"""
+    futures = [pool.submit(prepare_image, source, name) for source in sources]
+    results = []
+    for future in futures:
+        try:
+            results.append(future.result())
+        except Exception as e:
+            results.append(e)
+    return results
+
+def preprocess_batch(sources, name, pool=decode_pool):
+    """(N, 3, H, W) float input for many images, decoded in parallel; raises if any image fails"""
+    images = prepare_images(sources, name, pool)
+    for image in images:
+        if isinstance(image, Exception):
+            raise image
+    return normalize_batch(images, name)
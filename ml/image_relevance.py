@@ -0,0 +1,129 @@
+# Local zero-shot image relevance check with a CLIP model
+import os
+import hashlib
+import torch
+from ttl_cache import TTLCache
+from lazy_resource import LazyResource
+from image_preprocessing import PREPROCESS_SPECS, preprocess
+
+IMAGE_RELEVANCE_ENABLED = os.getenv("IMAGE_RELEVANCE_ENABLED", "1") == "1"
+IMAGE_RELEVANCE_MODEL = os.getenv("IMAGE_RELEVANCE_MODEL", "openai/clip-vit-base-patch32")
+IMAGE_RELEVANCE_THRESHOLD = float(os.getenv("IMAGE_RELEVANCE_THRESHOLD", "0.5"))
+IMAGE_EMBEDDING_CACHE_SIZE = int(os.getenv("IMAGE_EMBEDDING_CACHE_SIZE", "1024"))
+
+# Zero-shot labels: what each department's evidence usually looks like...
+DEPARTMENT_PROMPTS = {
+    "Electricity Board": ["a photo of a broken street light", "a photo of damaged electric wires or a power pole",
+                          "a photo of an electrical transformer"],
+    "Department of Water Resources": ["a photo of a leaking water pipe", "a photo of a flooded or waterlogged street",
+                                      "a photo of dirty tap water"],
+    "Road Development": ["a photo of a pothole in a road", "a photo of a damaged road or footpath",
+                         "a photo of a broken speed breaker"],
+    "Health Ministry": ["a photo of stagnant water breeding mosquitoes", "a photo of a sick person or a hospital",
+                        "a photo of stray animals on a street"],
+    "Sanitation": ["a photo of garbage piled on a street", "a photo of an overflowing drain or sewer",
+                   "a photo of a dirty public toilet"],
+}
+# ...and what unrelated uploads usually look like
+UNRELATED_PROMPTS = ["a selfie", "a screenshot of text", "a meme or cartoon", "a photo of food",
+                     "a blank or completely dark image", "a product photo", "a document or form"]
+
+class ImageRelevanceEngine:
+    """
+    Scores a decoded image against the complaint text and the department prompts.
+    The model loads on first use; prompt embeddings are computed once and image
+    embeddings are cached by a hash of the uploaded bytes.
+    """
+
+    def __init__(self, model_name=IMAGE_RELEVANCE_MODEL, threshold=IMAGE_RELEVANCE_THRESHOLD,
+                 cache_size=IMAGE_EMBEDDING_CACHE_SIZE):
+        self.model_name = model_name
+        self.threshold = threshold
+        self.embedding_cache = TTLCache(cache_size)
+        self.model = None
+        self.tokenizer = None
+        self.labels = []
+        self.label_embeddings = None
+        self._resource = LazyResource("image_relevance", self._load_model)
+
+    def _load_model(self):
+        from transformers import CLIPModel, CLIPTokenizer
+        print(f"Loading image relevance model {self.model_name}")
+        model = CLIPModel.from_pretrained(self.model_name)
+        model.eval()
+        self.tokenizer = CLIPTokenizer.from_pretrained(self.model_name)
+        size = model.config.vision_config.image_size
+        PREPROCESS_SPECS["clip"]["size"] = (size, size)
+        self.labels = [(dept, prompt) for dept, prompts in DEPARTMENT_PROMPTS.items() for prompt in prompts]
+        self.labels += [(None, prompt) for prompt in UNRELATED_PROMPTS]
+        self.model = model
+        self.label_embeddings = self.embed_texts([prompt for _, prompt in self.labels])
+        return model
+
+    def load(self):
+        """Load CLIP once; returns False when transformers or the weights are unavailable"""
+        return self._resource.get() is not None
+
+    def embed_texts(self, texts):
+        tokens = self.tokenizer(texts, padding=True, truncation=True, max_length=77, return_tensors="pt")
+        with torch.inference_mode():
+            features = self.model.get_text_features(**tokens)
+        return torch.nn.functional.normalize(features, dim=-1)
+
+    def embed_image(self, image_bytes):
+        key = hashlib.blake2b(image_bytes, digest_size=16).hexdigest()
+        embedding = self.embedding_cache.get(key)
+        if embedding is None:
+            # Same decode and resize as the other models, centre-cropped like CLIP's own preprocessing
+            pixels = preprocess(image_bytes, "clip")
+            with torch.inference_mode():
+                features = self.model.get_image_features(pixel_values=pixels)
+            embedding = torch.nn.functional.normalize(features, dim=-1)
+            self.embedding_cache.set(key, embedding)
+        return embedding
+
+    def score(self, image_bytes, complaint_text):
+        """
+        Zero-shot scores of the image over the complaint text, every department
+        prompt and the unrelated prompts, or None if the model is unavailable.
+        """
+        if not self.load():
+            return None
+        image_embedding = self.embed_image(image_bytes)
+        text_embedding = self.embed_texts([complaint_text])
+        candidates = torch.cat([text_embedding, self.label_embeddings])
+        scale = self.model.logit_scale.exp()
+        probs = (scale * image_embedding @ candidates.T).softmax(dim=-1)[0].tolist()
+
+        department_scores = {}
+        for (dept, _), p in zip(self.labels, probs[1:]):
+            if dept is not None:
+                department_scores[dept] = department_scores.get(dept, 0.0) + p
+        best = max(range(len(self.labels)), key=lambda i: probs[i + 1])
+        relevance = probs[0] + sum(department_scores.values())
+        return {
+            "relevance": round(relevance, 4),
+            "complaint_match": round(probs[0], 4),
+            "relevant": relevance >= self.threshold,
+            "department_scores": {d: round(p, 4) for d, p in department_scores.items()},
+            "closest_label": self.labels[best][1],
+        }
+
+    def stats(self):
+        return {
+            "enabled": IMAGE_RELEVANCE_ENABLED,
+            "model": self.model_name,
+            "loaded": self._resource.ready,
+            "load_error": self._resource.error,
+            "embedding_cache": self.embedding_cache.stats(),
+        }
+
+relevance_engine = ImageRelevanceEngine()
+
+def describe_relevance(result):
+    """Short assessment for the complainer and officer views"""
+    if result["relevant"]:
+        return (f"The image appears relevant to the complaint (relevance {result['relevance']:.0%}; "
+                f"closest match: {result['closest_label']}).")
+    return (f"The image does not clearly show the reported issue (relevance {result['relevance']:.0%}; "
+            f"closest match: {result['closest_label']}). An officer will review it.")
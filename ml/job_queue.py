@@ -0,0 +1,230 @@
+# Persistent job queue for asynchronous complaint intake
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+import traceback
+
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", os.getenv("COMPLAINT_DB_PATH", "complaints.sqlite3"))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_QUEUE_MAX_PENDING = int(os.getenv("JOB_QUEUE_MAX_PENDING", "200"))
+JOB_STALE_SECONDS = int(os.getenv("JOB_STALE_SECONDS", "600"))
+# Running jobs refresh updated_at this often so only jobs of dead workers look stale
+JOB_HEARTBEAT_SECONDS = int(os.getenv("JOB_HEARTBEAT_SECONDS", "60"))
+JOB_POLL_SECONDS = 1.0
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+FINISHED_STATES = (DONE, FAILED)
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS complaint_jobs (
+        id TEXT PRIMARY KEY,
+        status TEXT NOT NULL,
+        complaint TEXT NOT NULL,
+        location TEXT NOT NULL,
+        image BLOB,
+        image_name TEXT,
+        result TEXT,
+        error TEXT,
+        created_at REAL NOT NULL,
+        updated_at REAL NOT NULL
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_complaint_jobs_status ON complaint_jobs (status, created_at)",
+]
+
+class QueueFullError(RuntimeError):
+    pass
+
+class JobQueue:
+    """
+    Jobs live in SQLite so they survive restarts and can be shared by several
+    server processes. Each process runs a small pool of worker threads that
+    claim queued jobs atomically and hand them to handler(job) -> result dict.
+    """
+
+    def __init__(self, handler, path=JOB_DB_PATH, workers=JOB_WORKERS, max_pending=JOB_QUEUE_MAX_PENDING):
+        self.handler = handler
+        self.path = path
+        self.workers = workers
+        self.max_pending = max_pending
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self._threads = []
+        self._running = set()
+        self._next_requeue = 0.0
+        self._pid = None
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            for statement in SCHEMA:
+                conn.execute(statement)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def pending_count(self):
+        return self.connect().execute(
+            "SELECT COUNT(*) FROM complaint_jobs WHERE status IN (?, ?)", (QUEUED, RUNNING)).fetchone()[0]
+
+    def submit(self, complaint, location, image=None, image_name=None):
+        """Persist a job and return its id; raises QueueFullError when the backlog is too long"""
+        self.start_workers()
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        conn = self.connect()
+        # Count and insert in one write transaction, so concurrent submits (from any process) respect the cap
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            full = self.pending_count() >= self.max_pending
+            if not full:
+                conn.execute(
+                    """INSERT INTO complaint_jobs (id, status, complaint, location, image, image_name, created_at, updated_at)
+                       VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                    (job_id, QUEUED, complaint, location, image, image_name, now, now))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if full:
+            with self._lock:
+                self.rejected += 1
+            raise QueueFullError(f"Complaint queue is full ({self.max_pending} pending)")
+        self._wakeup.set()
+        return job_id
+
+    def get(self, job_id):
+        row = self.connect().execute(
+            "SELECT id, status, result, error, created_at, updated_at FROM complaint_jobs WHERE id = ?",
+            (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        job["position"] = None
+        if job["status"] == QUEUED:
+            job["position"] = self.connect().execute(
+                "SELECT COUNT(*) FROM complaint_jobs WHERE status = ? AND created_at < ?",
+                (QUEUED, job["created_at"])).fetchone()[0]
+        return job
+
+    # === Workers ===
+
+    def start_workers(self):
+        """Start this process's worker threads (once per process, safe to call repeatedly)"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._running = set()
+            self._threads = [
+                threading.Thread(target=self._work_loop, name=f"complaint-job-{i}", daemon=True)
+                for i in range(self.workers)
+            ]
+            self._threads.append(threading.Thread(target=self._heartbeat_loop, name="complaint-job-heartbeat", daemon=True))
+            self._pid = os.getpid()
+            for thread in self._threads:
+                thread.start()
+
+    def _requeue_stale(self):
+        # Jobs left running by a crashed or restarted process go back on the queue
+        with self._lock:
+            if time.time() < self._next_requeue:
+                return
+            self._next_requeue = time.time() + JOB_HEARTBEAT_SECONDS
+        cur = self.connect().execute(
+            "UPDATE complaint_jobs SET status = ?, updated_at = ? WHERE status = ? AND updated_at < ?",
+            (QUEUED, time.time(), RUNNING, time.time() - JOB_STALE_SECONDS))
+        if cur.rowcount:
+            print(f"Requeued {cur.rowcount} stale complaint jobs")
+
+    def _claim(self):
+        conn = self.connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT * FROM complaint_jobs WHERE status = ? ORDER BY created_at LIMIT 1", (QUEUED,)).fetchone()
+            if row is not None:
+                conn.execute("UPDATE complaint_jobs SET status = ?, updated_at = ? WHERE id = ?",
+                             (RUNNING, time.time(), row["id"]))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return dict(row) if row is not None else None
+
+    def _finish(self, job_id, status, result=None, error=None):
+        # The uploaded image is not needed once the job is finished
+        self.connect().execute(
+            "UPDATE complaint_jobs SET status = ?, result = ?, error = ?, image = NULL, updated_at = ? WHERE id = ?",
+            (status, json.dumps(result) if result is not None else None, error, time.time(), job_id))
+
+    def _heartbeat_loop(self):
+        # Beat at least twice per stale window so a live job is never requeued
+        interval = min(JOB_HEARTBEAT_SECONDS, JOB_STALE_SECONDS / 2)
+        while True:
+            time.sleep(interval)
+            with self._lock:
+                job_ids = list(self._running)
+            if not job_ids:
+                continue
+            try:
+                self.connect().execute(
+                    f"UPDATE complaint_jobs SET updated_at = ? WHERE status = ? AND id IN ({','.join('?' * len(job_ids))})",
+                    (time.time(), RUNNING, *job_ids))
+            except sqlite3.Error as e:
+                print(f"Error refreshing complaint job heartbeat: {e}")
+
+    def _work_loop(self):
+        while True:
+            try:
+                # Checked on every pass, so jobs of a worker that died later are picked up too
+                self._requeue_stale()
+                job = self._claim()
+            except sqlite3.Error as e:
+                print(f"Error claiming complaint job: {e}")
+                job = None
+            if job is None:
+                # Poll as well, jobs may be submitted by other processes
+                self._wakeup.wait(JOB_POLL_SECONDS)
+                self._wakeup.clear()
+                continue
+            print(f"Processing complaint job {job['id']}")
+            with self._lock:
+                self._running.add(job["id"])
+            try:
+                result = self.handler(job)
+                self._finish(job["id"], DONE, result=result)
+                self.completed += 1
+            except Exception as e:
+                print(f"Complaint job {job['id']} failed: {e}")
+                print(traceback.format_exc())
+                self._finish(job["id"], FAILED, error=str(e))
+                self.failed += 1
+            finally:
+                with self._lock:
+                    self._running.discard(job["id"])
+
+    def stats(self):
+        counts = dict(self.connect().execute(
+            "SELECT status, COUNT(*) FROM complaint_jobs GROUP BY status").fetchall())
+        return {
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "queued": counts.get(QUEUED, 0),
+            "running": counts.get(RUNNING, 0),
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,117 @@
+# Thread-safe lazy initialization of heavy components (models, clients) with optional warm-up
+import os
+import time
+import threading
+
+LAZY_RETRY_SECONDS = float(os.getenv("LAZY_RETRY_SECONDS", "60"))
+WARMUP_ON_START = os.getenv("WARMUP_ON_START", "0") == "1"
+
+NOT_LOADED, LOADING, READY, FAILED = "not_loaded", "loading", "ready", "failed"
+
+# Every resource by name, for /health and warm-up
+registry = {}
+
+class LazyResource:
+    """
+    Builds a value with factory() on the first get() and keeps it for the life
+    of the process. A factory that raises or returns None marks the resource
+    failed; get() then returns None and only retries after retry_after seconds.
+    With is_stale(value), the value is rebuilt when that returns True (checked at
+    most every stale_check_seconds); if the rebuild fails the old value is kept.
+    """
+
+    def __init__(self, name, factory, retry_after=LAZY_RETRY_SECONDS, is_stale=None, stale_check_seconds=5.0):
+        self.name = name
+        self.factory = factory
+        self.retry_after = retry_after
+        self.is_stale = is_stale
+        self.stale_check_seconds = stale_check_seconds
+        self.state = NOT_LOADED
+        self.error = None
+        self.load_seconds = None
+        self.reloads = 0
+        self._value = None
+        self._failed_at = None
+        self._checked_at = time.monotonic()
+        self._lock = threading.Lock()
+        registry[name] = self
+
+    def _stale(self):
+        if self.is_stale is None:
+            return False
+        now = time.monotonic()
+        if now - self._checked_at < self.stale_check_seconds:
+            return False
+        self._checked_at = now
+        try:
+            return bool(self.is_stale(self._value))
+        except Exception as e:
+            print(f"Error checking {self.name} for changes: {e}")
+            return False
+
+    def get(self):
+        stale = False
+        if self.state == READY:
+            stale = self._stale()
+            if not stale:
+                return self._value
+        with self._lock:
+            if self.state == READY and not stale:
+                return self._value
+            if self.state == FAILED and time.monotonic() - self._failed_at < self.retry_after:
+                return None
+            previous = self._value
+            if stale:
+                print(f"Reloading {self.name}, its source changed")
+            self.state = LOADING
+            start = time.perf_counter()
+            try:
+                value = self.factory()
+                self.error = None if value is not None else "factory returned None"
+            except Exception as e:
+                print(f"Failed to initialize {self.name}: {e}")
+                value = None
+                self.error = str(e)
+            self.load_seconds = round(time.perf_counter() - start, 3)
+            self._checked_at = time.monotonic()
+            if value is None and previous is not None:
+                self.state = READY  # keep serving the old value; is_stale retries the reload
+            elif value is None:
+                self.state = FAILED
+                self._failed_at = time.monotonic()
+            else:
+                self._value = value
+                self.state = READY
+                self.reloads += stale
+                print(f"Initialized {self.name} in {self.load_seconds}s")
+        return self._value
+
+    def reset(self):
+        """Forget the value so the next get() builds a new one (e.g. in a forked worker)"""
+        with self._lock:
+            self._value = None
+            self.state = NOT_LOADED
+            self.error = None
+            self.load_seconds = None
+
+    @property
+    def ready(self):
+        return self.state == READY
+
+    def status(self):
+        return {"state": self.state, "load_seconds": self.load_seconds, "error": self.error, "reloads": self.reloads}
+
+def component_status():
+    return {name: resource.status() for name, resource in registry.items()}
+
+def warm_up(names=None):
+    """Initialize resources (all by default) in a background thread; returns the thread"""
+    resources = [registry[n] for n in names] if names else list(registry.values())
+
+    def run():
+        for resource in resources:
+            resource.get()
+
+    thread = threading.Thread(target=run, name="warm-up", daemon=True)
+    thread.start()
+    return thread
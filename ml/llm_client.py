@@ -0,0 +1,241 @@
+# Shared LLM client with a persistent prompt cache
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import namedtuple
+from dotenv import load_dotenv
+from lazy_resource import LazyResource
+
+# Load environment variables
+load_dotenv(".env")
+groq_api_key = os.getenv("GROQ_API_KEY")
+
+LLM_MODEL = os.getenv("LLM_MODEL", "llama3-8b-8192")
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") == "1"
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "llm_cache.sqlite3")
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))  # seconds
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "10000"))
+
+# Check the size limit every N writes instead of on every insert
+EVICTION_INTERVAL = 100
+
+LLMResponse = namedtuple("LLMResponse", ["content", "cached"])
+
+def prompt_key(kind, model, payload, params=None):
+    """Content address for a prompt: hash of everything that affects the answer"""
+    raw = json.dumps({"kind": kind, "model": model, "payload": payload, "params": params or {}},
+                     sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+class LLMCache:
+    """SQLite-backed result cache with TTL expiry and LRU size eviction"""
+
+    def __init__(self, path=LLM_CACHE_PATH, ttl=LLM_CACHE_TTL, max_entries=LLM_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self.errors = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+
+    def _connection(self):
+        # Connections must not be shared across a fork, reopen in each process
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("""CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )""")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_accessed ON llm_cache (accessed_at)")
+            conn.commit()
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    def get(self, key):
+        now = time.time()
+        try:
+            with self._lock:
+                conn = self._connection()
+                row = conn.execute("SELECT value, created_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    self.misses += 1
+                    return None
+                value, created_at = row
+                if self.ttl and now - created_at > self.ttl:
+                    conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                    conn.commit()
+                    self.expired += 1
+                    self.misses += 1
+                    return None
+                conn.execute("UPDATE llm_cache SET accessed_at = ? WHERE key = ?", (now, key))
+                conn.commit()
+                self.hits += 1
+                return value
+        except sqlite3.Error as e:
+            print(f"LLM cache read failed: {e}")
+            self.errors += 1
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        now = time.time()
+        try:
+            with self._lock:
+                conn = self._connection()
+                conn.execute("INSERT OR REPLACE INTO llm_cache (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                             (key, value, now, now))
+                conn.commit()
+                self._writes += 1
+                if self._writes % EVICTION_INTERVAL == 0:
+                    self._evict(conn, now)
+        except sqlite3.Error as e:
+            print(f"LLM cache write failed: {e}")
+            self.errors += 1
+
+    def _evict(self, conn, now):
+        if self.ttl:
+            cur = conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl,))
+            self.expired += cur.rowcount
+        count = conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        if count > self.max_entries:
+            # Drop the least recently used entries beyond the size limit
+            cur = conn.execute("""DELETE FROM llm_cache WHERE key IN (
+                SELECT key FROM llm_cache ORDER BY accessed_at ASC LIMIT ?)""", (count - self.max_entries,))
+            self.evictions += cur.rowcount
+        conn.commit()
+
+    def clear(self):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM llm_cache")
+            conn.commit()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        entries = None
+        try:
+            with self._lock:
+                entries = self._connection().execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        except sqlite3.Error:
+            pass
+        return {
+            "path": self.path,
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "expired": self.expired,
+            "evictions": self.evictions,
+            "errors": self.errors,
+        }
+
+class CachedLLM:
+    """Drop-in for ChatGroq.invoke that answers repeated prompts from the cache"""
+
+    def __init__(self, model=LLM_MODEL, api_key=None, cache=None, params=None, root=None):
+        self.model = model
+        self.api_key = api_key if api_key is not None else groq_api_key
+        self.cache = cache
+        self.params = params or {}
+        self._root = root
+        # Bound copies reuse the root's ChatGroq client
+        self._client = LazyResource(f"llm:{model}", self._load_client) if root is None else None
+
+    def _load_client(self):
+        from langchain_groq import ChatGroq
+        return ChatGroq(model=self.model, api_key=self.api_key)
+
+    @property
+    def client(self):
+        if self._root is not None:
+            return self._root.client
+        client = self._client.get()
+        if client is None:
+            raise RuntimeError(f"LLM client unavailable: {self._client.error}")
+        return client
+
+    def bind(self, **params):
+        """Return a client with extra model parameters sharing this one's connection and cache"""
+        return CachedLLM(self.model, self.api_key, self.cache, {**self.params, **params}, self._root or self)
+
+    def invoke(self, prompt, cache_if=None):
+        """Answer from the cache or the model; cache_if(content) can veto storing a bad response"""
+        key = prompt_key("invoke", self.model, prompt, self.params)
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return LLMResponse(cached, True)
+        client = self.client
+        if self.params:
+            client = client.bind(**self.params)
+        content = client.invoke(prompt).content
+        if self.cache is not None and (cache_if is None or cache_if(content)):
+            self.cache.set(key, content)
+        return LLMResponse(content, False)
+
+class CachedSummarizeChain:
+    """load_summarize_chain wrapper keyed by the document contents"""
+
+    def __init__(self, llm, chain_type="map_reduce"):
+        self.llm = llm
+        self.chain_type = chain_type
+        self._chain = LazyResource(f"summarize_chain:{chain_type}", self._load_chain)
+
+    def _load_chain(self):
+        from langchain.chains import load_summarize_chain
+        return load_summarize_chain(self.llm.client, chain_type=self.chain_type)
+
+    @property
+    def chain(self):
+        chain = self._chain.get()
+        if chain is None:
+            raise RuntimeError(f"Summarize chain unavailable: {self._chain.error}")
+        return chain
+
+    def run(self, docs):
+        key = prompt_key("summarize:" + self.chain_type, self.llm.model, [d.page_content for d in docs])
+        cache = self.llm.cache
+        if cache is not None:
+            cached = cache.get(key)
+            if cached is not None:
+                return cached
+        summary = self.chain.run(docs)
+        if cache is not None:
+            cache.set(key, summary)
+        return summary
+
+# Process-wide instances shared by every module
+_shared_cache = LLMCache() if LLM_CACHE_ENABLED else None
+_shared_llm = CachedLLM(cache=_shared_cache)
+_summarize_chains = {}
+_chains_lock = threading.Lock()
+
+def get_llm():
+    return _shared_llm
+
+def get_summarize_chain(chain_type="map_reduce"):
+    with _chains_lock:
+        if chain_type not in _summarize_chains:
+            _summarize_chains[chain_type] = CachedSummarizeChain(_shared_llm, chain_type)
+        return _summarize_chains[chain_type]
+
+def cache_stats():
+    if _shared_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **_shared_cache.stats()}
@@ -0,0 +1,391 @@
+# Export and serve the skin and deepfake models on the fastest available CPU backend
+import os
+import sys
+import json
+import time
+import argparse
+import torch
+import torch.nn as nn
+
+MODEL_BACKEND = os.getenv("MODEL_BACKEND", "auto")  # auto, onnx, torchscript or eager
+MODEL_QUANTIZE = os.getenv("MODEL_QUANTIZE", "0") == "1"  # allow int8 exports that passed validation on real images
+MODEL_CHANNELS_LAST = os.getenv("MODEL_CHANNELS_LAST", "1") == "1"
+MODEL_EXPORT_DIR = os.getenv("MODEL_EXPORT_DIR", "model_exports")
+MODEL_MIN_AGREEMENT = float(os.getenv("MODEL_MIN_AGREEMENT", "0.99"))  # top-1 agreement a variant needs to be served
+# Sample images for `validate` (a <model name> subdirectory is used when present)
+MODEL_VALIDATION_IMAGES = os.getenv("MODEL_VALIDATION_IMAGES")
+MODEL_RELOAD_CHECK_SECONDS = float(os.getenv("MODEL_RELOAD_CHECK_SECONDS", "5"))  # how often checkpoints are stat'ed
+ONNX_OPSET = 17
+
+# === Eager models ===
+
+def load_eager_skin_model(path):
+    import torchvision.models as models  # importing torchvision takes seconds, only pay it when needed
+    model = models.densenet121(weights=None)
+    model.classifier = nn.Linear(model.classifier.in_features, 7)
+    state_dict = torch.load(path, map_location="cpu")
+    model.load_state_dict(state_dict, strict=False)
+    return model.eval()
+
+def load_eager_deepfake_model(path):
+    # Full pickled module (only load checkpoints you trust)
+    return torch.load(path, map_location=torch.device("cpu"), weights_only=False).eval()
+
+MODEL_SPECS = {
+    "skin": {
+        "path": "health0check-feature/skin-disease-model2.pth",
+        "load_eager": load_eager_skin_model,
+        "input_shape": (3, 224, 224),
+    },
+    "deepfake": {
+        "path": "deepfake_model.pt",
+        "load_eager": load_eager_deepfake_model,
+        "input_shape": (3, 128, 128),
+    },
+}
+
+# Variant name -> (backend, int8)
+VARIANTS = {
+    "eager": ("eager", False),
+    "torchscript": ("torchscript", False),
+    "torchscript-int8": ("torchscript", True),
+    "onnx": ("onnx", False),
+    "onnx-int8": ("onnx", True),
+}
+DEFAULT_ORDER = ["onnx", "torchscript", "eager"]
+
+def artifact_path(name, variant, export_dir=MODEL_EXPORT_DIR):
+    backend, int8 = VARIANTS[variant]
+    return os.path.join(export_dir, f"{name}{'.int8' if int8 else ''}.{'onnx' if backend == 'onnx' else 'ts'}")
+
+def metadata_path(name, export_dir=MODEL_EXPORT_DIR):
+    return os.path.join(export_dir, f"{name}.json")
+
+def source_signature(path):
+    """Exports are only served while the checkpoint they came from is unchanged"""
+    st = os.stat(path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+def model_version(path, variant):
+    """Identifies the weights a loaded model computes with, for caches keyed on its outputs"""
+    signature = source_signature(path)
+    return f"{variant}-{signature['size']}-{signature['mtime_ns']}"
+
+def source_changed(model):
+    """True once the checkpoint a loaded model came from has been replaced"""
+    try:
+        return model_version(model.source_path, model.variant) != model.version
+    except OSError:
+        return False  # mid-replace or removed: keep serving what is loaded
+
+def read_metadata(name, export_dir=MODEL_EXPORT_DIR):
+    try:
+        with open(metadata_path(name, export_dir), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def write_metadata(name, metadata, export_dir=MODEL_EXPORT_DIR):
+    path = metadata_path(name, export_dir)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(metadata, f, indent=2)
+    os.replace(tmp_path, path)
+
+def onnxruntime_available():
+    try:
+        import onnxruntime  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+# === Serving ===
+
+class RuntimeModel:
+    """
+    Callable wrapper with the same tensor in / tensor out contract as the eager
+    module, whatever backend runs underneath.
+    """
+
+    def __init__(self, name, variant, run, channels_last=False, module=None):
+        self.name = name
+        self.module = module
+        self.variant = variant
+        self.backend = VARIANTS[variant][0]
+        self.channels_last = channels_last
+        self.source_path = None
+        self.version = None
+        self._run = run
+
+    def __call__(self, batch):
+        if self.channels_last:
+            batch = batch.contiguous(memory_format=torch.channels_last)
+        return self._run(batch)
+
+    def eval(self):
+        return self
+
+    @property
+    def fork_safe(self):
+        # onnxruntime sessions own thread pools that do not survive a fork
+        return self.backend != "onnx"
+
+    def share_memory(self):
+        """Put torch weights in shared memory so forked workers map the same pages"""
+        if self.module is not None:
+            self.module.share_memory()
+        return self
+
+    def __repr__(self):
+        return f"RuntimeModel({self.name}, {self.variant}, channels_last={self.channels_last})"
+
+def torch_runner(module):
+    def run(batch):
+        with torch.inference_mode():
+            return module(batch)
+    return run
+
+def onnx_runner(path):
+    import onnxruntime as ort
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    options.intra_op_num_threads = torch.get_num_threads()  # same per-worker budget as torch
+    session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+    input_name = session.get_inputs()[0].name
+
+    def run(batch):
+        # InferenceSession.run is thread-safe, so one session serves every request thread
+        return torch.from_numpy(session.run(None, {input_name: batch.detach().cpu().numpy()})[0])
+    return run
+
+def open_variant(name, variant, source_path, channels_last=MODEL_CHANNELS_LAST, export_dir=MODEL_EXPORT_DIR):
+    backend, _ = VARIANTS[variant]
+    if backend == "eager":
+        module = MODEL_SPECS[name]["load_eager"](source_path)
+        if channels_last:
+            module = module.to(memory_format=torch.channels_last)
+        return RuntimeModel(name, variant, torch_runner(module), channels_last, module)
+    path = artifact_path(name, variant, export_dir)
+    if backend == "torchscript":
+        # Frozen weights keep the layout they were traced with, recorded at export time
+        module = torch.jit.load(path, map_location="cpu").eval()
+        traced_channels_last = read_metadata(name, export_dir).get("channels_last", False)
+        return RuntimeModel(name, variant, torch_runner(module), traced_channels_last, module)
+    return RuntimeModel(name, variant, onnx_runner(path))
+
+def int8_validated(result):
+    """An int8 variant must have matched the eager model on real images, random inputs say little about accuracy"""
+    return result.get("validated_on") == "images" and result.get("top1_agreement", 0) >= MODEL_MIN_AGREEMENT
+
+def candidate_variants(name, source_path, export_dir=MODEL_EXPORT_DIR):
+    """Servable variants for this checkpoint, fastest validated first"""
+    metadata = read_metadata(name, export_dir)
+    fresh = metadata.get("source") == source_signature(source_path)
+    benchmarks = metadata.get("benchmarks", {}) if fresh else {}
+    available = ["eager"]
+    if fresh:
+        for variant in metadata.get("exports", []):
+            if VARIANTS[variant][0] == "onnx" and not onnxruntime_available():
+                continue
+            if VARIANTS[variant][1] and not (MODEL_QUANTIZE and int8_validated(benchmarks.get(variant, {}))):
+                continue
+            if os.path.exists(artifact_path(name, variant, export_dir)):
+                available.append(variant)
+    if MODEL_BACKEND != "auto":
+        return [v for v in available if VARIANTS[v][0] == MODEL_BACKEND] + ["eager"]
+    if benchmarks:
+        # Measured by `model_runtime.py validate`: fastest variant that still agrees with eager
+        passed = [v for v in available
+                  if v == "eager" or benchmarks.get(v, {}).get("top1_agreement", 0) >= MODEL_MIN_AGREEMENT]
+        return sorted(passed, key=lambda v: benchmarks.get(v, {}).get("ms_per_image", float("inf")))
+    preferred = [v for backend in DEFAULT_ORDER for v in available if VARIANTS[v][0] == backend]
+    return preferred or ["eager"]
+
+def load_model(name, path=None, export_dir=MODEL_EXPORT_DIR):
+    """Load a model on the fastest backend available for it, or None if it cannot be loaded"""
+    path = path or MODEL_SPECS[name]["path"]
+    try:
+        variants = candidate_variants(name, path, export_dir)
+    except OSError as e:
+        print(f"Error loading {name} model: {e}")
+        return None
+    for variant in variants:
+        try:
+            version = model_version(path, variant)  # before loading, so a replace mid-load is seen later
+            model = open_variant(name, variant, path, export_dir=export_dir)
+            model.source_path = path
+            model.version = version
+            print(f"Loaded {name} model: {model}")
+            return model
+        except Exception as e:
+            print(f"Could not load {name} model as {variant}: {e}")
+    return None
+
+# === Export ===
+
+def export_model(name, path=None, export_dir=MODEL_EXPORT_DIR, onnx=True, quantize=True,
+                 channels_last=MODEL_CHANNELS_LAST):
+    """Write TorchScript (and ONNX) exports of a checkpoint, with int8 variants when quantize is set"""
+    path = path or MODEL_SPECS[name]["path"]
+    os.makedirs(export_dir, exist_ok=True)
+    eager = MODEL_SPECS[name]["load_eager"](path)
+    example = torch.randn(2, *MODEL_SPECS[name]["input_shape"])
+    exports = []
+
+    sources = {"torchscript": eager}
+    if quantize:
+        # Dynamic int8 quantization covers Linear layers; convolutions stay float32
+        sources["torchscript-int8"] = torch.ao.quantization.quantize_dynamic(eager, {nn.Linear}, dtype=torch.qint8)
+
+    for variant, module in sources.items():
+        try:
+            traced_example = example
+            if channels_last:
+                module = module.to(memory_format=torch.channels_last)
+                traced_example = example.contiguous(memory_format=torch.channels_last)
+            with torch.inference_mode():
+                traced = torch.jit.trace(module, traced_example, check_trace=False)
+            traced = torch.jit.freeze(traced.eval())
+            traced.save(artifact_path(name, variant, export_dir))
+            exports.append(variant)
+            print(f"Exported {artifact_path(name, variant, export_dir)}")
+        except Exception as e:
+            print(f"Failed to export {name} as {variant}: {e}")
+
+    if onnx:
+        eager = MODEL_SPECS[name]["load_eager"](path)  # fresh copy in the default layout
+        onnx_path = artifact_path(name, "onnx", export_dir)
+        try:
+            torch.onnx.export(eager, example, onnx_path, opset_version=ONNX_OPSET,
+                              input_names=["input"], output_names=["output"],
+                              dynamic_axes={"input": {0: "batch"}, "output": {0: "batch"}}, dynamo=False)
+            exports.append("onnx")
+            print(f"Exported {onnx_path}")
+        except Exception as e:
+            print(f"Failed to export {name} to ONNX: {e}")
+        if quantize and "onnx" in exports:
+            try:
+                from onnxruntime.quantization import quantize_dynamic, QuantType
+                quantize_dynamic(onnx_path, artifact_path(name, "onnx-int8", export_dir), weight_type=QuantType.QInt8)
+                exports.append("onnx-int8")
+                print(f"Exported {artifact_path(name, 'onnx-int8', export_dir)}")
+            except ImportError:
+                print("onnxruntime not installed, skipping the int8 ONNX export")
+
+    # Earlier benchmarks no longer describe these files
+    write_metadata(name, {"source": source_signature(path), "exports": exports, "channels_last": channels_last},
+                   export_dir)
+    return exports
+
+# === Validation ===
+
+def sample_inputs(name, image_dir=None, count=64):
+    """
+    Real images from image_dir (or its <name> subdirectory), preprocessed exactly
+    as they are when served, else random tensors. Returns (inputs, "images" or "random").
+    """
+    shape = MODEL_SPECS[name]["input_shape"]
+    if not image_dir:
+        return torch.randn(count, *shape), "random"
+    from image_preprocessing import prepare_images, normalize_batch
+    if os.path.isdir(os.path.join(image_dir, name)):
+        image_dir = os.path.join(image_dir, name)
+    paths = [os.path.join(image_dir, filename) for filename in sorted(os.listdir(image_dir))]
+    images = [image for image in prepare_images([p for p in paths if os.path.isfile(p)], name)
+              if not isinstance(image, Exception)][:count]
+    if not images:
+        raise ValueError(f"No readable images in {image_dir}")
+    return normalize_batch(images, name), "images"
+
+def run_batches(model, inputs, batch_size):
+    return torch.cat([model(inputs[i:i + batch_size]) for i in range(0, len(inputs), batch_size)])
+
+def benchmark(model, inputs, batch_size, runs):
+    run_batches(model, inputs, batch_size)  # warm-up
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        run_batches(model, inputs, batch_size)
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    median = timings[len(timings) // 2]
+    return {
+        "ms_per_image": round(median * 1000 / len(inputs), 4),
+        "images_per_second": round(len(inputs) / median, 1),
+        "ms_per_batch_p50": round(median * 1000 / -(-len(inputs) // batch_size), 3),
+    }
+
+def compare_outputs(reference, output):
+    if reference.shape[1] == 1:
+        # Single-logit/probability models: compare the thresholded decision
+        agree = ((reference[:, 0] > 0.5) == (output[:, 0] > 0.5)).float().mean().item()
+    else:
+        agree = (reference.argmax(dim=1) == output.argmax(dim=1)).float().mean().item()
+    return {
+        "top1_agreement": round(agree, 4),
+        "max_abs_diff": round((reference - output).abs().max().item(), 6),
+    }
+
+def validate(name, path=None, export_dir=MODEL_EXPORT_DIR, image_dir=None, batch_size=16, runs=10):
+    """Accuracy deltas and latency of every available variant against the eager float32 model"""
+    path = path or MODEL_SPECS[name]["path"]
+    inputs, validated_on = sample_inputs(name, image_dir)
+    if validated_on == "random":
+        print(f"Validating {name} on random inputs: int8 variants will not be served until validated with --images")
+    metadata = read_metadata(name, export_dir)
+    if metadata.get("source") != source_signature(path):
+        raise ValueError(f"Exports of {name} are missing or stale, run the export command first")
+
+    reference_model = RuntimeModel(name, "eager", torch_runner(MODEL_SPECS[name]["load_eager"](path)))
+    reference = run_batches(reference_model, inputs, batch_size).float().reshape(len(inputs), -1)
+    report = {"eager-fp32": {**compare_outputs(reference, reference),
+                             **benchmark(reference_model, inputs, batch_size, runs)}}
+    benchmarks = {}
+    for variant in ["eager"] + metadata.get("exports", []):
+        if VARIANTS[variant][0] == "onnx" and not onnxruntime_available():
+            continue
+        try:
+            model = open_variant(name, variant, path, export_dir=export_dir)
+        except Exception as e:
+            report[variant] = {"error": str(e)}
+            continue
+        output = run_batches(model, inputs, batch_size).float().reshape(len(inputs), -1)
+        benchmarks[variant] = {**compare_outputs(reference, output), **benchmark(model, inputs, batch_size, runs),
+                               "validated_on": validated_on, "samples": len(inputs)}
+        report[variant] = benchmarks[variant]
+    metadata["benchmarks"] = benchmarks
+    write_metadata(name, metadata, export_dir)
+    report["selected"] = candidate_variants(name, path, export_dir)[0]
+    return report
+
+# CLI entry point
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export and validate optimized skin and deepfake models")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export_parser = subparsers.add_parser("export", help="write TorchScript/ONNX exports")
+    export_parser.add_argument("--no-onnx", action="store_true")
+    export_parser.add_argument("--no-int8", action="store_true")
+    validate_parser = subparsers.add_parser("validate", help="compare exports with the eager model")
+    validate_parser.add_argument("--images", default=MODEL_VALIDATION_IMAGES,
+                                 help="directory of sample images, needed before int8 variants are served "
+                                      "(default: $MODEL_VALIDATION_IMAGES, random inputs otherwise)")
+    validate_parser.add_argument("--batch-size", type=int, default=16)
+    validate_parser.add_argument("--runs", type=int, default=10)
+    for sub in (export_parser, validate_parser):
+        sub.add_argument("models", nargs="*", help=f"any of {', '.join(MODEL_SPECS)} (default: all)")
+        sub.add_argument("--export-dir", default=MODEL_EXPORT_DIR)
+    args = parser.parse_args()
+    unknown = [m for m in args.models if m not in MODEL_SPECS]
+    if unknown:
+        parser.error(f"unknown models: {', '.join(unknown)}")
+
+    results = {}
+    for model_name in args.models or list(MODEL_SPECS):
+        if args.command == "export":
+            results[model_name] = export_model(model_name, export_dir=args.export_dir,
+                                               onnx=not args.no_onnx, quantize=not args.no_int8)
+        else:
+            results[model_name] = validate(model_name, export_dir=args.export_dir, image_dir=args.images,
+                                           batch_size=args.batch_size, runs=args.runs)
+    json.dump(results, sys.stdout, indent=2)
+    print()
@@ -0,0 +1,154 @@
+# News URL classification: known news domains by hostname suffix, then a hostname keyword fallback
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import threading
+from functools import lru_cache
+
+NEWS_DOMAINS_PATH = os.getenv(
+    "NEWS_DOMAINS_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "news_domains.txt"))
+NEWS_DOMAINS_RELOAD_SECONDS = float(os.getenv("NEWS_DOMAINS_RELOAD_SECONDS", "30"))
+NEWS_HOST_CACHE_SIZE = int(os.getenv("NEWS_HOST_CACHE_SIZE", "65536"))
+
+# Words that mark an unknown host as a news site. They must be a whole hostname label
+# or hyphen-separated word ("news.example.com", "city-herald.org"): prefixes and
+# suffixes matched "sometimes.com" and "newsletter.example.com". Compound brand
+# names such as nytimes.com or news18.com belong in the domain list instead.
+NEWS_KEYWORDS = ["news", "times", "herald", "tribune", "gazette", "chronicle", "bulletin", "telegraph"]
+HOST_WORD_PATTERN = re.compile(r"[.-]")
+# Path segments that mark a news section on a general-purpose site (example.org/news/...)
+NEWS_PATH_PATTERN = re.compile(r"/(?:news|breaking-news|latest-news)(?:/|$)", re.IGNORECASE)
+# scheme://[user@]host[:port]path -- cheaper than urlsplit, which dominated the per-URL cost
+URL_PATTERN = re.compile(r"\s*[A-Za-z][A-Za-z0-9+.-]*://(?:[^@/?#]*@)?([^:/?#]*)[^/?#]*([^?#]*)")
+
+DOMAIN, KEYWORD, PATH = "domain", "keyword", "path"
+
+def load_domains(path):
+    """Domains from the list file: one per line, '#' starts a comment"""
+    domains = set()
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            domain = line.split("#", 1)[0].strip().lower().strip(".")
+            if domain:
+                domains.add(domain)
+    return domains
+
+def url_host_and_path(url):
+    match = URL_PATTERN.match(url)
+    if match is None:
+        return "", ""
+    return match.group(1).lower().rstrip("."), match.group(2)
+
+class NewsDomainClassifier:
+    """
+    Classifies URLs as news by hostname. The domain list is read once and read
+    again when the file changes (checked at most every reload_seconds); results
+    per hostname are memoized, since feeds link the same few sites over and over.
+    """
+
+    def __init__(self, path=NEWS_DOMAINS_PATH, keywords=NEWS_KEYWORDS, reload_seconds=NEWS_DOMAINS_RELOAD_SECONDS):
+        self.path = path
+        self.reload_seconds = reload_seconds
+        self.keywords = frozenset(keywords)
+        self.domains = frozenset()
+        self._mtime = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.classify_host = lru_cache(maxsize=NEWS_HOST_CACHE_SIZE)(self._classify_host)
+        self._reload()
+
+    def _reload(self):
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            if self._mtime is None:
+                print(f"News domain list not found at {self.path}, using keywords only")
+                self._mtime = 0
+            return
+        if mtime == self._mtime:
+            return
+        try:
+            self.domains = frozenset(load_domains(self.path))
+            print(f"Loaded {len(self.domains)} news domains from {self.path}")
+        except Exception as e:
+            print(f"Error loading news domain list: {e}")
+        self._mtime = mtime
+        self.classify_host.cache_clear()
+
+    def check_for_updates(self):
+        now = time.monotonic()
+        if now - self._checked_at < self.reload_seconds:
+            return
+        with self._lock:
+            if now - self._checked_at >= self.reload_seconds:
+                self._reload()
+                self._checked_at = now
+
+    def _classify_host(self, host):
+        labels = host.split(".")
+        # Every suffix of at least two labels: www.bbc.co.uk -> bbc.co.uk -> co.uk
+        for i in range(len(labels) - 1):
+            if ".".join(labels[i:]) in self.domains:
+                return DOMAIN
+        # The TLD never carries a keyword
+        if not self.keywords.isdisjoint(HOST_WORD_PATTERN.split(".".join(labels[:-1]))):
+            return KEYWORD
+        return None
+
+    def classify(self, url):
+        """'domain', 'keyword' or 'path' for a news URL, None otherwise"""
+        host, path = url_host_and_path(url)
+        if not host:
+            return None
+        reason = self.classify_host(host)
+        if reason is None and NEWS_PATH_PATTERN.search(path):
+            reason = PATH
+        return reason
+
+    def classify_many(self, urls):
+        """Reasons for a batch of URLs, in order; the list file is checked once per batch"""
+        self.check_for_updates()
+        return [self.classify(url) for url in urls]
+
+    def stats(self):
+        cache = self.classify_host.cache_info()
+        return {
+            "path": self.path,
+            "domains": len(self.domains),
+            "keywords": len(self.keywords),
+            "host_cache": {"hits": cache.hits, "misses": cache.misses, "size": cache.currsize},
+        }
+
+news_classifier = NewsDomainClassifier()
+
+def is_news_url(url):
+    news_classifier.check_for_updates()
+    return news_classifier.classify(url) is not None
+
+def filter_news_urls(urls):
+    """The news URLs among urls, in their original order"""
+    return [url for url, reason in zip(urls, news_classifier.classify_many(urls)) if reason is not None]
+
+# CLI entry point: classify URLs in bulk, e.g. an export of the community feed
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Classify URLs (one per line) as news or not")
+    parser.add_argument("file", nargs="?", help="file of URLs (default: stdin)")
+    parser.add_argument("--summary", action="store_true", help="only print counts and timing")
+    args = parser.parse_args()
+
+    with open(args.file, encoding="utf-8") if args.file else sys.stdin as f:
+        urls = [line.strip() for line in f if line.strip()]
+    start = time.perf_counter()
+    reasons = news_classifier.classify_many(urls)
+    elapsed = time.perf_counter() - start
+    if not args.summary:
+        for url, reason in zip(urls, reasons):
+            print(json.dumps({"url": url, "news": reason is not None, "reason": reason}))
+    counts = {}
+    for reason in reasons:
+        counts[reason or "not_news"] = counts.get(reason or "not_news", 0) + 1
+    summary = {"urls": len(urls), "counts": counts, "ms_per_url": round(elapsed * 1000 / max(len(urls), 1), 4)}
+    print(json.dumps(summary), file=sys.stderr if not args.summary else sys.stdout)
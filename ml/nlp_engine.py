@@ -0,0 +1,35 @@
+# Process-wide spaCy engine for entity extraction
+import os
+from lazy_resource import LazyResource
+
+SPACY_MODEL = os.getenv("SPACY_MODEL", "en_core_web_sm")
+
+# Entity types treated as the key claims of an article
+CLAIM_ENTITY_LABELS = ("ORG", "PERSON", "EVENT")
+
+def load_nlp():
+    """Load the spaCy pipeline with only the NER component enabled"""
+    import spacy
+    nlp = spacy.load(SPACY_MODEL, enable=["ner"])
+    print(f"Loaded spaCy model {SPACY_MODEL} with pipes: {nlp.pipe_names}")
+    return nlp
+
+nlp_resource = LazyResource("spacy", load_nlp)
+
+def get_nlp():
+    nlp = nlp_resource.get()
+    if nlp is None:
+        raise RuntimeError(f"spaCy model {SPACY_MODEL} unavailable: {nlp_resource.error}")
+    return nlp
+
+def _clip(nlp, text):
+    # spaCy refuses texts longer than max_length
+    return text[:nlp.max_length]
+
+def _key_claims(doc):
+    return [ent.text for ent in doc.ents if ent.label_ in CLAIM_ENTITY_LABELS]
+
+def extract_key_claims(text):
+    """Return the ORG/PERSON/EVENT entities in a text, in order of appearance"""
+    nlp = get_nlp()
+    return _key_claims(nlp(_clip(nlp, text)))
@@ -0,0 +1,109 @@
+# Model predictions cached by image content, dropped whenever the model weights change
+import os
+import hashlib
+import threading
+import torch
+from ttl_cache import TTLCache
+
+PREDICTION_CACHE_ENABLED = os.getenv("PREDICTION_CACHE_ENABLED", "1") == "1"
+PREDICTION_CACHE_SIZE = int(os.getenv("PREDICTION_CACHE_SIZE", "4096"))
+# Also match re-encodes whose difference hash is at most PERCEPTUAL_MAX_DISTANCE bits away
+PREDICTION_CACHE_PERCEPTUAL = os.getenv("PREDICTION_CACHE_PERCEPTUAL", "0") == "1"
+PERCEPTUAL_BANDS = 4  # 16-bit bands: hashes within 3 bits always share one band exactly
+PERCEPTUAL_MAX_DISTANCE = PERCEPTUAL_BANDS - 1
+PERCEPTUAL_BUCKET_SIZE = 8
+
+def pixel_key(image):
+    """Hash of the decoded, resized uint8 model input: equal keys mean equal model outputs"""
+    digest = hashlib.blake2b(str(tuple(image.shape)).encode(), digest_size=16)
+    digest.update(image.contiguous().numpy().tobytes())
+    return digest.hexdigest()
+
+def dhash(image):
+    """64-bit difference hash: brightness gradients of a 9x8 grayscale thumbnail"""
+    gray = image.float().mean(dim=0, keepdim=True).unsqueeze(0)
+    thumb = torch.nn.functional.interpolate(gray, size=(8, 9), mode="area")[0, 0]
+    bits = (thumb[:, 1:] > thumb[:, :-1]).flatten().tolist()
+    return sum(1 << i for i, bit in enumerate(bits) if bit)
+
+def hash_bands(value):
+    return [(band, (value >> (16 * band)) & 0xFFFF) for band in range(PERCEPTUAL_BANDS)]
+
+class PredictionCache:
+    """
+    LRU cache of one model's predictions, keyed by pixel_key. Each entry holds
+    the version, label, confidence and (if known) the full class distribution.
+    The whole cache is cleared the first time a different model version is seen.
+    """
+
+    def __init__(self, name, max_entries=PREDICTION_CACHE_SIZE, perceptual=PREDICTION_CACHE_PERCEPTUAL):
+        self.name = name
+        self.perceptual = perceptual
+        self.entries = TTLCache(max_entries)
+        self.perceptual_index = TTLCache(max_entries * PERCEPTUAL_BANDS)  # (band, bits) -> [(dhash, pixel key)]
+        self.version = None
+        self.perceptual_hits = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+
+    def check_version(self, version):
+        if version == self.version:
+            return
+        with self._lock:
+            if version != self.version:
+                if self.version is not None:
+                    print(f"{self.name} model changed, dropping {len(self.entries)} cached predictions")
+                    self.invalidations += 1
+                self.entries.clear()
+                self.perceptual_index.clear()
+                self.version = version
+
+    def get(self, image, version):
+        """Cached entry for a prepared image, or None; version None disables caching"""
+        if not PREDICTION_CACHE_ENABLED or version is None:
+            return None
+        self.check_version(version)
+        entry = self.entries.get(pixel_key(image))
+        if entry is None and self.perceptual:
+            entry = self._get_similar(dhash(image))
+        if entry is None or entry["version"] != version:
+            return None
+        return entry
+
+    def _get_similar(self, value):
+        for band in hash_bands(value):
+            for other, key in self.perceptual_index.get(band, ()):
+                if bin(value ^ other).count("1") <= PERCEPTUAL_MAX_DISTANCE:
+                    entry = self.entries.get(key)
+                    if entry is not None:
+                        self.perceptual_hits += 1
+                        return entry
+        return None
+
+    def set(self, image, version, label, confidence, probabilities=None):
+        if not PREDICTION_CACHE_ENABLED or version is None:
+            return
+        self.check_version(version)
+        key = pixel_key(image)
+        self.entries.set(key, {"version": version, "label": label, "confidence": confidence,
+                              "probabilities": probabilities})
+        if self.perceptual:
+            value = dhash(image)
+            with self._lock:
+                for band in hash_bands(value):
+                    bucket = [(value, key)] + self.perceptual_index.get(band, [])
+                    self.perceptual_index.set(band, bucket[:PERCEPTUAL_BUCKET_SIZE])
+
+    def stats(self):
+        stats = self.entries.stats()
+        stats.update({
+            "enabled": PREDICTION_CACHE_ENABLED,
+            "model_version": self.version,
+            "perceptual": self.perceptual,
+            "perceptual_hits": self.perceptual_hits,
+            "invalidations": self.invalidations,
+        })
+        return stats
+
+skin_prediction_cache = PredictionCache("skin")
+deepfake_prediction_cache = PredictionCache("deepfake")
@@ -0,0 +1,78 @@
+# Production entry point: load the models once in a master process, then fork gunicorn workers that share them
+import os
+import sys
+
+WEB_CONCURRENCY = os.getenv("WEB_CONCURRENCY")
+TORCH_THREADS_PER_WORKER = os.getenv("TORCH_THREADS_PER_WORKER")
+# Models loaded before forking; their weights are shared copy-on-write by every worker
+PRELOAD_MODELS = ("skin_model", "deepfake_model")
+
+def cpu_count():
+    """CPUs this process may run on (respects taskset / container cpusets)"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+def worker_plan(cpus=None, workers=WEB_CONCURRENCY, threads=TORCH_THREADS_PER_WORKER):
+    """
+    (workers, torch threads per worker) so that workers x threads never exceeds
+    the CPU count. By default two inference threads per worker and one worker
+    per pair of CPUs; set either value and the other is derived from it.
+    """
+    cpus = cpus or cpu_count()
+    if workers:
+        workers = max(1, int(workers))
+        threads = max(1, int(threads)) if threads else max(1, cpus // workers)
+    else:
+        threads = max(1, int(threads)) if threads else min(2, cpus)
+        workers = max(1, cpus // threads)
+    return workers, threads
+
+def preload_models():
+    """
+    Called in the master after the app is imported and before any worker is forked.
+    Intra-op threads are held at one while loading so no OpenMP pool exists at
+    fork time. Torch weights move to shared memory; backends that cannot cross
+    a fork (onnxruntime sessions) are dropped and rebuilt lazily by each worker.
+    """
+    import torch
+    from lazy_resource import registry
+    torch.set_num_threads(1)
+    for name in PRELOAD_MODELS:
+        resource = registry.get(name)
+        if resource is None:
+            continue
+        model = resource.get()
+        if model is None:
+            continue
+        if getattr(model, "fork_safe", True) is False:
+            print(f"{name} uses {model.backend}, each worker will load its own copy")
+            resource.reset()
+        elif hasattr(model, "share_memory"):
+            model.share_memory()
+            print(f"Preloaded {name} into shared memory")
+
+def configure_worker(torch_threads):
+    """Called in each worker right after the fork"""
+    import torch
+    torch.set_num_threads(torch_threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass  # already fixed for this process
+    from api import complaint_jobs
+    from disease_info_store import disease_store
+    from lazy_resource import WARMUP_ON_START, warm_up
+    complaint_jobs.start_workers()
+    disease_store.ensure_refresher()
+    if WARMUP_ON_START:
+        warm_up()
+    print(f"Worker {os.getpid()} ready with {torch_threads} torch threads")
+
+if __name__ == "__main__":
+    # Equivalent to: gunicorn -c gunicorn.conf.py api:app
+    from gunicorn.app.wsgiapp import run
+    here = os.path.dirname(os.path.abspath(__file__))
+    sys.argv = ["gunicorn", "-c", os.path.join(here, "gunicorn.conf.py"), "--chdir", here, "api:app"] + sys.argv[1:]
+    run()
@@ -1,10 +1,23 @@
 import requests
 import json
+import os
 import sys
+import time
+import subprocess
 
 # Base URL for the Flask API
 BASE_URL = "http://192.168.77.84:7122"
 
+# Importing api.py must not load models or clients; heavy work happens on first use
+IMPORT_TIME_BUDGET = float(os.getenv("IMPORT_TIME_BUDGET", "5"))
+IMPORT_CHECK = """
+import json, time
+start = time.perf_counter()
+import api
+from lazy_resource import component_status
+print(json.dumps({"seconds": time.perf_counter() - start, "components": component_status()}))
+"""
+
 def test_health_endpoint():
     """Test the health check endpoint"""
     try:
@@ -30,6 +43,78 @@ def test_process_complaint():
         print(f"Error testing process_complaint endpoint: {e}")
     print("-" * 50)
 
+def test_submit_complaint():
+    """Test asynchronous complaint intake and status polling"""
+    payload = {
+        "complaint": "Garbage has not been collected on our street for two weeks and it is attracting stray dogs.",
+        "location": "Sector 14"
+    }
+    
+    try:
+        response = requests.post(f"{BASE_URL}/complaints", json=payload)
+        print("Submit Complaint Response:", response.status_code)
+        print(json.dumps(response.json(), indent=2))
+        if response.status_code == 202:
+            job_id = response.json()["job_id"]
+            for _ in range(60):
+                status = requests.get(f"{BASE_URL}/complaints/{job_id}").json()
+                if status["status"] in ("done", "failed"):
+                    break
+                time.sleep(1)
+            print("Complaint Status:", json.dumps(status, indent=2))
+    except Exception as e:
+        print(f"Error testing complaints endpoint: {e}")
+    print("-" * 50)
+
+def test_predict_diabetes():
+    """Test single-record, batch and CSV diabetes screening"""
+    record = {"Pregnancies": 6, "Glucose": 148, "BloodPressure": 72, "SkinThickness": 35, "Insulin": 0,
+              "BMI": 33.6, "DiabetesPedigreeFunction": 0.627, "Age": 50}
+    csv_body = "Pregnancies,Glucose,BloodPressure,SkinThickness,Insulin,BMI,DiabetesPedigreeFunction,Age\n" \
+               "6,148,72,35,0,33.6,0.627,50\n1,85,66,29,0,26.6,0.351,31\n"
+    
+    try:
+        response = requests.post(f"{BASE_URL}/predict_diabetes", json=record)
+        print("Predict Diabetes Response:", response.status_code)
+        print(json.dumps(response.json(), indent=2))
+        response = requests.post(f"{BASE_URL}/predict_diabetes", json={"records": [record] * 1000})
+        print("Batch of 1000:", response.status_code, {k: v for k, v in response.json().items() if k != "predictions"})
+        response = requests.post(f"{BASE_URL}/predict_diabetes?format=csv", data=csv_body,
+                                 headers={"Content-Type": "text/csv"})
+        print("CSV Response:", response.status_code)
+        print(response.text)
+    except Exception as e:
+        print(f"Error testing predict_diabetes endpoint: {e}")
+    print("-" * 50)
+
+def run_predict_skin_batch(paths):
+    """Test batch skin prediction with image files given on the command line"""
+    if not paths:
+        print("Pass image paths: python test_api.py skin_batch a.jpg b.jpg ...")
+        return
+    try:
+        files = [("images", (os.path.basename(path), open(path, "rb"))) for path in paths]
+        response = requests.post(f"{BASE_URL}/predict_skin_disease_batch", files=files, params={"top_k": 3})
+        print("Predict Skin Batch Response:", response.status_code)
+        print(json.dumps(response.json(), indent=2))
+    except Exception as e:
+        print(f"Error testing predict_skin_disease_batch endpoint: {e}")
+    print("-" * 50)
+
+def test_import_time():
+    """Import api.py in a fresh interpreter and check the time budget and that nothing loaded eagerly"""
+    ml_dir = os.path.dirname(os.path.abspath(__file__))
+    result = subprocess.run([sys.executable, "-c", IMPORT_CHECK], cwd=ml_dir, capture_output=True, text=True)
+    assert result.returncode == 0, f"Importing api.py failed:\n{result.stderr}"
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    loaded = [name for name, status in report["components"].items() if status["state"] != "not_loaded"]
+    print(f"Import time: {report['seconds']:.2f}s (budget {IMPORT_TIME_BUDGET}s)")
+    print(f"Components initialized during import: {loaded or 'none'}")
+    print("-" * 50)
+    assert report["seconds"] <= IMPORT_TIME_BUDGET, \
+        f"Importing api.py took {report['seconds']:.2f}s, over the {IMPORT_TIME_BUDGET}s budget"
+    assert not loaded, f"Components initialized during import: {loaded}"
+
 def test_analyze_post():
     """Test the analyze_post endpoint"""
     payload = {
@@ -53,8 +138,22 @@ if __name__ == "__main__":
             test_health_endpoint()
         elif test_name == "complaint":
             test_process_complaint()
+        elif test_name == "submit":
+            test_submit_complaint()
         elif test_name == "post":
             test_analyze_post()
+        elif test_name == "diabetes":
+            test_predict_diabetes()
+        elif test_name == "skin_batch":
+            run_predict_skin_batch(sys.argv[2:])
+        elif test_name == "import":
+            try:
+                test_import_time()
+            except AssertionError as e:
+                print("Import check: FAILED")
+                print(e)
+                sys.exit(1)
+            print("Import check: PASSED")
         else:
             print(f"Unknown test: {test_name}")
     else:
@@ -62,6 +161,8 @@ if __name__ == "__main__":
         print("Testing Flask API Endpoints...")
         test_health_endpoint()
         test_process_complaint()
+        test_submit_complaint()
         test_analyze_post()
+        test_predict_diabetes()
     
     print("Testing complete!")
\ No newline at end of file
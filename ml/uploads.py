@@ -0,0 +1,25 @@
+# In-memory upload handling: small uploads stay in memory, large ones spool to anonymous temp files
+import os
+import tempfile
+from flask import Request
+
+UPLOAD_SPOOL_MAX_BYTES = int(os.getenv("UPLOAD_SPOOL_MAX_BYTES", str(2 * 1024 * 1024)))
+
+class SpooledUploadRequest(Request):
+    """
+    Request whose file parts are buffered in memory up to UPLOAD_SPOOL_MAX_BYTES.
+    Larger parts roll over to an unnamed temp file, so concurrent uploads with the
+    same filename never collide and nothing is left behind on disk.
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_MAX_BYTES, mode="rb+")
+
+def upload_stream(file_storage):
+    """The upload's buffer rewound to the start, ready for PIL.Image.open"""
+    stream = file_storage.stream
+    stream.seek(0)
+    return stream
+
+def upload_bytes(file_storage):
+    return upload_stream(file_storage).read()